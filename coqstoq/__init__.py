@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Optional, Any
+from typing import Optional, Any, Iterator
 from dataclasses import dataclass
 from pathlib import Path
 from enum import Enum
@@ -28,11 +28,14 @@ def get_theorem(split: Split, idx: int, coqstoq_loc: Path) -> EvalTheorem:
     return eval_thms[thm_ref.thm_idx]
 
 
-def get_theorem_list(split: Split | str, coqstoq_loc: Path) -> list[EvalTheorem]:
+def get_split_val(split: Split | str) -> EvalSplit:
     if isinstance(split, str):
-        split_val = EvalSplit(f"{split}-repos", f"{split}-theorems") 
-    else:
-        split_val = split.value
+        return EvalSplit(f"{split}-repos", f"{split}-theorems")
+    return split.value
+
+
+def get_theorem_list(split: Split | str, coqstoq_loc: Path) -> list[EvalTheorem]:
+    split_val = get_split_val(split)
     eval_thm_dict = get_all_eval_thms(split_val, coqstoq_loc)
     thm_list = load_reference_list(split_val, coqstoq_loc)
     eval_thms: list[EvalTheorem] = []
@@ -40,3 +43,34 @@ def get_theorem_list(split: Split | str, coqstoq_loc: Path) -> list[EvalTheorem]
         eval_thms.append(eval_thm_dict[thm_ref.thm_path][thm_ref.thm_idx])
     return eval_thms
 
+
+def iter_theorems(
+    split: Split | str,
+    start: Optional[int] = None,
+    stop: Optional[int] = None,
+    step: Optional[int] = None,
+    coqstoq_loc: Optional[Path] = None,
+) -> Iterator[EvalTheorem]:
+    """
+    Yields the theorems of `get_theorem_list(split)[start:stop:step]` in order.
+    Each theorem file is loaded when first needed. Only its theorems still to
+    be yielded are kept, and the file is dropped after its last one.
+    """
+    if coqstoq_loc is None:
+        coqstoq_loc = Path.cwd()
+    thm_list = load_reference_list(get_split_val(split), coqstoq_loc)[start:stop:step]
+    needed_idxs: dict[Path, list[int]] = {}
+    for thm_ref in thm_list:
+        needed_idxs.setdefault(thm_ref.thm_path, []).append(thm_ref.thm_idx)
+    pending: dict[Path, dict[int, EvalTheorem]] = {}
+    for thm_ref in thm_list:
+        if thm_ref.thm_path not in pending:
+            file_thms = get_eval_thms(coqstoq_loc / thm_ref.thm_path)
+            pending[thm_ref.thm_path] = {
+                idx: file_thms[idx] for idx in needed_idxs.pop(thm_ref.thm_path)
+            }
+        file_pending = pending[thm_ref.thm_path]
+        thm = file_pending.pop(thm_ref.thm_idx)
+        if len(file_pending) == 0:
+            del pending[thm_ref.thm_path]
+        yield thm
@@ -0,0 +1,221 @@
+"""
+Vectorized analysis of many `EvalResults` files for the same split.
+
+Results are loaded into (n_files, n_theorems) arrays whose columns are
+indexed by the position of the theorem in the split. Requires numpy
+(`poetry install --extras analysis`).
+
+A theorem counts as solved when its result has a proof. These are
+submitted-proof rates unless the file comes with the verdicts of
+`coqstoq/batch_check.py --save_loc`, in which case only proofs that
+checked count.
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+import gc
+import json
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from coqstoq import get_theorem_list
+from coqstoq.eval_thms import EvalTheorem, theorem_id_from_json
+from coqstoq.join import split_index
+from coqstoq.storage import decompress
+
+
+@dataclass
+class ResultsTable:
+    names: list[str]  # One per results file
+    project_names: list[str]
+    project_ids: np.ndarray  # (n_theorems,) index into project_names
+    solved: np.ndarray  # (n_files, n_theorems) bool
+    times: np.ndarray  # (n_files, n_theorems) seconds; nan when unsolved
+    num_unmatched: np.ndarray  # (n_files,) results not in the split
+    checked: np.ndarray  # (n_files,) bool; whether solves were checked
+
+    @property
+    def num_theorems(self) -> int:
+        return self.solved.shape[1]
+
+    @classmethod
+    def load(
+        cls,
+        thms: list[EvalTheorem],
+        results_locs: list[Path],
+        n_workers: int = 8,
+        verdicts_locs: Optional[list[Optional[Path]]] = None,
+    ) -> ResultsTable:
+        """`verdicts_locs` has the verdicts of each results file, if checked."""
+        if verdicts_locs is None:
+            verdicts_locs = [None for _ in results_locs]
+        assert len(verdicts_locs) == len(results_locs)
+        split_idxs = split_index(thms)
+        project_names = sorted({thm.project.dir_name for thm in thms})
+        project_name_ids = {name: i for i, name in enumerate(project_names)}
+        project_ids = np.array(
+            [project_name_ids[thm.project.dir_name] for thm in thms], dtype=np.int32
+        )
+        solved = np.zeros((len(results_locs), len(thms)), dtype=bool)
+        times = np.full((len(results_locs), len(thms)), np.nan)
+        num_unmatched = np.zeros(len(results_locs), dtype=np.int64)
+        # Parsing the json dominates, so files are parsed in parallel.
+        with ProcessPoolExecutor(
+            max_workers=n_workers, initializer=set_split_idxs, initargs=(split_idxs,)
+        ) as executor:
+            columns = executor.map(
+                load_columns, results_locs, verdicts_locs, chunksize=4
+            )
+            for i, (idxs, idx_times, file_unmatched) in enumerate(columns):
+                solved[i, idxs] = True
+                times[i, idxs] = idx_times
+                num_unmatched[i] = file_unmatched
+        return cls(
+            [p.stem for p in results_locs],
+            project_names,
+            project_ids,
+            solved,
+            times,
+            num_unmatched,
+            np.array([loc is not None for loc in verdicts_locs], dtype=bool),
+        )
+
+
+_split_idxs: dict[str, int] = {}
+
+
+def set_split_idxs(split_idxs: dict[str, int]):
+    global _split_idxs
+    _split_idxs = split_idxs
+
+
+def load_columns(
+    results_loc: Path, verdicts_loc: Optional[Path] = None
+) -> tuple[np.ndarray, np.ndarray, int]:
+    """Split indices and times of the solved theorems in `results_loc`."""
+    # The parsed json has no cycles; collecting while parsing only costs time.
+    gc.disable()
+    try:
+        results_data = json.loads(decompress(results_loc.read_bytes()))
+    finally:
+        gc.enable()
+    results = results_data["results"]
+    verdicts: Optional[list[bool]] = None
+    if verdicts_loc is not None:
+        verdicts = json.loads(verdicts_loc.read_bytes())
+        assert len(verdicts) == len(results), f"{verdicts_loc} does not match."
+    idxs: list[int] = []
+    idx_times: list[float] = []
+    num_unmatched = 0
+    for i, r in enumerate(results):
+        split_idx = _split_idxs.get(theorem_id_from_json(r["thm"]))
+        if split_idx is None:
+            num_unmatched += 1
+            continue
+        if r["proof"] is not None and (verdicts is None or verdicts[i]):
+            idxs.append(split_idx)
+            idx_times.append(np.nan if r["time"] is None else r["time"])
+    return np.array(idxs, dtype=np.int64), np.array(idx_times), num_unmatched
+
+
+def solve_rates(table: ResultsTable) -> np.ndarray:
+    """(n_files,) fraction of the split solved."""
+    return table.solved.mean(axis=1)
+
+
+def solve_rates_by_project(table: ResultsTable) -> np.ndarray:
+    """(n_files, n_projects) fraction of each project solved."""
+    one_hot = np.zeros((table.num_theorems, len(table.project_names)))
+    one_hot[np.arange(table.num_theorems), table.project_ids] = 1
+    return (table.solved @ one_hot) / one_hot.sum(axis=0)
+
+
+def time_to_solve_cdf(table: ResultsTable, grid: np.ndarray) -> np.ndarray:
+    """(n_files, len(grid)) fraction of the split solved within each time."""
+    solved_times = np.where(table.solved, table.times, np.inf)
+    solved_times = np.nan_to_num(solved_times, nan=np.inf)
+    solved_times.sort(axis=1)
+    counts = np.stack(
+        [np.searchsorted(row, grid, side="right") for row in solved_times]
+    )
+    return counts / table.num_theorems
+
+
+def pairwise_overlap(table: ResultsTable) -> np.ndarray:
+    """(n_files, n_files) number of theorems solved by both files."""
+    solved = table.solved.astype(np.int32)
+    return solved @ solved.T
+
+
+def unique_solves(table: ResultsTable) -> np.ndarray:
+    """(n_files,) number of theorems solved by no other file."""
+    solved_once = table.solved.sum(axis=0) == 1
+    return (table.solved & solved_once).sum(axis=1)
+
+
+def bootstrap_ci(
+    table: ResultsTable,
+    n_samples: int = 1000,
+    alpha: float = 0.05,
+    seed: Optional[int] = 0,
+    chunk_size: int = 100,
+) -> np.ndarray:
+    """(n_files, 2) bootstrap confidence interval of the solve rate."""
+    rng = np.random.default_rng(seed)
+    n = table.num_theorems
+    solved = table.solved.astype(np.float32)
+    sample_rates: list[np.ndarray] = []
+    for start in range(0, n_samples, chunk_size):
+        num_chunk = min(chunk_size, n_samples - start)
+        idxs = rng.integers(0, n, size=(num_chunk, n))
+        offsets = (np.arange(num_chunk) * n)[:, None]
+        counts = np.bincount((idxs + offsets).ravel(), minlength=num_chunk * n)
+        weights = counts.reshape(num_chunk, n).astype(np.float32)
+        sample_rates.append(solved @ weights.T / n)
+    rates = np.concatenate(sample_rates, axis=1)
+    return np.quantile(rates, [alpha / 2, 1 - alpha / 2], axis=1).T
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the results of tools on a split."
+    )
+    parser.add_argument("split_name", type=str, help="Name of the split (e.g. test).")
+    parser.add_argument("results_locs", nargs="+", help="EvalResults json files.")
+    parser.add_argument(
+        "--verdicts_locs",
+        nargs="+",
+        default=None,
+        help="Verdicts saved by batch_check.py, one per results file.",
+    )
+    parser.add_argument("--n_samples", type=int, default=1000)
+    parser.add_argument("--n_workers", type=int, default=8)
+    args = parser.parse_args()
+    verdicts_locs: Optional[list[Optional[Path]]] = None
+    if args.verdicts_locs is not None:
+        if len(args.verdicts_locs) != len(args.results_locs):
+            parser.error("Pass one verdicts file per results file.")
+        verdicts_locs = [Path(p) for p in args.verdicts_locs]
+
+    thms = get_theorem_list(args.split_name, Path.cwd())
+    table = ResultsTable.load(
+        thms, [Path(p) for p in args.results_locs], args.n_workers, verdicts_locs
+    )
+    rates = solve_rates(table)
+    cis = bootstrap_ci(table, args.n_samples)
+    uniques = unique_solves(table)
+    project_rates = solve_rates_by_project(table)
+    for i, name in enumerate(table.names):
+        kind = "checked" if table.checked[i] else "submitted, not checked"
+        print(
+            f"<<<<< {name}: {100 * rates[i]:.2f}% {kind} "
+            f"(95% CI {100 * cis[i, 0]:.2f}-{100 * cis[i, 1]:.2f}); "
+            f"{uniques[i]} unique; {table.num_unmatched[i]} not in split >>>>>"
+        )
+        for j, project_name in enumerate(table.project_names):
+            print(f"\t{project_name}: {100 * project_rates[i, j]:.2f}%")
@@ -0,0 +1,238 @@
+"""
+Checks many proof attempts from the same source file with a single `coqc` run.
+
+All attempts for a file are spliced into one copy of the file. If the copy
+compiles, every attempt is valid. Otherwise, the failing attempt is located
+from the position of the `coqc` error (or by bisection when the error cannot
+be attributed to an attempt), reverted to its ground-truth proof, and the
+remaining attempts are compiled again.
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+import re
+import json
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+
+from coqstoq.eval_thms import (
+    EvalTheorem,
+    compile_file,
+    compile_scratch_file,
+    CoqComplieError,
+)
+from coqstoq.check import Result, EvalResults
+from coqstoq.prescreen import prescreen, strip_qed, tokenize
+from coqstoq.source_index import SourceFile, load_source
+from coqstoq.tracing import span
+from coqstoq.verdict_cache import VerdictCache
+
+CHECK_FILE_NAME = "coqstoq_check_temp.v"
+# Tokens that may precede the first word of a sentence.
+SENTENCE_LEAD_TOKENS = {"-", "+", "*", "{", "}"}
+BATCH_SAFE_COMMANDS = {"Proof"}
+ERROR_LOC_RE = re.compile(r'File "(?P<file>[^"]*)", line (?P<line>\d+), characters')
+
+
+@dataclass
+class Attempt:
+    result_idx: int
+    thm: EvalTheorem
+    proof: str
+
+
+@dataclass
+class SplicedFile:
+    contents: str
+    attempt_lines: list[tuple[int, int]]  # 1-indexed, inclusive line range
+
+
+def splice_attempts(source: SourceFile, attempts: list[Attempt]) -> SplicedFile:
+    """
+    Replaces the proof of each attempted theorem in the file with its attempt.
+    For a single attempt this gives the same contents as `get_check_contents`.
+    """
+    pieces: list[str] = []
+    attempt_lines: list[tuple[int, int]] = []
+    cur_offset = 0
+    cur_line = 1
+    for a in attempts:
+        prefix_end = source.offset(a.thm.theorem_end_pos)
+        assert cur_offset <= prefix_end, "Overlapping theorems in one batch."
+        prefix = source.contents[cur_offset:prefix_end]
+        cur_line += prefix.count("\n")
+        attempt_start = cur_line + 1
+        attempt_end = attempt_start + a.proof.count("\n") + 1  # Includes "Qed."
+        attempt_lines.append((attempt_start, attempt_end))
+        pieces.extend([prefix, "\n", a.proof, "\n", "Qed.", "\n"])
+        cur_line = attempt_end + 1
+        cur_offset = source.offset(a.thm.proof_end_pos)
+    pieces.append(source.contents[cur_offset:])
+    return SplicedFile("".join(pieces), attempt_lines)
+
+
+def locate_failure(error: CoqComplieError, spliced: SplicedFile) -> Optional[int]:
+    """Index of the attempt containing the first error reported by `coqc`."""
+    err_msg = error.args[0]
+    if isinstance(err_msg, bytes):
+        err_msg = err_msg.decode(errors="replace")
+    for match in ERROR_LOC_RE.finditer(err_msg):
+        if Path(match.group("file")).name != CHECK_FILE_NAME:
+            continue
+        err_line = int(match.group("line"))
+        for i, (start, end) in enumerate(spliced.attempt_lines):
+            if start <= err_line <= end:
+                return i
+        return None
+    return None
+
+
+def check_attempts(source: SourceFile, attempts: list[Attempt]) -> dict[int, bool]:
+    if len(attempts) == 0:
+        return {}
+    project = attempts[0].thm.project
+    spliced = splice_attempts(source, attempts)
+    with span(
+        "check_attempts",
+        "check",
+        project=project.dir_name,
+        path=str(attempts[0].thm.path),
+        num_attempts=len(attempts),
+    ) as check_span:
+        try:
+            compile_scratch_file(project, CHECK_FILE_NAME, spliced.contents, None)
+            check_span.set(valid=True)
+            return {a.result_idx: True for a in attempts}
+        except CoqComplieError as e:
+            failed_idx = locate_failure(e, spliced)
+            check_span.set(valid=False, failed_idx=failed_idx)
+
+    if failed_idx is not None:
+        failed = attempts[failed_idx]
+        remaining = attempts[:failed_idx] + attempts[failed_idx + 1 :]
+        return {failed.result_idx: False} | check_attempts(source, remaining)
+
+    if len(attempts) == 1:
+        return {attempts[0].result_idx: False}
+    mid = len(attempts) // 2
+    return check_attempts(source, attempts[:mid]) | check_attempts(
+        source, attempts[mid:]
+    )
+
+
+def batch_safe(proof: str) -> bool:
+    """
+    Whether an attempt can share a file with other attempts. Sentences
+    starting with a command (e.g. `Qed. Ltac t := ...`) can end the proof and
+    change what the attempts after it see, so an attempt containing one is
+    checked on its own. Tactics start with a lowercase word.
+    """
+    lead = False
+    for t in tokenize(proof):
+        starts = t.sentence_start or lead
+        lead = starts and t.text in SENTENCE_LEAD_TOKENS
+        if starts and t.text[:1].isupper() and t.text not in BATCH_SAFE_COMMANDS:
+            return False
+    return True
+
+
+def group_attempts(results: list[Result]) -> list[list[Attempt]]:
+    """
+    Groups attempts by source file. A theorem appears at most once per group,
+    so repeated attempts at the same theorem land in separate groups.
+    Attempts that are not `batch_safe` get a group of their own.
+    """
+    file_rounds: dict[tuple[Path, Path], list[list[Attempt]]] = {}
+    solo_groups: list[list[Attempt]] = []
+    for i, r in enumerate(results):
+        if prescreen(r.proof) is not None:
+            continue
+        assert r.proof is not None
+        attempt = Attempt(i, r.thm, strip_qed(r.proof))
+        if not batch_safe(attempt.proof):
+            solo_groups.append([attempt])
+            continue
+        rounds = file_rounds.setdefault((r.thm.project.workspace, r.thm.path), [])
+        for thm_round in rounds:
+            if all(a.thm != r.thm for a in thm_round):
+                thm_round.append(attempt)
+                break
+        else:
+            rounds.append([attempt])
+
+    groups: list[list[Attempt]] = []
+    for rounds in file_rounds.values():
+        for thm_round in rounds:
+            thm_round.sort(
+                key=lambda a: (
+                    a.thm.theorem_start_pos.line,
+                    a.thm.theorem_start_pos.column,
+                )
+            )
+            groups.append(thm_round)
+    return groups + solo_groups
+
+
+def check_results_batched(
+    results: list[Result], coqstoq_loc: Path, cache: Optional[VerdictCache] = None
+) -> list[bool]:
+    """Batched equivalent of calling `check_result` on every result."""
+    verdicts = [False for _ in results]
+    uncached_idxs: list[int] = []
+    for i, r in enumerate(results):
+        cached_verdict = None
+        if prescreen(r.proof) is not None:
+            continue
+        if cache is not None and r.proof is not None:
+            cached_verdict = cache.get(r.thm, r.proof)
+        if cached_verdict is None:
+            uncached_idxs.append(i)
+        else:
+            verdicts[i] = cached_verdict
+
+    checked_files: set[Path] = set()
+    groups = group_attempts([results[i] for i in uncached_idxs])
+    for group in groups:
+        for a in group:
+            a.result_idx = uncached_idxs[a.result_idx]
+        thm = group[0].thm
+        orig_file_loc = thm.project.workspace / thm.path
+        assert orig_file_loc.exists()
+        source = load_source(coqstoq_loc / orig_file_loc)
+        assert source.hash == thm.hash, f"Hash mismatch for file {orig_file_loc}"
+        if orig_file_loc not in checked_files:
+            compile_file(thm.project, orig_file_loc, None)  # Should compile
+            checked_files.add(orig_file_loc)
+        for result_idx, verdict in check_attempts(source, group).items():
+            verdicts[result_idx] = verdict
+            proof = results[result_idx].proof
+            if cache is not None and proof is not None:
+                cache.put(results[result_idx].thm, proof, verdict)
+    return verdicts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the proofs in an EvalResults file, one coqc run per source file."
+    )
+    parser.add_argument("results_loc", type=str, help="Path to an EvalResults json file.")
+    parser.add_argument(
+        "--save_loc", type=str, default=None, help="Where to save the list of verdicts."
+    )
+    parser.add_argument(
+        "--cache_loc", type=str, default=None, help="Path to a verdict cache."
+    )
+    args = parser.parse_args()
+
+    with open(args.results_loc) as fin:
+        eval_results = EvalResults.from_json(json.load(fin))
+    cache = VerdictCache(Path(args.cache_loc)) if args.cache_loc else None
+    verdicts = check_results_batched(eval_results.results, Path.cwd(), cache)
+    if cache is not None:
+        print(f"Verdict cache: {cache.stats()}")
+    print(f"Valid proofs: {sum(verdicts)} / {len(verdicts)}")
+    if args.save_loc is not None:
+        with open(args.save_loc, "w") as fout:
+            json.dump(verdicts, fout, indent=2)
@@ -1,8 +1,14 @@
 import argparse
 import subprocess
+from typing import Optional
 from pathlib import Path
 from dataclasses import dataclass
-from coqstoq.eval_thms import Project
+from concurrent.futures import ThreadPoolExecutor
+from coqstoq import get_theorem_list
+from coqstoq.eval_thms import EvalTheorem, Project, run_coqc, CoqComplieError
+from coqstoq.deps import DepGraph, CoqDepError
+from coqstoq.preflight import check_vo, group_by_project
+from coqstoq.tracing import span
 from coqstoq.predefined_projects import (
     BB5,
     COMPCERT,
@@ -15,13 +21,25 @@ import logging
 @dataclass
 class BuildInstructions:
     project: Project
-    instrs: list[list[str]]
+    instrs: list[list[str]]  # The last one builds the whole project
+    # Builds the `.vo` files appended to it. None if the project's make has
+    # no rule for individual `.vo` files.
+    target_instr: Optional[list[str]] = None
+
+    @property
+    def setup_instrs(self) -> list[list[str]]:
+        return self.instrs[:-1]
 
 
 def routine_build(project: Project, n_jobs: int) -> BuildInstructions:
+    # Only a makefile generated by coq_makefile is known to have `.vo` rules.
+    target_instr = None
+    if (project.workspace / "Makefile.coq").exists():
+        target_instr = ["make", "-f", "Makefile.coq", "-j", str(n_jobs)]
     return BuildInstructions(
         project,
         [["make", "-j", str(n_jobs)]],
+        target_instr,
     )
 
 
@@ -32,6 +50,7 @@ def compcert_build(n_jobs: int) -> BuildInstructions:
     return BuildInstructions(
         COMPCERT,
         instrs=[configure, make_depend, make_proof],
+        target_instr=["make", "-j", str(n_jobs)],  # Has a `%.vo: %.v` rule
     )
 
 
@@ -41,6 +60,7 @@ def pnv_build(n_jobs: int) -> BuildInstructions:
     return BuildInstructions(
         PNVROCQLIB,
         instrs=[coq_makefile, make],
+        target_instr=make,
     )
 
 
@@ -80,28 +100,135 @@ TM.v
 def bb5_build(n_jobs: int) -> BuildInstructions:
     with open(BB5.workspace / "_Custom_CoqProject", "w") as fout:
         fout.write(MODIFIED_BB5_CP)
+    make = ["make", "-f", "CustomMakefile.coq", "-j", str(n_jobs)]
     instrs = [
         ["coq_makefile", "-f", "_Custom_CoqProject", "-o", "CustomMakefile.coq"],
-        ["make", "-f", "CustomMakefile.coq", "-j", str(n_jobs)],
+        make,
     ]
-    return BuildInstructions(BB5, instrs)
+    return BuildInstructions(BB5, instrs, make)
 
 
-def run_build(instructions: BuildInstructions):
-    print(f"Building {instructions.project.dir_name}...")
-    if instructions.project.dir_name == "bb5":
-        logging.warning(f"BB5 may take up to an hour to build.")
-    for instr in instructions.instrs:
-        result = subprocess.run(
-            instr, cwd=instructions.project.workspace.resolve(), capture_output=True
-        )
+def run_instrs(project: Project, instrs: list[list[str]]) -> bool:
+    for instr in instrs:
+        with span(instr[0], "build", command=" ".join(instr)) as instr_span:
+            result = subprocess.run(
+                instr, cwd=project.workspace.resolve(), capture_output=True
+            )
+            instr_span.set(returncode=result.returncode)
         if result.returncode != 0:
-            build_instrs: str = "\n".join(" ".join(i) for i in instructions.instrs)
+            build_instrs: str = "\n".join(" ".join(i) for i in instrs)
             print(
-                f"Failed to build {instructions.project.dir_name}. To debug, run: {build_instrs}."
+                f"Failed to build {project.dir_name}. To debug, run: {build_instrs}."
             )
-            return
+            return False
+    return True
+
+
+def run_build(instructions: BuildInstructions) -> bool:
+    print(f"Building {instructions.project.dir_name}...")
+    if instructions.project.dir_name == "bb5":
+        logging.warning(f"BB5 may take up to an hour to build.")
+    with span("build", "build", project=instructions.project.dir_name) as build_span:
+        if not run_instrs(instructions.project, instructions.instrs):
+            build_span.set(outcome="failed")
+            return False
     print(f"Successfully built {instructions.project.dir_name}.")
+    return True
+
+
+def project_build_instructions(project: Project, n_jobs: int) -> BuildInstructions:
+    if project == COMPCERT:
+        return compcert_build(n_jobs)
+    elif project == PNVROCQLIB:
+        return pnv_build(n_jobs)
+    elif project == BB5:
+        return bb5_build(n_jobs)
+    else:
+        return routine_build(project, n_jobs)
+
+
+def select_theorems(
+    split_name: str,
+    start: Optional[int],
+    stop: Optional[int],
+    ids: Optional[set[str]],
+) -> list[EvalTheorem]:
+    thms = get_theorem_list(split_name, Path.cwd())[start:stop]
+    if ids is None:
+        return thms
+    return [thm for thm in thms if thm.id in ids]
+
+
+def build_wave(graph: DepGraph, wave: list[Path], n_jobs: int) -> bool:
+    """
+    Compiles the files of `wave` in place. Files whose `.vo` is newer than
+    their source and dependencies (see preflight.py) are skipped.
+    """
+    project = graph.project
+    workspace = project.workspace.resolve()
+
+    def build_file(path: Path) -> bool:
+        if check_vo(graph, path) is None:
+            return True
+        out_dir = (workspace / path).parent
+        try:
+            run_coqc(project.compile_args, path, workspace, out_dir, None)
+        except CoqComplieError as e:
+            print(f"Could not compile {project.workspace / path}; Error: {e}")
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        return all(list(executor.map(build_file, wave)))
+
+
+def make_targets_instr(
+    instructions: BuildInstructions, required: set[Path]
+) -> Optional[list[str]]:
+    if instructions.target_instr is None:
+        return None
+    targets = [str(p.with_suffix(".vo")) for p in sorted(required)]
+    return instructions.target_instr + targets
+
+
+def run_targeted_build(
+    instructions: BuildInstructions, paths: list[Path], method: str, n_jobs: int
+) -> bool:
+    """
+    Builds only the files transitively required by `paths`, either by
+    passing them as targets to the project's make or with parallel waves of
+    coqc. Projects whose make cannot build individual files use coqc. Setup
+    steps (e.g. configure) run first since they may generate sources.
+    """
+    project = instructions.project
+    print(f"Building what {len(paths)} files of {project.dir_name} require...")
+    if not run_instrs(project, instructions.setup_instrs):
+        return False
+    graph = DepGraph(project)
+    try:
+        required = graph.closure(paths, n_jobs)
+        waves = graph.order(required)
+    except CoqDepError as e:
+        print(f"coqdep failed for {project.dir_name}: {e}")
+        return False
+    print(f"{len(required)} files required in {len(waves)} waves.")
+    if 0 == len(required):
+        return True
+    targets_instr = make_targets_instr(instructions, required)
+    if method == "make" and targets_instr is None:
+        print(f"{project.dir_name} has no make rule for .vo files; using coqc.")
+        method = "coqc"
+    match method:
+        case "make":
+            assert targets_instr is not None
+            if not run_instrs(project, [targets_instr]):
+                return False
+        case "coqc":
+            for wave in waves:
+                if not build_wave(graph, wave, n_jobs):
+                    return False
+    print(f"Successfully built what {project.dir_name} requires.")
+    return True
 
 
 def check_env() -> bool:
@@ -119,18 +246,44 @@ def check_env() -> bool:
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("Build CoqStoq projects on your machine.")
     parser.add_argument("--n_jobs", type=int, default=4)
+    parser.add_argument(
+        "--split",
+        type=str,
+        default=None,
+        help="Only build what the theorems of this split (e.g. test) need.",
+    )
+    parser.add_argument("--start", type=int, default=None)
+    parser.add_argument("--stop", type=int, default=None)
+    parser.add_argument(
+        "--ids", nargs="+", default=None, help="Only build what these theorems need."
+    )
+    parser.add_argument(
+        "--ids_loc", type=str, default=None, help="File with one theorem id per line."
+    )
+    parser.add_argument(
+        "--method",
+        choices=["make", "coqc"],
+        default="make",
+        help="Build targeted files with the project's make or with coqc directly.",
+    )
     args = parser.parse_args()
 
-    all_build_instrs: list[BuildInstructions] = []
-    for p in PREDEFINED_PROJECTS:
-        if p == COMPCERT:
-            all_build_instrs.append(compcert_build(args.n_jobs))
-        elif p == PNVROCQLIB:
-            all_build_instrs.append(pnv_build(args.n_jobs))
-        elif p == BB5:
-            all_build_instrs.append(bb5_build(args.n_jobs))
-        else:
-            all_build_instrs.append(routine_build(p, args.n_jobs))
-
-    for instr in all_build_instrs:
-        run_build(instr)
+    if args.split is None:
+        assert args.ids is None and args.ids_loc is None, "--ids requires --split"
+        for p in PREDEFINED_PROJECTS:
+            run_build(project_build_instructions(p, args.n_jobs))
+    else:
+        ids: Optional[set[str]] = None
+        if args.ids is not None or args.ids_loc is not None:
+            ids = set(args.ids or [])
+            if args.ids_loc is not None:
+                ids.update(Path(args.ids_loc).read_text().split())
+        thms = select_theorems(args.split, args.start, args.stop, ids)
+        print(f"Building what {len(thms)} theorems need.")
+        for project, paths in group_by_project(thms).values():
+            run_targeted_build(
+                project_build_instructions(project, args.n_jobs),
+                paths,
+                args.method,
+                args.n_jobs,
+            )
@@ -1,13 +1,23 @@
 from __future__ import annotations
-from typing import Optional, Any
+from typing import Optional, Any, TYPE_CHECKING
 from pathlib import Path
 
-import os
 import logging
 from enum import Enum
 from dataclasses import dataclass
 
-from coqstoq.eval_thms import EvalTheorem, get_file_hash, compile_file, CoqComplieError
+from coqstoq.eval_thms import (
+    EvalTheorem,
+    compile_file,
+    compile_scratch_file,
+    CoqComplieError,
+)
+from coqstoq.source_index import load_source
+from coqstoq.prescreen import prescreen, strip_qed
+from coqstoq.tracing import span
+
+if TYPE_CHECKING:
+    from coqstoq.verdict_cache import VerdictCache
 
 
 @dataclass
@@ -36,11 +46,13 @@ class Result:
 class EvalResults:
     hardware: str  # Description of hardware used
     results: list[Result]
+    calibration: Optional[float] = None  # Calibration time (see timing.py)
 
     def to_json(self) -> Any:
         return {
             "hardware": self.hardware,
             "results": [r.to_json() for r in self.results],
+            "calibration": self.calibration,
         }
 
     @classmethod
@@ -48,66 +60,72 @@ class EvalResults:
         return cls(
             json_data["hardware"],
             [Result.from_json(r) for r in json_data["results"]],
+            json_data.get("calibration"),
         )
 
 
 def get_check_contents(thm: EvalTheorem, proof_attempt: str, coqstoq_loc: Path) -> str:
     orig_file_loc = coqstoq_loc / thm.project.workspace / thm.path
     assert orig_file_loc.exists()
-    assert (
-        get_file_hash(orig_file_loc) == thm.hash
-    ), f"Hash mismatch for file {orig_file_loc}"
-    orig_contents = orig_file_loc.read_text()
-    orig_lines = orig_contents.split("\n")
-    prefix_lines = orig_lines[: (thm.theorem_end_pos.line + 1)].copy()
-    prefix_lines[-1] = prefix_lines[-1][: thm.theorem_end_pos.column]
-    suffix_lines = orig_lines[thm.proof_end_pos.line :]
-    suffix_lines[0] = suffix_lines[0][thm.proof_end_pos.column :]
-    return "\n".join(prefix_lines + [proof_attempt, "Qed."] + suffix_lines)
+    source = load_source(orig_file_loc)
+    assert source.hash == thm.hash, f"Hash mismatch for file {orig_file_loc}"
+    prefix = source.before(thm.theorem_end_pos)
+    suffix = source.after(thm.proof_end_pos)
+    return "\n".join([prefix, proof_attempt, "Qed.", suffix])
 
 
 def get_ground_truth(thm: EvalTheorem, coqstoq_loc: Path) -> str:
     orig_file_loc = coqstoq_loc / thm.project.workspace / thm.path
     assert orig_file_loc.exists()
-    assert (
-        get_file_hash(orig_file_loc) == thm.hash
-    ), f"Hash mismatch for file {orig_file_loc}"
-    orig_contents = orig_file_loc.read_text()
-    orig_lines = orig_contents.split("\n")
-    proof_lines = orig_lines[
-        thm.proof_start_pos.line : thm.proof_end_pos.line + 1
-    ].copy()
-    proof_lines[-1] = proof_lines[-1][: thm.proof_end_pos.column]
-    proof_lines[0] = proof_lines[0][thm.proof_start_pos.column :]
-    return "\n".join(proof_lines)
-
-
-def check_result(r: Result, coqstoq_loc: Path) -> bool:
-    attempted_proof = r.proof
-    if attempted_proof is None:
-        return False
+    source = load_source(orig_file_loc)
+    assert source.hash == thm.hash, f"Hash mismatch for file {orig_file_loc}"
+    return source.span(thm.proof_start_pos, thm.proof_end_pos)
 
-    stripped_proof = attempted_proof.strip()
-    if stripped_proof.endswith("Qed."):
-        use_proof = stripped_proof[: -len("Qed.")]
-    else:
-        use_proof = stripped_proof
 
-    orig_file_loc = r.thm.project.workspace / r.thm.path
+def _check_proof(thm: EvalTheorem, proof: str, coqstoq_loc: Path) -> bool:
+    """Compiles the file with `proof` in place of the original proof."""
+    use_proof = strip_qed(proof)
+    orig_file_loc = thm.project.workspace / thm.path
     assert orig_file_loc.exists()
     assert (
-        get_file_hash(orig_file_loc) == r.thm.hash
-    ), f"Hash mismatch for file {r.thm.project.workspace / r.thm.path}"
+        load_source(orig_file_loc).hash == thm.hash
+    ), f"Hash mismatch for file {thm.project.workspace / thm.path}"
 
-    temp_loc = r.thm.project.workspace / "coqstoq_check_temp.v"
-    assert not temp_loc.exists()
-    compile_file(r.thm.project, orig_file_loc, None)  # Should compile
+    compile_file(thm.project, orig_file_loc, None)  # Should compile
     try:
-        with temp_loc.open("w") as fout:
-            fout.write(get_check_contents(r.thm, use_proof, coqstoq_loc))
-        compile_file(r.thm.project, temp_loc, None)  # Checking attempt
+        check_contents = get_check_contents(thm, use_proof, coqstoq_loc)
+        compile_scratch_file(
+            thm.project, "coqstoq_check_temp.v", check_contents, None
+        )  # Checking attempt
         return True
     except CoqComplieError:
         return False
-    finally:
-        os.remove(temp_loc)
+
+
+def check_result(
+    r: Result, coqstoq_loc: Path, cache: Optional[VerdictCache] = None
+) -> bool:
+    with span(
+        "check_result",
+        "check",
+        project=r.thm.project.dir_name,
+        path=str(r.thm.path),
+        line=r.thm.theorem_start_pos.line,
+    ) as check_span:
+        attempted_proof = r.proof
+        if prescreen(attempted_proof) is not None:
+            check_span.set(outcome="prescreened", valid=False)
+            return False
+        assert attempted_proof is not None
+
+        if cache is not None:
+            cached_verdict = cache.get(r.thm, attempted_proof)
+            if cached_verdict is not None:
+                check_span.set(outcome="cached", valid=cached_verdict)
+                return cached_verdict
+
+        verdict = _check_proof(r.thm, attempted_proof, coqstoq_loc)
+        if cache is not None:
+            cache.put(r.thm, attempted_proof, verdict)
+        check_span.set(valid=verdict)
+        return verdict
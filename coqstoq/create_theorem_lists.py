@@ -6,13 +6,22 @@ Creates a (shuffled) list of theorems referencing theorems created by
 from __future__ import annotations
 from typing import Any
 
-import json
+import os
 import argparse
 import random
 from pathlib import Path
 
 from dataclasses import dataclass
 from coqstoq.eval_thms import Split, EvalTheorem
+from coqstoq.manifest import write_manifest
+from coqstoq.names import write_name_index
+from coqstoq.storage import (
+    load_json,
+    dump_json,
+    iter_data_files,
+    logical_data_loc,
+    stored_compression,
+)
 
 from coqstoq.predefined_projects import (
     PREDEFINED_PROJECTS,
@@ -31,9 +40,8 @@ class TheoremReference:
         return {"thm_path": str(self.thm_path), "thm_idx": self.thm_idx}
 
     def to_eval_thm(self) -> EvalTheorem:
-        with (Path.cwd() / self.thm_path).open("r") as fin:
-            thms = json.load(fin)
-            return EvalTheorem.from_json(thms[self.thm_idx])
+        thms = load_json(Path.cwd() / self.thm_path)
+        return EvalTheorem.from_json(thms[self.thm_idx])
 
     @classmethod
     def from_json(cls, data: Any) -> TheoremReference:
@@ -42,31 +50,47 @@ class TheoremReference:
 
 def load_reference_list(split: Split, coqstoq_loc: Path) -> list[TheoremReference]:
     theorem_list_loc = coqstoq_loc / split.theorem_list_loc
-    with theorem_list_loc.open("r") as fin:
-        return [TheoremReference.from_json(thm) for thm in json.load(fin)]
+    return [TheoremReference.from_json(thm) for thm in load_json(theorem_list_loc)]
 
 
 def create_split_list(split: Split, seed: int) -> list[TheoremReference]:
     split_theorems_loc = Path.cwd() / split.thm_dir_name
     assert split_theorems_loc.exists()
     theorem_list: list[TheoremReference] = []
-    for thm_file_loc in split_theorems_loc.glob("**/*.json"):
+    for thm_file_loc in iter_data_files(split_theorems_loc):
         assert thm_file_loc.is_relative_to(Path.cwd())
-        rel_thm_file_loc = thm_file_loc.relative_to(Path.cwd())
-        with thm_file_loc.open("r") as fin:
-            thms = json.load(fin)
-            for idx, _ in enumerate(thms):
-                theorem_list.append(TheoremReference(rel_thm_file_loc, idx))
+        rel_thm_file_loc = logical_data_loc(thm_file_loc.relative_to(Path.cwd()))
+        thms = load_json(thm_file_loc)
+        for idx, _ in enumerate(thms):
+            theorem_list.append(TheoremReference(rel_thm_file_loc, idx))
     random.seed(seed)
     random.shuffle(theorem_list)
     return theorem_list
 
 
-def create_theorem_list(seed: int, split_name: str):
+def create_theorem_list(seed: int, split_name: str, build_names: bool = False):
+    """
+    Also builds the name index of the split if `build_names`, which reads the
+    project sources. Otherwise, a previous index no longer matches the list
+    and is removed.
+    """
     split = Split.from_name(split_name)
     thm_list = create_split_list(split, seed)
-    with open(split.theorem_list_loc, "w") as fout:
-        json.dump([thm.to_json() for thm in thm_list], fout, indent=2)
+    thm_list_json = [thm.to_json() for thm in thm_list]
+    dump_json(
+        thm_list_json,
+        split.theorem_list_loc,
+        stored_compression(split.theorem_list_loc),
+    )
+    if build_names:
+        write_name_index(split, Path.cwd())
+    elif split.names_loc.exists():
+        os.remove(split.names_loc)
+        print(
+            f"Removed {split.names_loc}; rebuild it with "
+            f"`python3 coqstoq/names.py build {split_name}`."
+        )
+    write_manifest(split, Path.cwd())
 
 
 if __name__ == "__main__":
@@ -85,6 +109,11 @@ if __name__ == "__main__":
         type=str,
         help="Name of the split to create a theorem list for.",
     )
+    parser.add_argument(
+        "--names",
+        action="store_true",
+        help="Also build the name index of the split from the project sources.",
+    )
         
     args = parser.parse_args()
-    create_theorem_list(SEED, args.split_name)
+    create_theorem_list(SEED, args.split_name, args.names)
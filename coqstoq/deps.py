@@ -0,0 +1,109 @@
+"""
+Dependencies between the files of a project, computed with `coqdep`.
+"""
+
+from __future__ import annotations
+
+import threading
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from coqstoq.eval_thms import Project
+
+
+class CoqDepError(Exception):
+    pass
+
+
+def parse_coqdep(output: str, workspace: Path) -> list[Path]:
+    """
+    Returns the `.v` files of the project that the `.vo` rule in the output
+    of `coqdep` depends on. Files outside the workspace (e.g. installed
+    libraries) are ignored.
+    """
+    abs_workspace = workspace.resolve()
+    deps: list[Path] = []
+    for line in output.splitlines():
+        if ":" not in line:
+            continue
+        targets, sources = line.split(":", 1)
+        if not any(t.endswith(".vo") for t in targets.split()):
+            continue
+        for source in sources.split():
+            if not source.endswith(".vo"):
+                continue
+            source_loc = (abs_workspace / source).resolve()
+            if source_loc.is_relative_to(abs_workspace):
+                deps.append(source_loc.relative_to(abs_workspace).with_suffix(".v"))
+    return deps
+
+
+def coqdep_deps(project: Project, path: Path) -> list[Path]:
+    """Direct dependencies of `path`. Paths are relative to the workspace."""
+    out = subprocess.run(
+        ["coqdep", *project.compile_args, str(path)],
+        cwd=project.workspace,
+        capture_output=True,
+        text=True,
+    )
+    if out.returncode != 0:
+        raise CoqDepError(out.stderr)
+    return parse_coqdep(out.stdout, project.workspace)
+
+
+class DepGraph:
+    """Caches the direct dependencies of the files of a project."""
+
+    def __init__(self, project: Project):
+        self.project = project
+        self.deps: dict[Path, list[Path]] = {}
+        self.lock = threading.Lock()
+
+    def get_deps(self, path: Path) -> list[Path]:
+        with self.lock:
+            if path in self.deps:
+                return self.deps[path]
+        path_deps = coqdep_deps(self.project, path)
+        with self.lock:
+            self.deps[path] = path_deps
+        return path_deps
+
+    def closure(self, paths: list[Path], n_workers: int) -> set[Path]:
+        """All files transitively required by `paths`, not including `paths`."""
+        required: set[Path] = set()
+        visited: set[Path] = set(paths)
+        frontier = list(paths)
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            while 0 < len(frontier):
+                next_frontier: list[Path] = []
+                for path_deps in executor.map(self.get_deps, frontier):
+                    for dep in path_deps:
+                        required.add(dep)
+                        if dep not in visited:
+                            visited.add(dep)
+                            next_frontier.append(dep)
+                frontier = next_frontier
+        return required
+
+    def order(self, paths: set[Path]) -> list[list[Path]]:
+        """
+        Splits `paths` into waves that can each be compiled in parallel: the
+        files of a wave only depend on files of earlier waves or outside
+        `paths`.
+        """
+        remaining = set(paths)
+        done: set[Path] = set()
+        waves: list[list[Path]] = []
+        while 0 < len(remaining):
+            wave = sorted(
+                p
+                for p in remaining
+                if all(d in done or d not in paths for d in self.get_deps(p))
+            )
+            if 0 == len(wave):
+                raise CoqDepError(f"Dependency cycle among {sorted(remaining)}")
+            waves.append(wave)
+            done.update(wave)
+            remaining.difference_update(wave)
+        return waves
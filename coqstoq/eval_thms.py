@@ -1,16 +1,26 @@
 from __future__ import annotations
-import os
-import shutil
 import argparse
 import hashlib
-from typing import Optional, Any
+import json
+import os
+import time
+import types
+import functools
+import contextlib
+from typing import Optional, Any, Iterator, TYPE_CHECKING
 from pathlib import Path
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import subprocess
 
-from coqpyt.coq.structs import TermType, Step, Position as LspPos
-from coqpyt.coq.base_file import CoqFile
+# coqpyt is only needed to discover theorems; it is imported lazily
+# so that loading theorems and results does not pay for it.
+if TYPE_CHECKING:
+    from coqpyt.coq.structs import TermType, Step, Position as LspPos
+    from coqpyt.coq.base_file import CoqFile
+
+from coqstoq.scratch import scratch_dir, absolute_compile_args
+from coqstoq.tracing import span
 
 
 @dataclass
@@ -22,6 +32,18 @@ class Split:
     def theorem_list_loc(self) -> Path:
         return Path(f"{self.thm_dir_name}.json")
 
+    @property
+    def manifest_loc(self) -> Path:
+        return Path(f"{self.thm_dir_name}-manifest.json")
+
+    @property
+    def names_loc(self) -> Path:
+        return Path(f"{self.thm_dir_name}-names.json")
+
+    @property
+    def table_loc(self) -> Path:
+        return Path(f"{self.thm_dir_name}-table.bin")
+
     def to_json(self) -> Any:
         return {"dir_name": self.dir_name, "thm_dir_name": self.thm_dir_name}
 
@@ -84,6 +106,34 @@ class Position:
         return cls(data["line"], data["column"])
 
 
+THEOREM_ID_LEN = 16  # Hex digits of the sha256 digest kept in theorem ids
+
+
+def theorem_id_from_json(data: Any) -> str:
+    """
+    Id of the theorem saved as `data`, without building the EvalTheorem.
+    Digest of the split, project, path, positions and file hash, so it is
+    stable across runs and machines.
+    """
+    id_data = [
+        data["project"]["split"]["dir_name"],
+        data["project"]["dir_name"],
+        data["path"],
+        [
+            [data[pos]["line"], data[pos]["column"]]
+            for pos in (
+                "theorem_start_pos",
+                "theorem_end_pos",
+                "proof_start_pos",
+                "proof_end_pos",
+            )
+        ],
+        data["hash"],
+    ]
+    digest = hashlib.sha256(json.dumps(id_data).encode()).hexdigest()
+    return digest[:THEOREM_ID_LEN]
+
+
 @dataclass
 class EvalTheorem:
     project: Project
@@ -94,6 +144,11 @@ class EvalTheorem:
     proof_end_pos: Position  # inclusive line, exclusive column
     hash: str  # Hash of file when theorem was collected
 
+    @property
+    def id(self) -> str:
+        """Compact key for joins; see `theorem_id_from_json`."""
+        return theorem_id_from_json(self.to_json())
+
     def to_json(self) -> Any:
         return {
             "project": self.project.to_json(),
@@ -119,6 +174,8 @@ class EvalTheorem:
 
 
 def is_eval_theorem(termtype: TermType) -> bool:
+    from coqpyt.coq.structs import TermType
+
     match termtype:
         case (
             TermType.THEOREM
@@ -183,6 +240,47 @@ def get_test_thm(
     )
 
 
+PHASES = ["compile", "open", "exec", "hash"]
+
+
+@dataclass
+class FileProfile:
+    """Time spent in each phase of discovering the theorems of a file."""
+
+    path: Path
+    phases: dict[str, float] = field(default_factory=dict)  # Seconds
+    num_steps: int = 0
+
+    @property
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            with span(name, "discovery", path=str(self.path)):
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0) + elapsed
+
+    def to_json(self) -> Any:
+        return {
+            "path": str(self.path),
+            "phases": self.phases,
+            "num_steps": self.num_steps,
+        }
+
+    @classmethod
+    def from_json(cls, json_data: Any) -> FileProfile:
+        return cls(
+            Path(json_data["path"]),
+            json_data["phases"],
+            json_data["num_steps"],
+        )
+
+
 class CoqComplieError(Exception):
     pass
 
@@ -191,60 +289,250 @@ class CoqCompileTimeoutError(Exception):
     pass
 
 
+def run_coqc(
+    compile_args: list[str],
+    path: Path,
+    cwd: Path,
+    out_dir: Path,
+    timeout: Optional[int],
+):
+    tmp_out_loc = out_dir / path.with_suffix(".vo").name
+    with span("coqc", "coqc", path=str(path)):
+        try:
+            out = subprocess.run(
+                ["coqc", "-o", tmp_out_loc, *compile_args, path],
+                cwd=cwd,
+                capture_output=True,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            raise CoqCompileTimeoutError(f"Compilation timed out for {path}.")
+        if out.returncode != 0:
+            raise CoqComplieError(out.stderr)
+
+
 def compile_file(project: Project, path: Path, timeout: Optional[int]):
     project_loc = project.workspace
     assert project_loc.exists()
-    cur_dir = Path.cwd().resolve()
-    full_path = path.resolve()
-    os.chdir(project_loc)
-    tmp_dir = Path("tmp-coqstoq-out")
-    assert not tmp_dir.exists()
-    os.mkdir(tmp_dir)
-    tmp_out_loc = tmp_dir / path.with_suffix(".vo").name
-    try:
-        # print(["coqc", "-o", tmp_out_loc, *project.compile_args, full_path])
-        out = subprocess.run(
-            ["coqc", "-o", tmp_out_loc, *project.compile_args, full_path],
-            capture_output=True,
-            timeout=timeout,
+    with scratch_dir(project.dir_name) as tmp_dir:
+        run_coqc(
+            project.compile_args, path.resolve(), project_loc.resolve(), tmp_dir, timeout
         )
-        if out.returncode == 0:
-            return None
-        else:
-            raise CoqComplieError(out.stderr)
-    except subprocess.TimeoutExpired:
-        raise CoqCompileTimeoutError(f"Compilation timed out for {path}.")
-    finally:
-        if tmp_out_loc.exists():
-            os.remove(tmp_out_loc)
-        if tmp_dir.exists():
-            shutil.rmtree(tmp_dir)
-        os.chdir(cur_dir)
+
+
+def compile_scratch_file(
+    project: Project, name: str, contents: str, timeout: Optional[int]
+):
+    """
+    Compiles `contents` as `name` from an isolated scratch directory so that
+    nothing is written into the project workspace.
+    """
+    project_loc = project.workspace
+    assert project_loc.exists()
+    compile_args = absolute_compile_args(project.compile_args, project_loc)
+    with scratch_dir(project.dir_name) as tmp_dir:
+        tmp_file_loc = tmp_dir / name
+        tmp_file_loc.write_text(contents)
+        run_coqc(compile_args, tmp_file_loc, tmp_dir, tmp_dir, timeout)
+
+
+DEFAULT_MEMORY_LIMIT = 20 * (2**20)  # KiB; passed to coqpyt as is
+DEFAULT_MAX_FILES_PER_SERVER = 100
+# A shared server is restarted before its memory limit kills it.
+DEFAULT_MAX_RSS_FRACTION = 0.75
+
+@functools.cache
+def shared_client_file_class() -> Any:
+    import coqpyt.coq.base_file as base_file
+    from coqpyt.lsp.structs import TextDocumentIdentifier
+
+    file_init = base_file.CoqFile.__init__
+
+    class SharedClientCoqFile(base_file.CoqFile):
+        """
+        A `CoqFile` whose document is opened on an existing coq-lsp client.
+        `CoqFile.__init__` creates its client through the module's
+        `CoqLspClient`, so it is run with its own globals in which that name
+        returns the shared client. Nothing outside this file is changed.
+        """
+
+        def __init__(self, file_path: str, client: Any, **file_args: Any):
+            init_globals = {
+                **file_init.__globals__,
+                "CoqLspClient": lambda *_, **__: client,
+            }
+            shared_init = types.FunctionType(
+                file_init.__code__,
+                init_globals,
+                file_init.__name__,
+                file_init.__defaults__,
+                file_init.__closure__,
+            )
+            shared_init.__kwdefaults__ = file_init.__kwdefaults__
+            shared_init(self, file_path, **file_args)
+
+        def close(self):
+            """Closes the document. The session owns the client."""
+            self.coq_lsp_client.didClose(TextDocumentIdentifier(f"file://{self.path}"))
+
+    return SharedClientCoqFile
+
+
+def coq_lsp_rss(root: Optional[int] = None, proc_loc: Path = Path("/proc")) -> int:
+    """
+    Resident memory in bytes of the coq-lsp servers below `root` (by default,
+    this process) in the process tree. coqpyt starts the server through a
+    shell, so it is a grandchild rather than a child.
+    """
+    if root is None:
+        root = os.getpid()
+    comms: dict[int, str] = {}
+    children: dict[int, list[int]] = {}
+    for stat_loc in proc_loc.glob("[0-9]*/stat"):
+        try:
+            stat = stat_loc.read_text()
+        except OSError:
+            continue
+        pid = int(stat_loc.parent.name)
+        comms[pid] = stat[stat.find("(") + 1 : stat.rfind(")")]
+        ppid = int(stat[stat.rfind(")") + 2 :].split()[1])
+        children.setdefault(ppid, []).append(pid)
+
+    rss = 0
+    stack = list(children.get(root, []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        if comms[pid] != "coq-lsp":
+            continue
+        try:
+            status = (proc_loc / str(pid) / "status").read_text()
+        except OSError:
+            continue  # The process has exited
+        for line in status.splitlines():
+            if line.startswith("VmRSS:"):
+                rss += int(line.split()[1]) * 1024
+    return rss
+
+
+class LspSession:
+    """
+    Opens the files of a project for discovery on one coq-lsp client, which
+    is restarted after an error, after `max_files` files, or once the server
+    uses more than `max_rss` bytes (by default, 3/4 of `memory_limit`).
+    """
+
+    def __init__(
+        self,
+        project: Project,
+        timeout: Optional[int],
+        memory_limit: int = DEFAULT_MEMORY_LIMIT,
+        max_files: int = DEFAULT_MAX_FILES_PER_SERVER,
+        max_rss: Optional[int] = None,
+    ):
+        self.project = project
+        self.timeout = timeout if timeout is not None else 60
+        self.memory_limit = memory_limit
+        self.max_files = max_files
+        if max_rss is None:
+            max_rss = int(DEFAULT_MAX_RSS_FRACTION * memory_limit * 1024)
+        self.max_rss = max_rss
+        self.client: Any = None
+        self.num_files = 0
+        self.num_restarts = 0
+
+    def healthy(self) -> bool:
+        if self.client is None:
+            return True
+        if self.max_files <= self.num_files:
+            return False
+        return coq_lsp_rss() < self.max_rss
+
+    def start_client(self):
+        from coqpyt.coq.lsp.client import CoqLspClient
+
+        workspace_uri = f"file://{self.project.workspace.resolve()}"
+        self.client = CoqLspClient(
+            workspace_uri, timeout=self.timeout, memory_limit=self.memory_limit
+        )
+        self.num_files = 0
+
+    def stop_client(self):
+        if self.client is None:
+            return
+        try:
+            self.client.shutdown()
+            self.client.exit()
+        except Exception:
+            pass  # The server is already gone
+        self.client = None
+        self.num_files = 0
+
+    def restart(self):
+        self.stop_client()
+        self.num_restarts += 1
+
+    @contextlib.contextmanager
+    def open(self, path: Path) -> Iterator[CoqFile]:
+        if not self.healthy():
+            self.restart()
+        if self.client is None:
+            self.start_client()
+        self.num_files += 1
+        try:
+            coq_file = shared_client_file_class()(
+                str(path.resolve()),
+                self.client,
+                workspace=str(self.project.workspace.resolve()),
+                timeout=self.timeout,
+                memory_limit=self.memory_limit,
+            )
+            yield coq_file
+            coq_file.close()
+        except Exception:
+            # The server may be left in a bad state. Its documents go with it,
+            # so the document is not closed first.
+            self.restart()
+            raise
+
+    def close(self):
+        self.stop_client()
 
 
 def find_eval_theorems(
-    project: Project, path: Path, timeout: Optional[int]
+    project: Project,
+    path: Path,
+    timeout: Optional[int],
+    profile: Optional[FileProfile] = None,
+    session: Optional[LspSession] = None,
 ) -> list[EvalTheorem]:
-    compile_file(project, path, timeout)
-    str_file_path = str(path.resolve())
-    str_workspace_path = str(project.workspace.resolve())
+    if profile is None:
+        profile = FileProfile(path)
+    with profile.phase("compile"):
+        compile_file(project, path, timeout)
+
     proofs: list[EvalTheorem] = []
-    cf_timeout = timeout if timeout is not None else 60
-    with CoqFile(
-        str_file_path,
-        workspace=str_workspace_path,
-        timeout=cf_timeout,
-        memory_limit=20 * (2**20),
-    ) as coq_file:
-        while coq_file.steps_taken < len(coq_file.steps):
-            tt = coq_file.context.term_type(coq_file.curr_step)
-            theorem_step = coq_file.curr_step
-            if is_eval_theorem(tt):
-                steps = extract_proof(coq_file)
-                assert 0 < len(steps)
-                if ends_with_qed(steps):
-                    test_thm = get_test_thm(project, path, theorem_step, steps)
-                    proofs.append(test_thm)
-            else:
-                coq_file.exec()
+    file_session = session if session is not None else LspSession(project, timeout)
+    try:
+        with contextlib.ExitStack() as stack:
+            with profile.phase("open"):
+                coq_file = stack.enter_context(file_session.open(path))
+            profile.num_steps = len(coq_file.steps)
+            while coq_file.steps_taken < len(coq_file.steps):
+                tt = coq_file.context.term_type(coq_file.curr_step)
+                theorem_step = coq_file.curr_step
+                if is_eval_theorem(tt):
+                    with profile.phase("exec"):
+                        steps = extract_proof(coq_file)
+                    assert 0 < len(steps)
+                    if ends_with_qed(steps):
+                        with profile.phase("hash"):
+                            test_thm = get_test_thm(project, path, theorem_step, steps)
+                        proofs.append(test_thm)
+                else:
+                    with profile.phase("exec"):
+                        coq_file.exec()
+    finally:
+        if session is None:
+            file_session.close()
     return proofs
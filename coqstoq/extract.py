@@ -0,0 +1,117 @@
+"""
+Bulk extraction of theorem statements, ground-truth proofs and file prefixes.
+Theorems are grouped by source file so that each file is read and hashed once.
+"""
+
+from __future__ import annotations
+from typing import Any, Iterable, Iterator
+
+import os
+import json
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+
+from coqstoq import get_theorem_list
+from coqstoq.eval_thms import EvalTheorem
+from coqstoq.source_index import load_source
+
+
+@dataclass
+class TheoremContext:
+    idx: int  # Index of the theorem in the extracted list
+    thm: EvalTheorem
+    statement: str
+    proof: str  # Ground-truth proof
+    prefix: str  # Contents of the file before the theorem
+
+    def to_json(self) -> Any:
+        return {
+            "idx": self.idx,
+            "thm": self.thm.to_json(),
+            "statement": self.statement,
+            "proof": self.proof,
+            "prefix": self.prefix,
+        }
+
+    @classmethod
+    def from_json(cls, data: Any) -> TheoremContext:
+        return cls(
+            data["idx"],
+            EvalTheorem.from_json(data["thm"]),
+            data["statement"],
+            data["proof"],
+            data["prefix"],
+        )
+
+
+def group_by_file(thms: list[EvalTheorem]) -> dict[Path, list[int]]:
+    file_groups: dict[Path, list[int]] = {}
+    for i, thm in enumerate(thms):
+        file_loc = thm.project.workspace / thm.path
+        file_groups.setdefault(file_loc, []).append(i)
+    return file_groups
+
+
+def iter_theorem_contexts(
+    thms: list[EvalTheorem], coqstoq_loc: Path
+) -> Iterator[TheoremContext]:
+    """
+    Yields a context for every theorem, grouped by source file.
+    Use `TheoremContext.idx` to recover the original order.
+    """
+    for file_loc, thm_idxs in group_by_file(thms).items():
+        orig_file_loc = coqstoq_loc / file_loc
+        assert orig_file_loc.exists()
+        source = load_source(orig_file_loc)
+        for i in thm_idxs:
+            thm = thms[i]
+            assert source.hash == thm.hash, f"Hash mismatch for file {orig_file_loc}"
+            yield TheoremContext(
+                i,
+                thm,
+                source.span(thm.theorem_start_pos, thm.theorem_end_pos),
+                source.span(thm.proof_start_pos, thm.proof_end_pos),
+                source.before(thm.theorem_start_pos),
+            )
+
+
+def write_context_shards(
+    contexts: Iterable[TheoremContext], save_dir: Path, shard_size: int
+) -> list[Path]:
+    """Writes contexts to `save_dir` as JSONL files of at most `shard_size` lines."""
+    assert 0 < shard_size
+    os.makedirs(save_dir, exist_ok=True)
+    shard_locs: list[Path] = []
+    fout = None
+    num_in_shard = 0
+    try:
+        for context in contexts:
+            if fout is None or num_in_shard == shard_size:
+                if fout is not None:
+                    fout.close()
+                shard_loc = save_dir / f"shard-{len(shard_locs):05d}.jsonl"
+                shard_locs.append(shard_loc)
+                fout = shard_loc.open("w")
+                num_in_shard = 0
+            fout.write(json.dumps(context.to_json()) + "\n")
+            num_in_shard += 1
+    finally:
+        if fout is not None:
+            fout.close()
+    return shard_locs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Extract statements, ground-truth proofs and prefixes for a split."
+    )
+    parser.add_argument("split_name", type=str, help="Name of the split (e.g. test).")
+    parser.add_argument("save_dir", type=str, help="Directory to write shards to.")
+    parser.add_argument("--shard_size", type=int, default=1000)
+    args = parser.parse_args()
+
+    thms = get_theorem_list(args.split_name, Path.cwd())
+    contexts = iter_theorem_contexts(thms, Path.cwd())
+    shard_locs = write_context_shards(contexts, Path(args.save_dir), args.shard_size)
+    print(f"Wrote {len(thms)} theorems to {len(shard_locs)} shards.")
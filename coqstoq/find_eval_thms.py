@@ -1,27 +1,39 @@
 from __future__ import annotations
 from typing import Optional
 import subprocess
-import yaml
 import os
 import json
 import argparse
 from typing import Any
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
-from coqpyt.lsp.structs import ResponseError
 from coqstoq.predefined_projects import PREDEFINED_PROJECTS, HOARETUT
 from coqstoq.eval_thms import (
     Project,
     Split,
     find_eval_theorems,
+    FileProfile,
+    PHASES,
+    LspSession,
+    DEFAULT_MEMORY_LIMIT,
     CoqComplieError,
     CoqCompileTimeoutError,
     EvalTheorem,
 )
 
+from coqstoq.manifest import REPORTS_LOC, write_manifest
+from coqstoq.tracing import span
+from coqstoq.storage import (
+    load_json,
+    dump_json,
+    data_loc_exists,
+    iter_data_files,
+    logical_data_loc,
+    stored_compression,
+)
+
 TEST_THMS_LOC = Path("test-theorems")
-REPORTS_LOC = Path("test-theorems-reports")
 
 
 def save_theorems(project: Project, file: Path, thms: list[EvalTheorem]):
@@ -32,23 +44,22 @@ def save_theorems(project: Project, file: Path, thms: list[EvalTheorem]):
     ).with_suffix(".json")
     if not save_loc.parent.exists():
         save_loc.parent.mkdir(parents=True)
-    with open(save_loc, "w") as f:
-        json.dump([thm.to_json() for thm in thms], f, indent=2)
+    thms_json = [thm.to_json() for thm in thms]
+    dump_json(thms_json, save_loc, stored_compression(save_loc))
 
 
 def get_eval_thms(file: Path) -> list[EvalTheorem]:
-    with open(file) as f:
-        thms = json.load(f)
-        return [EvalTheorem.from_json(thm) for thm in thms]
+    thms = load_json(file)
+    return [EvalTheorem.from_json(thm) for thm in thms]
 
 
 def get_all_eval_thms(split: Split, coqstoq_loc: Path) -> dict[Path, list[EvalTheorem]]:
     thm_loc = coqstoq_loc / split.thm_dir_name
     assert thm_loc.exists()
     all_thms: dict[Path, list[EvalTheorem]] = {}
-    for thm_file_loc in thm_loc.glob("**/*.json"):
+    for thm_file_loc in iter_data_files(thm_loc):
         assert thm_file_loc.is_relative_to(coqstoq_loc)
-        rel_thm_file_loc = thm_file_loc.relative_to(coqstoq_loc)
+        rel_thm_file_loc = logical_data_loc(thm_file_loc.relative_to(coqstoq_loc))
         all_thms[rel_thm_file_loc] = get_eval_thms(thm_file_loc)
     return all_thms
 
@@ -60,6 +71,7 @@ class TheoremReport:
     timed_out_files: list[Path]
     lsp_error_files: list[Path]
     num_theorems: int
+    profiles: list[FileProfile] = field(default_factory=list)
 
     def print_summary(self):
         print(
@@ -85,6 +97,7 @@ class TheoremReport:
             "timed_out_files": [str(f) for f in self.timed_out_files],
             "lsp_error_files": [str(f) for f in self.lsp_error_files],
             "num_theorems": self.num_theorems,
+            "profiles": [p.to_json() for p in self.profiles],
         }
 
     @classmethod
@@ -95,42 +108,83 @@ class TheoremReport:
             [Path(f) for f in data["timed_out_files"]],
             [Path(f) for f in data["lsp_error_files"]],
             data["num_theorems"],
+            [FileProfile.from_json(p) for p in data.get("profiles", [])],
         )
 
+    def print_profile_summary(self, num_files: int):
+        if 0 == len(self.profiles):
+            print("No profile recorded.")
+            return
+        phase_totals = {
+            phase: sum(p.phases.get(phase, 0) for p in self.profiles)
+            for phase in PHASES
+        }
+        total = sum(phase_totals.values())
+        print(f"Total: {total:.2f}s over {len(self.profiles)} files")
+        for phase, phase_total in sorted(phase_totals.items(), key=lambda x: -x[1]):
+            print(f"\t{phase}: {phase_total:.2f}s ({100 * phase_total / total:.1f}%)")
+        print("Slowest files:")
+        slowest = sorted(self.profiles, key=lambda p: -p.total)[:num_files]
+        for p in slowest:
+            phases_str = ", ".join(f"{k}={v:.2f}s" for k, v in p.phases.items())
+            print(f"\t{p.path}: {p.total:.2f}s; {p.num_steps} steps; {phases_str}")
+
+
+def find_project_theormes(
+    project: Project,
+    timeout: int,
+    memory_limit: int = DEFAULT_MEMORY_LIMIT,
+    max_rss: Optional[int] = None,
+) -> TheoremReport:
+    from coqpyt.lsp.structs import ResponseError
 
-def find_project_theormes(project: Project, timeout: int) -> TheoremReport:
     print(project.workspace)
     successful_files: list[Path] = []
     errored_files: list[Path] = []
     timed_out_files: list[Path] = []
     lsp_errored_files: list[Path] = []
     num_thms: int = 0
-    for file in project.workspace.glob("**/*.v"):
-        print(f"Checking {file}")
-        try:
-            thms = find_eval_theorems(project, file, timeout)
-            print(f"Found {len(thms)} theorems in {file}")
-            save_theorems(project, file, thms)
-            successful_files.append(file)
-            num_thms += len(thms)
-        except CoqComplieError as e:
-            print(f"Could not compile {file}; Error: {e}")
-            errored_files.append(file)
-            continue
-        except CoqCompileTimeoutError as e:
-            print(f"Compilation timed out for {file}; Error; {e}")
-            timed_out_files.append(file)
-            continue
-        except ResponseError as e:
-            print(f"Got Coq-LSP response error for {file}.")
-            lsp_errored_files.append(file)
-            continue
+    profiles: list[FileProfile] = []
+    session = LspSession(project, timeout, memory_limit, max_rss=max_rss)
+    with span("project", "discovery", project=project.dir_name) as project_span:
+        for file in project.workspace.glob("**/*.v"):
+            print(f"Checking {file}")
+            profile = FileProfile(file)
+            profiles.append(profile)
+            with span("file", "discovery", path=str(file)) as file_span:
+                try:
+                    thms = find_eval_theorems(project, file, timeout, profile, session)
+                    print(f"Found {len(thms)} theorems in {file}")
+                    save_theorems(project, file, thms)
+                    successful_files.append(file)
+                    num_thms += len(thms)
+                    file_span.set(num_thms=len(thms))
+                except CoqComplieError as e:
+                    print(f"Could not compile {file}; Error: {e}")
+                    errored_files.append(file)
+                    file_span.set(outcome="compile_error")
+                    continue
+                except CoqCompileTimeoutError as e:
+                    print(f"Compilation timed out for {file}; Error; {e}")
+                    timed_out_files.append(file)
+                    file_span.set(outcome="timeout")
+                    continue
+                except ResponseError as e:
+                    print(f"Got Coq-LSP response error for {file}.")
+                    lsp_errored_files.append(file)
+                    file_span.set(outcome="lsp_error")
+                    continue
+        project_span.set(num_thms=num_thms, num_restarts=session.num_restarts)
+    session.close()
+    if 0 < session.num_restarts:
+        print(f"Restarted coq-lsp {session.num_restarts} times.")
     return TheoremReport(
         successful_files,
         errored_files,
         timed_out_files,
         lsp_errored_files,
         num_thms,
+        profiles,
     )
 
 
@@ -162,16 +216,15 @@ def validate_report(p: Project, theorem_report: TheoremReport):
     for s in theorem_report.successful_files:
         assert s.is_relative_to(p.workspace)
         saved_thms_loc = p.thm_path / s.relative_to(p.workspace).with_suffix(".json")
-        assert saved_thms_loc.exists()
-        with open(saved_thms_loc) as f:
-            thms = json.load(f)
-            counted_thms += len(thms)
+        assert data_loc_exists(saved_thms_loc)
+        thms = load_json(saved_thms_loc)
+        counted_thms += len(thms)
     assert counted_thms == theorem_report.num_theorems
 
     for s in theorem_report.unsuccessful_files:
         assert s.is_relative_to(p.workspace)
         saved_thms_loc = p.thm_path / s.relative_to(p.workspace).with_suffix(".json")
-        assert not saved_thms_loc.exists()
+        assert not data_loc_exists(saved_thms_loc)
 
     total_reported_files = len(theorem_report.successful_files) + len(
         theorem_report.unsuccessful_files
@@ -199,19 +252,25 @@ class EvalReport:
 
 TIMEOUT = 120
 
-def create_predefined_coqstoq_theorems():
+def create_predefined_coqstoq_theorems(
+    memory_limit: int = DEFAULT_MEMORY_LIMIT, max_rss: Optional[int] = None
+):
     reports: list[EvalReport] = []
 
     os.makedirs(REPORTS_LOC, exist_ok=True)
     assert unique_names(PREDEFINED_PROJECTS)
     for project in PREDEFINED_PROJECTS:
-        report = find_project_theormes(project, TIMEOUT)
+        report = find_project_theormes(project, TIMEOUT, memory_limit, max_rss)
         validate_report(project, report)
         eval_report = EvalReport(project, report)
         reports.append(eval_report)
         with open(REPORTS_LOC / f"{project.dir_name}.json", "w") as f:
             json.dump(eval_report.to_json(), f, indent=2)
 
+    split_names = {p.split.thm_dir_name: p.split for p in PREDEFINED_PROJECTS}
+    for split in split_names.values():
+        write_manifest(split, Path.cwd())
+
     print()
     for r in reports:
         print(f"<<<<< Project: {r.project.dir_name} >>>>>")
@@ -248,6 +307,8 @@ def get_commit_hash(project_dir: Path) -> Optional[str]:
 
 
 def read_yaml_compile_args(project_name: str, yaml_file: Path) -> list[str]:
+     import yaml
+
      with open(yaml_file, "r") as f:
         data = yaml.safe_load(f)
         assert project_name in data, f"Project {project_name} not found in {yaml_file}"
@@ -259,7 +320,11 @@ def read_yaml_compile_args(project_name: str, yaml_file: Path) -> list[str]:
 """
 Create coqstoq theorems for a set of custom projects.
 """
-def create_custom_coqstoq_theorems(custom_split_name: str):
+def create_custom_coqstoq_theorems(
+    custom_split_name: str,
+    memory_limit: int = DEFAULT_MEMORY_LIMIT,
+    max_rss: Optional[int] = None,
+):
     custom_split = Split.from_name(custom_split_name)
     custom_repos_loc = Path.cwd() / custom_split.dir_name
     if not custom_repos_loc.exists():
@@ -287,13 +352,15 @@ def create_custom_coqstoq_theorems(custom_split_name: str):
             commit_hash=project_commit,
             compile_args=project_compile_args,
         ) 
-        report = find_project_theormes(project, TIMEOUT)
+        report = find_project_theormes(project, TIMEOUT, memory_limit, max_rss)
         validate_report(project, report)
         eval_report = EvalReport(project, report)
         reports.append(eval_report)
         with open(REPORTS_LOC / f"{project.dir_name}.json", "w") as f:
             json.dump(eval_report.to_json(), f, indent=2)
 
+    write_manifest(custom_split, Path.cwd())
+
     print()
     for r in reports:
         print(f"<<<<< Project: {r.project.dir_name} >>>>>")
@@ -301,6 +368,17 @@ def create_custom_coqstoq_theorems(custom_split_name: str):
 
 
 
+def print_profile_summaries(num_files: int):
+    for report_loc in sorted(REPORTS_LOC.glob("*.json")):
+        with report_loc.open("r") as f:
+            report_data = json.load(f)
+        if "report" not in report_data:
+            continue  # Not a project report
+        eval_report = EvalReport.from_json(report_data)
+        print(f"<<<<< Project: {eval_report.project.dir_name} >>>>>")
+        eval_report.report.print_profile_summary(num_files)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Create coqstoq theorems."
@@ -311,10 +389,33 @@ if __name__ == "__main__":
         default=None,
         help="Path to a directory containing custom repos.",
     )
+    parser.add_argument(
+        "--profile-summary",
+        action="store_true",
+        help="Rank the slowest files and phases of the saved reports instead.",
+    )
+    parser.add_argument("--num-files", type=int, default=10)
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        default=DEFAULT_MEMORY_LIMIT,
+        help="Memory limit in KiB passed to coqpyt for each coq-lsp server.",
+    )
+    parser.add_argument(
+        "--max-rss",
+        type=int,
+        default=None,
+        help="Restart coq-lsp once it uses this many MiB. Defaults to 3/4 of the memory limit.",
+    )
 
     args = parser.parse_args()
+    max_rss = None if args.max_rss is None else args.max_rss * 2**20
 
-    if args.custom_split_name is not None:
-        create_custom_coqstoq_theorems(args.custom_split_name)
+    if args.profile_summary:
+        print_profile_summaries(args.num_files)
+    elif args.custom_split_name is not None:
+        create_custom_coqstoq_theorems(
+            args.custom_split_name, args.memory_limit, max_rss
+        )
     else:
-        create_predefined_coqstoq_theorems()
\ No newline at end of file
+        create_predefined_coqstoq_theorems(args.memory_limit, max_rss)
\ No newline at end of file
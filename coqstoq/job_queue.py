@@ -0,0 +1,389 @@
+"""
+A durable job queue backed by SQLite, so that any number of checking and
+discovery workers, on any number of hosts, can pull work until it runs out.
+
+Workers lease one job at a time. A lease is extended by a heartbeat while the
+job runs; if the worker dies, the lease expires and the job is handed to
+another worker, up to `max_attempts` times. A result is recorded only by the
+worker currently holding the lease, so each job has at most one result.
+
+The database can live on a filesystem shared by all hosts, provided the
+filesystem supports POSIX locks (SQLite relies on them). Otherwise, run all
+workers on one host.
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Optional
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+
+from coqstoq.eval_thms import (
+    EvalTheorem,
+    Project,
+    find_eval_theorems,
+    FileProfile,
+    CoqComplieError,
+    CoqCompileTimeoutError,
+)
+from coqstoq.check import EvalResults, Result, check_result
+from coqstoq.tracing import span
+from coqstoq.verdict_cache import VerdictCache
+
+DEFAULT_DB_LOC = Path("coqstoq-jobs.sqlite")
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+CHECK_QUEUE = "check"
+DISCOVER_QUEUE = "discover"
+
+
+class JobQueue:
+    def __init__(self, db_loc: Path = DEFAULT_DB_LOC):
+        self.db_loc = db_loc
+        self.conn = sqlite3.connect(db_loc, timeout=60, isolation_level=None)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, "
+            "queue TEXT NOT NULL, "
+            "key TEXT NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "status TEXT NOT NULL, "  # pending, leased, done or failed
+            "attempts INTEGER NOT NULL, "
+            "max_attempts INTEGER NOT NULL, "
+            "worker TEXT, "
+            "lease_expires REAL, "
+            "result TEXT, "
+            "error TEXT, "
+            "UNIQUE (queue, key))"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_queue_status ON jobs (queue, status)"
+        )
+
+    def enqueue(
+        self,
+        queue: str,
+        key: str,
+        payload: Any,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> bool:
+        """Adds a job unless one with the same key is already in the queue."""
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO jobs "
+            "(queue, key, payload, status, attempts, max_attempts) "
+            "VALUES (?, ?, ?, 'pending', 0, ?)",
+            (queue, key, json.dumps(payload), max_attempts),
+        )
+        return cursor.rowcount == 1
+
+    def enqueue_many(
+        self,
+        queue: str,
+        jobs: list[tuple[str, Any]],
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> int:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            num_added = sum(
+                self.enqueue(queue, key, payload, max_attempts) for key, payload in jobs
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return num_added
+
+    def lease(
+        self, queue: str, worker: str, lease_seconds: float
+    ) -> Optional[tuple[int, Any]]:
+        """Leases the oldest available job. Returns (job id, payload)."""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs whose workers died on their last attempt will not be retried.
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Lease expired.' "
+                "WHERE queue = ? AND status = 'leased' AND lease_expires < ? "
+                "AND max_attempts <= attempts",
+                (queue, now),
+            )
+            row = self.conn.execute(
+                "SELECT id, payload FROM jobs WHERE queue = ? AND "
+                "(status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                "ORDER BY id LIMIT 1",
+                (queue, now),
+            ).fetchone()
+            if row is not None:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'leased', worker = ?, "
+                    "lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    (worker, now + lease_seconds, row[0]),
+                )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def extend(self, job_id: int, worker: str, lease_seconds: float) -> bool:
+        cursor = self.conn.execute(
+            "UPDATE jobs SET lease_expires = ? "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (time.time() + lease_seconds, job_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, result: Any) -> bool:
+        """Records the result if `worker` still holds the lease."""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, lease_expires = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (json.dumps(result), job_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        """Releases the job for a retry, or fails it if out of attempts."""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET "
+            "status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END, "
+            "error = ?, worker = NULL, lease_expires = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (error, job_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def status(self) -> Any:
+        counts: dict[str, dict[str, int]] = {}
+        for queue, status, count in self.conn.execute(
+            "SELECT queue, status, COUNT(*) FROM jobs GROUP BY queue, status"
+        ):
+            counts.setdefault(queue, {})[status] = count
+        workers = [
+            {"queue": queue, "worker": worker, "num_jobs": count}
+            for queue, worker, count in self.conn.execute(
+                "SELECT queue, worker, COUNT(*) FROM jobs "
+                "WHERE status = 'leased' AND ? <= lease_expires "
+                "GROUP BY queue, worker ORDER BY queue, worker",
+                (time.time(),),
+            )
+        ]
+        return {"counts": counts, "active_workers": workers}
+
+    def results(self, queue: str) -> list[tuple[str, str, Any]]:
+        """(key, status, result) of every job, in the order they were enqueued."""
+        return [
+            (key, status, None if result is None else json.loads(result))
+            for key, status, result in self.conn.execute(
+                "SELECT key, status, result FROM jobs WHERE queue = ? ORDER BY id",
+                (queue,),
+            )
+        ]
+
+    def close(self):
+        self.conn.close()
+
+
+def default_worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_worker(
+    job_queue: JobQueue,
+    queue: str,
+    handler: Callable[[Any], Any],
+    worker: str,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    idle_wait: Optional[float] = None,
+) -> int:
+    """
+    Runs jobs until the queue is empty. With `idle_wait`, polls every
+    `idle_wait` seconds for new jobs instead of stopping. Returns the number
+    of jobs completed.
+    """
+    num_completed = 0
+    while True:
+        leased = job_queue.lease(queue, worker, lease_seconds)
+        if leased is None:
+            if idle_wait is None:
+                return num_completed
+            time.sleep(idle_wait)
+            continue
+        job_id, payload = leased
+        # The heartbeat uses its own connection; connections are not shared
+        # across threads.
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=heartbeat_loop,
+            args=(job_queue.db_loc, job_id, worker, lease_seconds, stop_heartbeat),
+        )
+        heartbeat.start()
+        try:
+            with span("job", queue, job_id=job_id, worker=worker):
+                result = handler(payload)
+        except Exception as e:
+            stop_heartbeat.set()
+            heartbeat.join()
+            print(f"Job {job_id} failed: {type(e).__name__}: {e}")
+            job_queue.fail(job_id, worker, f"{type(e).__name__}: {e}")
+            continue
+        stop_heartbeat.set()
+        heartbeat.join()
+        if job_queue.complete(job_id, worker, result):
+            num_completed += 1
+        else:
+            print(f"Lost the lease of job {job_id}; its result was discarded.")
+
+
+def heartbeat_loop(
+    db_loc: Path,
+    job_id: int,
+    worker: str,
+    lease_seconds: float,
+    stop: threading.Event,
+):
+    job_queue = JobQueue(db_loc)
+    while not stop.wait(lease_seconds / 3):
+        job_queue.extend(job_id, worker, lease_seconds)
+    job_queue.close()
+
+
+def check_job(result: Result) -> Any:
+    return {"thm": result.thm.to_json(), "proof": result.proof}
+
+
+def check_handler(
+    coqstoq_loc: Path, cache: Optional[VerdictCache]
+) -> Callable[[Any], Any]:
+    def handle(payload: Any) -> Any:
+        thm = EvalTheorem.from_json(payload["thm"])
+        valid = check_result(Result(thm, payload["proof"], None), coqstoq_loc, cache)
+        return {"valid": valid}
+
+    return handle
+
+
+def discover_job(project: Project, file: Path) -> Any:
+    return {"project": project.to_json(), "file": str(file)}
+
+
+def discover_handler(timeout: int) -> Callable[[Any], Any]:
+    from coqpyt.lsp.structs import ResponseError
+    from coqstoq.find_eval_thms import save_theorems
+
+    def handle(payload: Any) -> Any:
+        project = Project.from_json(payload["project"])
+        file = Path(payload["file"])
+        profile = FileProfile(file)
+        try:
+            thms = find_eval_theorems(project, file, timeout, profile)
+        except CoqComplieError:
+            return {"status": "errored", "profile": profile.to_json()}
+        except CoqCompileTimeoutError:
+            return {"status": "timed_out", "profile": profile.to_json()}
+        except ResponseError:
+            return {"status": "lsp_errored", "profile": profile.to_json()}
+        save_theorems(project, file, thms)
+        return {
+            "status": "successful",
+            "num_theorems": len(thms),
+            "profile": profile.to_json(),
+        }
+
+    return handle
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared queue of checking jobs.")
+    parser.add_argument("--db_loc", type=str, default=str(DEFAULT_DB_LOC))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_check_parser = subparsers.add_parser(
+        "enqueue-check", help="Queue the proofs of an EvalResults file for checking."
+    )
+    enqueue_check_parser.add_argument("results_loc", type=str)
+    enqueue_check_parser.add_argument(
+        "--max_attempts", type=int, default=DEFAULT_MAX_ATTEMPTS
+    )
+
+    enqueue_discover_parser = subparsers.add_parser(
+        "enqueue-discover", help="Queue the files of predefined projects for discovery."
+    )
+    enqueue_discover_parser.add_argument("project_names", nargs="+")
+    enqueue_discover_parser.add_argument(
+        "--max_attempts", type=int, default=DEFAULT_MAX_ATTEMPTS
+    )
+
+    work_parser = subparsers.add_parser("work", help="Run jobs until none are left.")
+    work_parser.add_argument("queue", choices=[CHECK_QUEUE, DISCOVER_QUEUE])
+    work_parser.add_argument("--worker", type=str, default=None)
+    work_parser.add_argument("--lease_seconds", type=float, default=DEFAULT_LEASE_SECONDS)
+    work_parser.add_argument(
+        "--idle_wait",
+        type=float,
+        default=None,
+        help="Poll for new jobs every this many seconds instead of exiting.",
+    )
+    work_parser.add_argument("--timeout", type=int, default=600)
+    work_parser.add_argument("--cache_loc", type=str, default=None)
+
+    subparsers.add_parser("status", help="Show the progress of the queues.")
+
+    export_parser = subparsers.add_parser("export", help="Save the results of a queue.")
+    export_parser.add_argument("queue", choices=[CHECK_QUEUE, DISCOVER_QUEUE])
+    export_parser.add_argument("save_loc", type=str)
+    args = parser.parse_args()
+
+    job_queue = JobQueue(Path(args.db_loc))
+    match args.command:
+        case "enqueue-check":
+            with open(args.results_loc) as fin:
+                eval_results = EvalResults.from_json(json.load(fin))
+            jobs = [
+                (f"{args.results_loc}:{i}", check_job(r))
+                for i, r in enumerate(eval_results.results)
+            ]
+            num_added = job_queue.enqueue_many(CHECK_QUEUE, jobs, args.max_attempts)
+            print(f"Queued {num_added} of {len(jobs)} checks.")
+        case "enqueue-discover":
+            from coqstoq.find_eval_thms import find_project
+
+            jobs = []
+            for project_name in args.project_names:
+                project = find_project(project_name)
+                for file in sorted(project.workspace.glob("**/*.v")):
+                    jobs.append((str(file), discover_job(project, file)))
+            num_added = job_queue.enqueue_many(DISCOVER_QUEUE, jobs, args.max_attempts)
+            print(f"Queued {num_added} of {len(jobs)} files.")
+        case "work":
+            worker = args.worker or default_worker_name()
+            if args.queue == CHECK_QUEUE:
+                cache = VerdictCache(Path(args.cache_loc)) if args.cache_loc else None
+                handler = check_handler(Path.cwd(), cache)
+            else:
+                handler = discover_handler(args.timeout)
+            num_completed = run_worker(
+                job_queue, args.queue, handler, worker, args.lease_seconds, args.idle_wait
+            )
+            print(f"{worker} completed {num_completed} jobs.")
+        case "status":
+            print(json.dumps(job_queue.status(), indent=2))
+        case "export":
+            with open(args.save_loc, "w") as fout:
+                json.dump(
+                    [
+                        {"key": key, "status": status, "result": result}
+                        for key, status, result in job_queue.results(args.queue)
+                    ],
+                    fout,
+                    indent=2,
+                )
+    job_queue.close()
@@ -0,0 +1,197 @@
+"""
+Linear-time joins of results, split indices and theorem metadata. Theorems
+are matched by id (see `EvalTheorem.id`) through a dict, rather than by
+comparing `EvalTheorem`s, so merging and validating large results files
+does not grow quadratically.
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+import json
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+
+from coqstoq import get_theorem_list, get_split_val
+from coqstoq.eval_thms import EvalTheorem
+from coqstoq.check import Result, EvalResults
+from coqstoq.names import load_name_index
+from coqstoq.storage import data_loc_exists, load_json
+
+L = TypeVar("L")
+R = TypeVar("R")
+
+
+def hash_join(
+    left: Iterable[L],
+    right: Iterable[R],
+    left_key: Callable[[L], Any],
+    right_key: Callable[[R], Any],
+) -> list[tuple[L, R]]:
+    """Pairs of items with equal keys. Builds a table of `right`."""
+    table: dict[Any, list[R]] = {}
+    for r in right:
+        table.setdefault(right_key(r), []).append(r)
+    return [(l, r) for l in left for r in table.get(left_key(l), [])]
+
+
+def split_index(thms: list[EvalTheorem]) -> dict[str, int]:
+    """Index of each theorem of the split by id."""
+    index: dict[str, int] = {}
+    for i, thm in enumerate(thms):
+        thm_id = thm.id
+        assert thm_id not in index, f"Theorems {index[thm_id]} and {i} share id {thm_id}"
+        index[thm_id] = i
+    return index
+
+
+@dataclass
+class JoinedResults:
+    results: list[Optional[Result]]  # One per theorem of the split
+    num_unmatched: int  # Results of theorems not in the split
+    num_duplicates: int  # Results of theorems that already had one
+
+    @property
+    def num_missing(self) -> int:
+        return sum(1 for r in self.results if r is None)
+
+    @property
+    def num_solved(self) -> int:
+        return sum(1 for r in self.results if r is not None and r.proof is not None)
+
+
+def join_results(
+    results: Iterable[Result], index: dict[str, int], num_thms: int
+) -> JoinedResults:
+    """
+    Places each result at the index of its theorem. Of several results for
+    the same theorem, the first with a proof is kept.
+    """
+    joined: list[Optional[Result]] = [None for _ in range(num_thms)]
+    num_unmatched = 0
+    num_duplicates = 0
+    for r in results:
+        idx = index.get(r.thm.id)
+        if idx is None:
+            num_unmatched += 1
+            continue
+        prev = joined[idx]
+        if prev is not None:
+            num_duplicates += 1
+            if prev.proof is not None or r.proof is None:
+                continue
+        joined[idx] = r
+    return JoinedResults(joined, num_unmatched, num_duplicates)
+
+
+def merge_results(
+    results_list: list[EvalResults], thms: list[EvalTheorem]
+) -> tuple[EvalResults, JoinedResults]:
+    """
+    Merges results of the same split (e.g. shards of one run) into one
+    `EvalResults` in split order. Theorems without a result are left out.
+    """
+    joined = join_results(
+        (r for results in results_list for r in results.results),
+        split_index(thms),
+        len(thms),
+    )
+    hardware = sorted({results.hardware for results in results_list})
+    calibrations = {results.calibration for results in results_list}
+    merged = EvalResults(
+        "; ".join(hardware),
+        [r for r in joined.results if r is not None],
+        calibrations.pop() if len(calibrations) == 1 else None,
+    )
+    return merged, joined
+
+
+@dataclass
+class TheoremMetadata:
+    idx: int  # Index of the theorem in the split
+    id: str
+    name: Optional[str]  # Qualified name (see names.py)
+    project: str
+    path: str
+
+    def to_json(self) -> Any:
+        return {
+            "idx": self.idx,
+            "id": self.id,
+            "name": self.name,
+            "project": self.project,
+            "path": self.path,
+        }
+
+    @classmethod
+    def from_json(cls, json_data: Any) -> TheoremMetadata:
+        return cls(
+            json_data["idx"],
+            json_data["id"],
+            json_data["name"],
+            json_data["project"],
+            json_data["path"],
+        )
+
+
+def theorem_metadata(
+    thms: list[EvalTheorem], names: Optional[list[Optional[str]]] = None
+) -> dict[str, TheoremMetadata]:
+    """Metadata of each theorem of the split by id."""
+    if names is None:
+        names = [None for _ in thms]
+    assert len(names) == len(thms)
+    metadata: dict[str, TheoremMetadata] = {}
+    for i, (thm, name) in enumerate(zip(thms, names)):
+        thm_id = thm.id
+        metadata[thm_id] = TheoremMetadata(
+            i, thm_id, name, thm.project.dir_name, str(thm.path)
+        )
+    return metadata
+
+
+def split_names(split_name: str, coqstoq_loc: Path) -> Optional[list[Optional[str]]]:
+    split = get_split_val(split_name)
+    if not data_loc_exists(coqstoq_loc / split.names_loc):
+        return None
+    return load_name_index(split, coqstoq_loc).names
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Join results and metadata of a split by theorem id."
+    )
+    parser.add_argument("command", choices=["merge", "metadata"])
+    parser.add_argument("split_name", type=str, help="Name of the split (e.g. test).")
+    parser.add_argument(
+        "results_locs", nargs="*", help="EvalResults json files to merge."
+    )
+    parser.add_argument(
+        "--save_loc", type=str, default=None, help="Where to save the output."
+    )
+    args = parser.parse_args()
+
+    thms = get_theorem_list(args.split_name, Path.cwd())
+    match args.command:
+        case "merge":
+            assert 0 < len(args.results_locs)
+            results_list = [
+                EvalResults.from_json(load_json(Path(loc)))
+                for loc in args.results_locs
+            ]
+            merged, joined = merge_results(results_list, thms)
+            print(
+                f"Merged {len(merged.results)} results "
+                f"({joined.num_solved} solved) of {len(thms)} theorems; "
+                f"{joined.num_missing} missing; {joined.num_duplicates} duplicates; "
+                f"{joined.num_unmatched} not in split."
+            )
+            output = merged.to_json()
+        case "metadata":
+            metadata = theorem_metadata(thms, split_names(args.split_name, Path.cwd()))
+            print(f"Found metadata for {len(metadata)} theorems.")
+            output = {thm_id: m.to_json() for thm_id, m in metadata.items()}
+    if args.save_loc is not None:
+        with open(args.save_loc, "w") as fout:
+            json.dump(output, fout, indent=2)
@@ -0,0 +1,306 @@
+"""
+Load generator for the checker. Replays the attempts of an `EvalResults`
+file, or synthetic attempts built by mutating ground truth proofs, against
+an in-process `CheckServer` or a running check server (see serve.py).
+
+Requests are issued on a fixed schedule when a rate is given, and as fast as
+`concurrency` threads allow otherwise. Latency is measured from the scheduled
+send time, so that a saturated checker is not hidden by a slow generator.
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Optional
+
+import json
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from coqstoq import get_theorem_list
+from coqstoq.check import EvalResults, get_ground_truth
+from coqstoq.prescreen import strip_qed
+from coqstoq.serve import CheckServer, CheckClient, ServerBusyError, ServerError
+
+
+def split_sentences(proof: str) -> list[str]:
+    """Splits `proof` after each period outside of comments."""
+    sentences: list[str] = []
+    start = 0
+    depth = 0
+    i = 0
+    while i < len(proof):
+        if proof.startswith("(*", i):
+            depth += 1
+            i += 2
+            continue
+        if 0 < depth and proof.startswith("*)", i):
+            depth -= 1
+            i += 2
+            continue
+        if (
+            depth == 0
+            and proof[i] == "."
+            and (i + 1 == len(proof) or proof[i + 1].isspace())
+        ):
+            sentences.append(proof[start : i + 1].strip())
+            start = i + 1
+        i += 1
+    if proof[start:].strip() != "":
+        sentences.append(proof[start:].strip())
+    return sentences
+
+
+def drop_last(sentences: list[str]) -> list[str]:
+    return sentences[:-1]
+
+
+def truncate(sentences: list[str]) -> list[str]:
+    return sentences[: len(sentences) // 2]
+
+
+def replace_last(sentences: list[str]) -> list[str]:
+    return sentences[:-1] + ["auto."]
+
+
+def admit_last(sentences: list[str]) -> list[str]:
+    return sentences[:-1] + ["admit."]
+
+
+MUTATIONS: dict[str, Callable[[list[str]], list[str]]] = {
+    "drop_last": drop_last,
+    "truncate": truncate,
+    "replace_last": replace_last,
+    "admit_last": admit_last,  # Rejected by prescreening
+}
+
+
+def mutate(proof: str, mutation: str) -> str:
+    sentences = split_sentences(strip_qed(proof))
+    return "\n".join(MUTATIONS[mutation](sentences))
+
+
+def results_requests(results_loc: Path) -> list[Any]:
+    with results_loc.open("r") as fin:
+        results = EvalResults.from_json(json.load(fin))
+    return [
+        {"op": "check", "thm": r.thm.to_json(), "proof": r.proof}
+        for r in results.results
+    ]
+
+
+def synthetic_requests(
+    split_name: str,
+    coqstoq_loc: Path,
+    num_thms: int,
+    mutation_rate: float,
+    seed: int,
+) -> list[Any]:
+    """Ground truth proofs of random theorems, some of them mutated."""
+    rng = random.Random(seed)
+    thms = get_theorem_list(split_name, coqstoq_loc)
+    idxs = rng.sample(range(len(thms)), min(num_thms, len(thms)))
+    requests: list[Any] = []
+    for idx in idxs:
+        proof = get_ground_truth(thms[idx], coqstoq_loc)
+        if rng.random() < mutation_rate:
+            proof = mutate(proof, rng.choice(sorted(MUTATIONS)))
+        requests.append({"op": "check", "split": split_name, "idx": idx, "proof": proof})
+    return requests
+
+
+class SocketBackend:
+    """Sends requests to a running check server. Busy responses are not retried."""
+
+    def __init__(self, socket_loc: Path):
+        self.socket_loc = socket_loc
+        self.local = threading.local()
+        self.clients: list[CheckClient] = []
+        self.lock = threading.Lock()
+
+    def handle(self, request: Any) -> Any:
+        if not hasattr(self.local, "client"):
+            self.local.client = CheckClient(self.socket_loc)
+            with self.lock:
+                self.clients.append(self.local.client)
+        try:
+            return self.local.client.request(request)
+        except ServerBusyError as e:
+            return {"ok": False, "busy": True, "error": str(e)}
+        except ServerError as e:
+            return {"ok": False, "error": str(e)}
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+
+@dataclass
+class Sample:
+    scheduled: float
+    sent: float
+    done: float
+    outcome: str  # valid, invalid, busy or error
+    queue_time: Optional[float]
+    check_time: Optional[float]
+
+
+def send(handle: Callable[[Any], Any], request: Any, scheduled: float) -> Sample:
+    time.sleep(max(0, scheduled - time.time()))
+    sent = time.time()
+    try:
+        response = handle(request)
+    except Exception as e:
+        response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    done = time.time()
+    if response["ok"]:
+        outcome = "valid" if response["valid"] else "invalid"
+    elif response.get("busy", False):
+        outcome = "busy"
+    else:
+        outcome = "error"
+    return Sample(
+        scheduled,
+        sent,
+        done,
+        outcome,
+        response.get("queue_time"),
+        response.get("check_time"),
+    )
+
+
+def run_load(
+    handle: Callable[[Any], Any],
+    requests: list[Any],
+    num_requests: int,
+    concurrency: int,
+    rate: Optional[float],
+) -> tuple[list[Sample], float]:
+    """Sends `num_requests` requests, cycling through `requests`."""
+    if num_requests == 0 or len(requests) == 0:
+        return [], 0.0
+    start = time.time() + 0.1
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = []
+        for i in range(num_requests):
+            scheduled = start if rate is None else start + i / rate
+            request = requests[i % len(requests)]
+            futures.append(executor.submit(send, handle, request, scheduled))
+        samples = [f.result() for f in futures]
+    if rate is None:
+        for s in samples:
+            s.scheduled = s.sent
+    return samples, max(s.done for s in samples) - start
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    if len(values) == 0:
+        return None
+    sorted_values = sorted(values)
+    idx = min(len(values) - 1, int(q / 100 * len(values)))
+    return sorted_values[idx]
+
+
+def percentiles(values: list[float]) -> Any:
+    return {f"p{q}": percentile(values, q) for q in [50, 95, 99]}
+
+
+def summarize(samples: list[Sample], duration: float) -> Any:
+    num_outcomes = {
+        outcome: sum(1 for s in samples if s.outcome == outcome)
+        for outcome in ["valid", "invalid", "busy", "error"]
+    }
+    checked = [s for s in samples if s.outcome in ("valid", "invalid")]
+    num_samples = max(1, len(samples))  # An empty run has rates of 0
+    return {
+        "num_requests": len(samples),
+        "duration": duration,
+        "throughput": len(checked) / duration if 0 < duration else 0.0,
+        "outcomes": num_outcomes,
+        "busy_rate": num_outcomes["busy"] / num_samples,
+        "error_rate": num_outcomes["error"] / num_samples,
+        "latency": percentiles([s.done - s.scheduled for s in checked]),
+        "send_lag": percentiles([s.sent - s.scheduled for s in samples]),
+        "queue_wait": percentiles(
+            [s.queue_time for s in checked if s.queue_time is not None]
+        ),
+        "check_time": percentiles(
+            [s.check_time for s in checked if s.check_time is not None]
+        ),
+    }
+
+
+def format_percentiles(name: str, ps: Any) -> str:
+    if ps["p50"] is None:
+        return f"{name}: -"
+    return f"{name}: " + " ".join(f"{k}={v:.3f}s" for k, v in ps.items())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the limits of the checker.")
+    parser.add_argument(
+        "--results_loc", type=str, default=None, help="EvalResults file to replay."
+    )
+    parser.add_argument(
+        "--split", type=str, default="test", help="Split for synthetic attempts."
+    )
+    parser.add_argument("--num_thms", type=int, default=100)
+    parser.add_argument("--mutation_rate", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num_requests", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--rate", type=float, default=None, help="Requests per second. Unlimited if unset."
+    )
+    parser.add_argument(
+        "--socket_loc",
+        type=str,
+        default=None,
+        help="Socket of a running check server. Checks in-process if unset.",
+    )
+    parser.add_argument("--n_workers", type=int, default=8)
+    parser.add_argument("--max_queue_depth", type=int, default=None)
+    parser.add_argument("--save_loc", type=str, default=None)
+    args = parser.parse_args()
+    if args.num_requests is not None and args.num_requests <= 0:
+        parser.error("--num_requests must be positive.")
+
+    if args.results_loc is not None:
+        requests = results_requests(Path(args.results_loc))
+    else:
+        requests = synthetic_requests(
+            args.split, Path.cwd(), args.num_thms, args.mutation_rate, args.seed
+        )
+    num_requests = len(requests) if args.num_requests is None else args.num_requests
+
+    if args.socket_loc is not None:
+        backend = SocketBackend(Path(args.socket_loc))
+        samples, duration = run_load(
+            backend.handle, requests, num_requests, args.concurrency, args.rate
+        )
+        backend.close()
+    else:
+        max_queue_depth = args.max_queue_depth or 4 * args.n_workers
+        server = CheckServer(Path.cwd(), args.n_workers, max_queue_depth)
+        samples, duration = run_load(
+            server.handle, requests, num_requests, args.concurrency, args.rate
+        )
+        server.executor.shutdown()
+
+    summary = summarize(samples, duration)
+    print(f"Sent {summary['num_requests']} requests in {duration:.2f}s.")
+    print(f"Throughput: {summary['throughput']:.2f} checks/s")
+    print(
+        f"Busy: {100 * summary['busy_rate']:.2f}%; "
+        f"Errors: {100 * summary['error_rate']:.2f}%"
+    )
+    print(format_percentiles("Latency", summary["latency"]))
+    print(format_percentiles("Queue wait", summary["queue_wait"]))
+    print(format_percentiles("Check time", summary["check_time"]))
+    print(format_percentiles("Send lag", summary["send_lag"]))
+    if args.save_loc is not None:
+        with open(args.save_loc, "w") as fout:
+            fout.write(json.dumps(summary, indent=2))
@@ -0,0 +1,277 @@
+"""
+Manifests record checksums of everything a split depends on, so that the state
+of a split can be verified without loading its theorems.
+
+A manifest is written whenever theorems or theorem lists are generated.
+`verify` compares the files on disk against the manifest in parallel.
+"""
+
+from __future__ import annotations
+from typing import Any, Optional
+
+import sys
+import json
+import hashlib
+import argparse
+import subprocess
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from coqstoq.eval_thms import Split, get_file_hash
+from coqstoq.storage import decompress, iter_data_files, logical_data_loc, resolve_data_loc
+
+REPORTS_LOC = Path("test-theorems-reports")
+
+
+@dataclass
+class FileEntry:
+    sha256: str
+    num_theorems: int
+    source_hash: Optional[str]  # Hash of the .v file the theorems came from
+
+    def to_json(self) -> Any:
+        return {
+            "sha256": self.sha256,
+            "num_theorems": self.num_theorems,
+            "source_hash": self.source_hash,
+        }
+
+    @classmethod
+    def from_json(cls, data: Any) -> FileEntry:
+        return cls(data["sha256"], data["num_theorems"], data["source_hash"])
+
+
+@dataclass
+class Manifest:
+    split: Split
+    reference_list_hash: Optional[str]
+    num_references: int
+    theorem_files: dict[Path, FileEntry]  # Relative to the coqstoq root
+    reports: dict[Path, str]
+    commit_hashes: dict[str, Optional[str]]  # Project name -> commit
+
+    @property
+    def num_theorems(self) -> int:
+        return sum(e.num_theorems for e in self.theorem_files.values())
+
+    def to_json(self) -> Any:
+        return {
+            "split": self.split.to_json(),
+            "reference_list_hash": self.reference_list_hash,
+            "num_references": self.num_references,
+            "theorem_files": {
+                str(p): e.to_json() for p, e in sorted(self.theorem_files.items())
+            },
+            "reports": {str(p): h for p, h in sorted(self.reports.items())},
+            "commit_hashes": dict(sorted(self.commit_hashes.items())),
+        }
+
+    @classmethod
+    def from_json(cls, data: Any) -> Manifest:
+        return cls(
+            Split.from_json(data["split"]),
+            data["reference_list_hash"],
+            data["num_references"],
+            {Path(p): FileEntry.from_json(e) for p, e in data["theorem_files"].items()},
+            {Path(p): h for p, h in data["reports"].items()},
+            data["commit_hashes"],
+        )
+
+
+@dataclass
+class Drift:
+    path: Path
+    message: str
+
+    def __str__(self) -> str:
+        return f"{self.path}: {self.message}"
+
+
+def get_bytes_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def theorem_file_source(split: Split, thm_file: Path) -> Path:
+    """Location of the .v file that the theorem file `thm_file` was created from."""
+    rel_thm_file = logical_data_loc(thm_file).relative_to(split.thm_dir_name)
+    return Path(split.dir_name) / rel_thm_file.with_suffix(".v")
+
+
+def theorem_file_project(split: Split, thm_file: Path) -> str:
+    return thm_file.relative_to(split.thm_dir_name).parts[0]
+
+
+def create_manifest(split: Split, coqstoq_loc: Path) -> Manifest:
+    theorem_files: dict[Path, FileEntry] = {}
+    commit_hashes: dict[str, Optional[str]] = {}
+    for thm_file_loc in iter_data_files(coqstoq_loc / split.thm_dir_name):
+        rel_thm_file = thm_file_loc.relative_to(coqstoq_loc)
+        data = thm_file_loc.read_bytes()
+        thms = json.loads(decompress(data))
+        source_hash = thms[0]["hash"] if 0 < len(thms) else None
+        for thm in thms:
+            commit_hashes[thm["project"]["dir_name"]] = thm["project"]["commit_hash"]
+        theorem_files[rel_thm_file] = FileEntry(
+            get_bytes_hash(data), len(thms), source_hash
+        )
+
+    project_names = {theorem_file_project(split, p) for p in theorem_files}
+    reports: dict[Path, str] = {}
+    for name in project_names:
+        report_loc = REPORTS_LOC / f"{name}.json"
+        if (coqstoq_loc / report_loc).exists():
+            reports[report_loc] = get_file_hash(coqstoq_loc / report_loc)
+
+    reference_list_loc = resolve_data_loc(coqstoq_loc / split.theorem_list_loc)
+    if reference_list_loc.exists():
+        reference_list_data = reference_list_loc.read_bytes()
+        reference_list_hash = get_bytes_hash(reference_list_data)
+        num_references = len(json.loads(decompress(reference_list_data)))
+    else:
+        reference_list_hash = None
+        num_references = 0
+
+    return Manifest(
+        split,
+        reference_list_hash,
+        num_references,
+        theorem_files,
+        reports,
+        commit_hashes,
+    )
+
+
+def write_manifest(split: Split, coqstoq_loc: Path) -> Manifest:
+    manifest = create_manifest(split, coqstoq_loc)
+    with (coqstoq_loc / split.manifest_loc).open("w") as fout:
+        json.dump(manifest.to_json(), fout, indent=2)
+    return manifest
+
+
+def load_manifest(split: Split, coqstoq_loc: Path) -> Manifest:
+    with (coqstoq_loc / split.manifest_loc).open("r") as fin:
+        return Manifest.from_json(json.load(fin))
+
+
+def check_file_hash(path: Path, coqstoq_loc: Path, expected: str) -> Optional[Drift]:
+    full_path = coqstoq_loc / path
+    if not full_path.exists():
+        return Drift(path, "missing")
+    if get_file_hash(full_path) != expected:
+        return Drift(path, "checksum does not match the manifest")
+    return None
+
+
+def workspace_exists(workspace: Path) -> bool:
+    """Uninitialized submodules are empty directories."""
+    return workspace.exists() and any(workspace.iterdir())
+
+
+def check_commit(
+    split: Split, project_name: str, coqstoq_loc: Path, expected: Optional[str]
+) -> Optional[Drift]:
+    workspace = Path(split.dir_name) / project_name
+    if expected is None:
+        return None
+    if not workspace_exists(coqstoq_loc / workspace):
+        return Drift(workspace, "missing; are the submodules initialized?")
+    out = subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        cwd=coqstoq_loc / workspace,
+        capture_output=True,
+        text=True,
+    )
+    commit_hash = out.stdout.strip()
+    if commit_hash != expected:
+        return Drift(
+            workspace, f"at commit {commit_hash or '<unknown>'}; expected {expected}"
+        )
+    return None
+
+
+def verify_manifest(
+    manifest: Manifest, coqstoq_loc: Path, check_sources: bool, n_workers: int
+) -> list[Drift]:
+    split = manifest.split
+    drifts: list[Drift] = []
+
+    on_disk = {
+        p.relative_to(coqstoq_loc)
+        for p in iter_data_files(coqstoq_loc / split.thm_dir_name)
+    }
+    for extra in sorted(on_disk - manifest.theorem_files.keys()):
+        drifts.append(Drift(extra, "theorem file not in the manifest"))
+
+    checks: list[tuple[Path, str]] = []
+    if manifest.reference_list_hash is not None:
+        reference_list_loc = resolve_data_loc(coqstoq_loc / split.theorem_list_loc)
+        checks.append(
+            (reference_list_loc.relative_to(coqstoq_loc), manifest.reference_list_hash)
+        )
+    checks.extend(manifest.reports.items())
+    checks.extend((p, e.sha256) for p, e in manifest.theorem_files.items())
+
+    workspaces_present = {
+        name: workspace_exists(coqstoq_loc / split.dir_name / name)
+        for name in manifest.commit_hashes
+    }
+    if check_sources:
+        for p, e in manifest.theorem_files.items():
+            project_name = theorem_file_project(split, p)
+            if e.source_hash is not None and workspaces_present.get(project_name, True):
+                checks.append((theorem_file_source(split, p), e.source_hash))
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        file_futures = [
+            executor.submit(check_file_hash, p, coqstoq_loc, h) for p, h in checks
+        ]
+        commit_futures = [
+            executor.submit(check_commit, split, name, coqstoq_loc, h)
+            for name, h in manifest.commit_hashes.items()
+        ]
+        for future in commit_futures + file_futures:
+            drift = future.result()
+            if drift is not None:
+                drifts.append(drift)
+    return drifts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write or verify the manifests of CoqStoq splits."
+    )
+    parser.add_argument("command", choices=["write", "verify"])
+    parser.add_argument("split_names", nargs="+", help="Names of the splits (e.g. test).")
+    parser.add_argument(
+        "--no_sources",
+        action="store_true",
+        help="Do not check the hashes of the .v files in the project workspaces.",
+    )
+    parser.add_argument("--n_workers", type=int, default=8)
+    args = parser.parse_args()
+
+    all_drifts: list[Drift] = []
+    for split_name in args.split_names:
+        split = Split.from_name(split_name)
+        if args.command == "write":
+            manifest = write_manifest(split, Path.cwd())
+            print(
+                f"Wrote {split.manifest_loc}: {len(manifest.theorem_files)} files; {manifest.num_theorems} theorems."
+            )
+            continue
+        manifest = load_manifest(split, Path.cwd())
+        drifts = verify_manifest(
+            manifest, Path.cwd(), not args.no_sources, args.n_workers
+        )
+        print(f"<<<<< Split: {split_name} >>>>>")
+        if manifest.num_theorems != manifest.num_references:
+            print(
+                f"Reference list has {manifest.num_references} theorems; theorem files have {manifest.num_theorems}."
+            )
+        for drift in drifts:
+            print(f"\t{drift}")
+        print(f"{len(drifts)} drifted files.")
+        all_drifts.extend(drifts)
+    if 0 < len(all_drifts):
+        sys.exit(1)
@@ -0,0 +1,221 @@
+"""
+Fully qualified names of theorems, and a per-split index to look theorems
+up by name.
+
+Names are backfilled from the sources: the theorem name is read from the
+statement, the enclosing modules from the `Module`/`Section`/`End` sentences
+before it, and the library path from the `-R`/`-Q` flags of the project.
+The index of a split is saved as `<split>-theorems-names.json` and maps each
+index of the theorem list to a name.
+"""
+
+from __future__ import annotations
+from typing import Any, Optional
+
+import re
+import json
+import bisect
+import argparse
+import fnmatch
+from pathlib import Path
+from dataclasses import dataclass
+
+from coqstoq.eval_thms import EvalTheorem, Project, Split
+from coqstoq.prescreen import tokenize
+from coqstoq.source_index import SourceFile, load_source
+from coqstoq.storage import load_json
+
+LEADING_COMMENTS_RE = re.compile(r"^(\s*\(\*.*?\*\))*\s*", re.DOTALL)
+STATEMENT_NAME_RE = re.compile(
+    r"^(?:#\[[^\]]*\]\s*)?"
+    r"(?:(?:Local|Global|Polymorphic|Monomorphic|Program|Private)\s+)*"
+    r"(?:Theorem|Lemma|Fact|Remark|Corollary|Proposition|Property)\s+"
+    r"([A-Za-z_][\w']*)"
+)
+
+
+def statement_name(statement: str) -> Optional[str]:
+    statement = LEADING_COMMENTS_RE.sub("", statement, count=1)
+    match = STATEMENT_NAME_RE.match(statement)
+    return None if match is None else match.group(1)
+
+
+def library_path(project: Project, path: Path) -> list[str]:
+    """Logical path of the library compiled from `path` (e.g. ["Proj", "A"])."""
+    best_dir: Optional[Path] = None
+    best_prefix: list[str] = []
+    args = project.compile_args
+    for i, arg in enumerate(args[:-2]):
+        if arg not in ("-R", "-Q"):
+            continue
+        dir = Path(args[i + 1])
+        if not (dir == Path(".") or path.is_relative_to(dir)):
+            continue
+        if best_dir is None or len(best_dir.parts) < len(dir.parts):
+            best_dir = dir
+            best_prefix = [p for p in args[i + 2].split(".") if p != ""]
+    rel_path = path if best_dir is None else path.relative_to(best_dir)
+    return best_prefix + list(rel_path.with_suffix("").parts)
+
+
+@dataclass
+class Scope:
+    name: str
+    is_module: bool  # Sections do not appear in qualified names
+
+
+def module_paths(contents: str) -> list[tuple[int, list[str]]]:
+    """
+    (offset, enclosing modules) at each point the enclosing modules change,
+    in order of offset.
+    """
+    tokens = tokenize(contents)
+    scopes: list[Scope] = []
+    changes: list[tuple[int, list[str]]] = [(0, [])]
+    i = 0
+    while i < len(tokens):
+        if not tokens[i].sentence_start:
+            i += 1
+            continue
+        end = i + 1
+        while end < len(tokens) and not tokens[end].sentence_start:
+            end += 1
+        sentence = [t.text for t in tokens[i:end]]
+        scopes_changed = True
+        match sentence:
+            case ["Module", *rest] if not is_module_definition(sentence):
+                if 0 < len(rest) and rest[0] in ("Type", "Import", "Export"):
+                    rest = rest[1:]
+                if 0 < len(rest):
+                    scopes.append(Scope(rest[0], True))
+            case ["Section", name, *_]:
+                scopes.append(Scope(name, False))
+            case ["End", name, *_] if 0 < len(scopes) and scopes[-1].name == name:
+                scopes.pop()
+            case _:
+                scopes_changed = False
+        if scopes_changed:
+            changes.append(
+                (tokens[end - 1].offset + 1, [s.name for s in scopes if s.is_module])
+            )
+        i = end
+    return changes
+
+
+def is_module_definition(sentence: list[str]) -> bool:
+    """`Module M := N.` defines a module without opening it."""
+    return any(a == ":" and b == "=" for a, b in zip(sentence, sentence[1:]))
+
+
+def file_names(source: SourceFile, thms: list[EvalTheorem]) -> list[Optional[str]]:
+    """Qualified names of theorems of the same file."""
+    changes = module_paths(source.contents)
+    change_offsets = [offset for offset, _ in changes]
+    names: list[Optional[str]] = []
+    for thm in thms:
+        name = statement_name(source.span(thm.theorem_start_pos, thm.theorem_end_pos))
+        if name is None:
+            names.append(None)
+            continue
+        offset = source.offset(thm.theorem_start_pos)
+        _, modules = changes[bisect.bisect_right(change_offsets, offset) - 1]
+        names.append(".".join(library_path(thm.project, thm.path) + modules + [name]))
+    return names
+
+
+def backfill_names(thms: list[EvalTheorem], coqstoq_loc: Path) -> list[Optional[str]]:
+    file_idxs: dict[tuple[Path, Path], list[int]] = {}
+    for i, thm in enumerate(thms):
+        file_idxs.setdefault((thm.project.workspace, thm.path), []).append(i)
+    names: list[Optional[str]] = [None for _ in thms]
+    for (workspace, path), idxs in file_idxs.items():
+        source = load_source(coqstoq_loc / workspace / path)
+        for i, name in zip(idxs, file_names(source, [thms[i] for i in idxs])):
+            names[i] = name
+    return names
+
+
+class NameIndex:
+    def __init__(self, names: list[Optional[str]]):
+        self.names = names  # Name of each theorem of the theorem list
+        self.idxs: dict[str, list[int]] = {}
+        for i, name in enumerate(names):
+            if name is not None:
+                self.idxs.setdefault(name, []).append(i)
+        self.sorted_names = sorted(self.idxs)
+
+    def lookup(self, name: str) -> list[int]:
+        """Indices of the theorems called `name`."""
+        return self.idxs.get(name, [])
+
+    def prefix(self, prefix: str) -> list[str]:
+        """Names starting with `prefix` (e.g. a module path)."""
+        start = bisect.bisect_left(self.sorted_names, prefix)
+        end = start
+        while end < len(self.sorted_names) and self.sorted_names[end].startswith(
+            prefix
+        ):
+            end += 1
+        return self.sorted_names[start:end]
+
+    def query(self, pattern: str) -> list[str]:
+        """Names matching a shell-style wildcard pattern (e.g. `Proj.*.foo_*`)."""
+        literal_prefix = re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+        return [
+            name
+            for name in self.prefix(literal_prefix)
+            if fnmatch.fnmatchcase(name, pattern)
+        ]
+
+    def to_json(self) -> Any:
+        return {"names": self.names}
+
+    @classmethod
+    def from_json(cls, json_data: Any) -> NameIndex:
+        return cls(json_data["names"])
+
+
+def write_name_index(split: Split, coqstoq_loc: Path) -> NameIndex:
+    from coqstoq.create_theorem_lists import load_reference_list
+    from coqstoq.find_eval_thms import get_all_eval_thms
+
+    eval_thm_dict = get_all_eval_thms(split, coqstoq_loc)
+    thms = [
+        eval_thm_dict[ref.thm_path][ref.thm_idx]
+        for ref in load_reference_list(split, coqstoq_loc)
+    ]
+    index = NameIndex(backfill_names(thms, coqstoq_loc))
+    with (coqstoq_loc / split.names_loc).open("w") as fout:
+        json.dump(index.to_json(), fout, indent=2)
+    return index
+
+
+def load_name_index(split: Split, coqstoq_loc: Path) -> NameIndex:
+    return NameIndex.from_json(load_json(coqstoq_loc / split.names_loc))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up theorems by name.")
+    parser.add_argument("command", choices=["build", "lookup", "query"])
+    parser.add_argument("split_name", type=str, help="Name of the split (e.g. test).")
+    parser.add_argument(
+        "name", type=str, nargs="?", default=None, help="Name or wildcard pattern."
+    )
+    args = parser.parse_args()
+
+    split = Split.from_name(args.split_name)
+    match args.command:
+        case "build":
+            index = write_name_index(split, Path.cwd())
+            num_named = sum(1 for n in index.names if n is not None)
+            print(f"Named {num_named} of {len(index.names)} theorems.")
+        case "lookup":
+            assert args.name is not None
+            index = load_name_index(split, Path.cwd())
+            for idx in index.lookup(args.name):
+                print(idx)
+        case "query":
+            assert args.name is not None
+            index = load_name_index(split, Path.cwd())
+            for name in index.query(args.name):
+                print(f"{name}: {index.lookup(name)}")
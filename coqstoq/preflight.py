@@ -0,0 +1,121 @@
+"""
+Checks, before evaluation starts, that every library needed by a set of
+theorems has been built: each required `.vo` file must exist and be newer
+than its source and the `.vo` files it depends on.
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+import sys
+import shutil
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from coqstoq import get_theorem_list
+from coqstoq.eval_thms import EvalTheorem, Project
+from coqstoq.deps import DepGraph, CoqDepError
+
+
+@dataclass
+class PreflightIssue:
+    project: Project
+    path: Path  # Source file relative to the workspace, or "."
+    message: str
+
+    def __str__(self) -> str:
+        if self.path.suffix != ".v":
+            return f"{self.project.workspace}: {self.message}"
+        vo_loc = self.project.workspace / self.path.with_suffix(".vo")
+        return f"{vo_loc}: {self.message}"
+
+
+def group_by_project(thms: list[EvalTheorem]) -> dict[str, tuple[Project, list[Path]]]:
+    projects: dict[str, tuple[Project, list[Path]]] = {}
+    for thm in thms:
+        _, paths = projects.setdefault(thm.project.dir_name, (thm.project, []))
+        if thm.path not in paths:
+            paths.append(thm.path)
+    return projects
+
+
+def check_vo(graph: DepGraph, path: Path) -> Optional[PreflightIssue]:
+    workspace = graph.project.workspace
+    vo_loc = workspace / path.with_suffix(".vo")
+    if not vo_loc.exists():
+        return PreflightIssue(graph.project, path, "not built")
+    vo_mtime = vo_loc.stat().st_mtime
+    if vo_mtime < (workspace / path).stat().st_mtime:
+        return PreflightIssue(graph.project, path, "built before its source changed")
+    for dep in graph.get_deps(path):
+        dep_vo_loc = workspace / dep.with_suffix(".vo")
+        if dep_vo_loc.exists() and vo_mtime < dep_vo_loc.stat().st_mtime:
+            return PreflightIssue(
+                graph.project, path, f"built before its dependency {dep}"
+            )
+    return None
+
+
+def preflight_project(
+    project: Project, paths: list[Path], n_workers: int
+) -> list[PreflightIssue]:
+    if not project.workspace.exists():
+        return [PreflightIssue(project, Path("."), "workspace does not exist")]
+    graph = DepGraph(project)
+    try:
+        required = graph.closure(paths, n_workers)
+    except CoqDepError as e:
+        return [PreflightIssue(project, Path("."), f"coqdep failed: {e}")]
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        issues = executor.map(lambda p: check_vo(graph, p), sorted(required))
+        return [i for i in issues if i is not None]
+
+
+def preflight(thms: list[EvalTheorem], n_workers: int) -> list[PreflightIssue]:
+    projects = group_by_project(thms)
+    if 0 == len(projects):
+        return []
+    issues: list[PreflightIssue] = []
+    first_project, _ = next(iter(projects.values()))
+    for tool in ["coqc", "coqdep"]:
+        if shutil.which(tool) is None:
+            issues.append(
+                PreflightIssue(
+                    first_project,
+                    Path("."),
+                    f"`{tool}` not found. Activate the coqstoq opam switch.",
+                )
+            )
+    if 0 < len(issues):
+        return issues
+    for project, paths in projects.values():
+        issues.extend(preflight_project(project, paths, n_workers))
+    return issues
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check that the libraries needed by a split have been built."
+    )
+    parser.add_argument("split_name", type=str, help="Name of the split (e.g. test).")
+    parser.add_argument("--start", type=int, default=None)
+    parser.add_argument("--stop", type=int, default=None)
+    parser.add_argument("--n_workers", type=int, default=8)
+    args = parser.parse_args()
+
+    thms = get_theorem_list(args.split_name, Path.cwd())[args.start : args.stop]
+    issues = preflight(thms, args.n_workers)
+    if 0 == len(issues):
+        print(f"All libraries needed by {len(thms)} theorems are built.")
+        sys.exit(0)
+
+    print(f"Found {len(issues)} problems:")
+    for issue in issues:
+        print(f"\t{issue}")
+    print(
+        "Rebuild the affected projects with `python3 coqstoq/build_projects.py` "
+        "before checking."
+    )
+    sys.exit(1)
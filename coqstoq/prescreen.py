@@ -0,0 +1,149 @@
+"""
+Cheap lexical screening of proof attempts. Attempts that can never be valid
+are rejected before any `coqc` process is spawned.
+
+Comments and strings are skipped, so screening only looks at the sentences
+Coq would execute. Bullets are not screened: whether a bullet is valid
+depends on the number of goals, which is only known to Coq.
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+from enum import Enum
+from dataclasses import dataclass
+
+
+class RejectReason(Enum):
+    NO_PROOF = "no_proof"
+    EMPTY = "empty"
+    ADMITTED = "admitted"  # Uses `admit`, `give_up` or `Admitted`
+    ABORTED = "aborted"
+    NEW_AXIOM = "new_axiom"
+    UNBALANCED_BRACES = "unbalanced_braces"
+    NO_TERMINATOR = "no_terminator"
+
+
+ADMIT_TOKENS = {"admit", "give_up", "Admitted"}
+ADMIT_SENTENCE_TOKENS = {"Admit"}  # Admit Obligations
+ABORT_SENTENCE_TOKENS = {"Abort"}
+AXIOM_TOKENS = {
+    "Axiom",
+    "Axioms",
+    "Conjecture",
+    "Conjectures",
+    "Parameter",
+    "Parameters",
+}
+TERMINATORS = {".", "}"}
+
+
+def strip_qed(proof_attempt: str) -> str:
+    stripped_proof = proof_attempt.strip()
+    if stripped_proof.endswith("Qed."):
+        return stripped_proof[: -len("Qed.")]
+    return stripped_proof
+
+
+@dataclass
+class Token:
+    text: str
+    sentence_start: bool  # First token of a sentence
+    offset: int  # Index of the token in the text
+
+
+def is_ident_char(c: str) -> bool:
+    return c.isalnum() or c == "_" or c == "'"
+
+
+def tokenize(proof: str) -> list[Token]:
+    """
+    Splits `proof` into identifiers and single punctuation characters,
+    skipping whitespace, (nested) comments and strings. Unterminated
+    comments and strings are kept as a `(*` or `"` token.
+    """
+    tokens: list[Token] = []
+    sentence_start = True
+    i = 0
+    n = len(proof)
+    while i < n:
+        c = proof[i]
+        start = i
+        if proof.startswith("(*", i):
+            depth = 1
+            i += 2
+            while i < n and 0 < depth:
+                if proof.startswith("(*", i):
+                    depth += 1
+                    i += 2
+                elif proof.startswith("*)", i):
+                    depth -= 1
+                    i += 2
+                else:
+                    i += 1
+            if 0 < depth:
+                tokens.append(Token("(*", sentence_start, start))  # Unterminated
+        elif c == '"':
+            i += 1
+            terminated = False
+            while i < n:
+                if proof.startswith('""', i):
+                    i += 2
+                elif proof[i] == '"':
+                    i += 1
+                    terminated = True
+                    break
+                else:
+                    i += 1
+            tokens.append(Token('""' if terminated else '"', sentence_start, start))
+            sentence_start = False
+        elif c.isspace():
+            i += 1
+        elif is_ident_char(c):
+            while i < n and (
+                is_ident_char(proof[i])
+                or (proof[i] == "." and i + 1 < n and is_ident_char(proof[i + 1]))
+            ):
+                i += 1
+            tokens.append(Token(proof[start:i], sentence_start, start))
+            sentence_start = False
+        else:
+            tokens.append(Token(c, sentence_start, start))
+            sentence_start = c == "." and (i + 1 == n or proof[i + 1].isspace())
+            i += 1
+    return tokens
+
+
+def check_balanced(tokens: list[Token], open: str, close: str) -> bool:
+    depth = 0
+    for t in tokens:
+        if t.text == open:
+            depth += 1
+        elif t.text == close:
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+
+def prescreen(proof: Optional[str]) -> Optional[RejectReason]:
+    """Returns why `proof` can never be valid, or None if it must be compiled."""
+    if proof is None:
+        return RejectReason.NO_PROOF
+    tokens = tokenize(strip_qed(proof))
+    if len(tokens) == 0:
+        return RejectReason.EMPTY
+    for t in tokens:
+        if t.text in ADMIT_TOKENS:
+            return RejectReason.ADMITTED
+        if t.sentence_start and t.text in ADMIT_SENTENCE_TOKENS:
+            return RejectReason.ADMITTED
+        if t.sentence_start and t.text in ABORT_SENTENCE_TOKENS:
+            return RejectReason.ABORTED
+        if t.sentence_start and t.text in AXIOM_TOKENS:
+            return RejectReason.NEW_AXIOM
+    if not check_balanced(tokens, "{", "}"):
+        return RejectReason.UNBALANCED_BRACES
+    if tokens[-1].text not in TERMINATORS:
+        return RejectReason.NO_TERMINATOR
+    return None
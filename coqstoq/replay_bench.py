@@ -0,0 +1,310 @@
+"""
+End-to-end benchmark of the checker. Every ground truth proof of a split (or
+of a sample of it) is checked, along with a negative attempt that leaves the
+goal open. Verdicts and per-theorem check times are saved to a baseline file,
+and a later run can be compared against it to catch both correctness and
+throughput regressions.
+"""
+
+from __future__ import annotations
+from typing import Any, Optional
+
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from coqstoq import get_theorem_list
+from coqstoq.eval_thms import compile_file
+from coqstoq.check import Result, check_result, get_ground_truth
+from coqstoq.batch_check import Attempt, group_attempts, check_attempts
+from coqstoq.source_index import load_source
+from coqstoq.timing import calibrate, hardware_description
+
+# An empty proof is rejected by prescreening without running coqc, so the
+# negative attempt is the smallest proof that reaches the checker.
+NEGATIVE_PROOF = "Proof."
+
+
+@dataclass
+class BenchEntry:
+    idx: int  # Index of the theorem in the split
+    kind: str  # ground_truth or negative
+    valid: bool
+    time: float  # Seconds; shared evenly within a batch
+
+    @property
+    def expected(self) -> bool:
+        return self.kind == "ground_truth"
+
+    def to_json(self) -> Any:
+        return {
+            "idx": self.idx,
+            "kind": self.kind,
+            "valid": self.valid,
+            "time": self.time,
+        }
+
+    @classmethod
+    def from_json(cls, json_data: Any) -> BenchEntry:
+        return cls(
+            json_data["idx"],
+            json_data["kind"],
+            json_data["valid"],
+            json_data["time"],
+        )
+
+
+@dataclass
+class BenchReport:
+    split_name: str
+    backend: str
+    hardware: str
+    calibration: float
+    total_time: float
+    entries: list[BenchEntry]
+
+    def to_json(self) -> Any:
+        return {
+            "split_name": self.split_name,
+            "backend": self.backend,
+            "hardware": self.hardware,
+            "calibration": self.calibration,
+            "total_time": self.total_time,
+            "entries": [e.to_json() for e in self.entries],
+        }
+
+    @classmethod
+    def from_json(cls, json_data: Any) -> BenchReport:
+        return cls(
+            json_data["split_name"],
+            json_data["backend"],
+            json_data["hardware"],
+            json_data["calibration"],
+            json_data["total_time"],
+            [BenchEntry.from_json(e) for e in json_data["entries"]],
+        )
+
+
+def bench_results(
+    split_name: str, idxs: list[int], coqstoq_loc: Path, negatives: bool
+) -> tuple[list[tuple[int, str]], list[Result]]:
+    thms = get_theorem_list(split_name, coqstoq_loc)
+    keys: list[tuple[int, str]] = []
+    results: list[Result] = []
+    for idx in idxs:
+        thm = thms[idx]
+        keys.append((idx, "ground_truth"))
+        results.append(Result(thm, get_ground_truth(thm, coqstoq_loc), None))
+        if negatives:
+            keys.append((idx, "negative"))
+            results.append(Result(thm, NEGATIVE_PROOF, None))
+    return keys, results
+
+
+def timed_check_result(r: Result, coqstoq_loc: Path) -> tuple[bool, float]:
+    start = time.time()
+    valid = check_result(r, coqstoq_loc)
+    return valid, time.time() - start
+
+
+def run_single(
+    results: list[Result], coqstoq_loc: Path, n_workers: int
+) -> tuple[list[bool], list[float]]:
+    """Checks each result with its own coqc run."""
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        checks = list(executor.map(lambda r: timed_check_result(r, coqstoq_loc), results))
+    return [valid for valid, _ in checks], [t for _, t in checks]
+
+
+def timed_check_group(
+    group: list[Attempt], coqstoq_loc: Path
+) -> list[tuple[int, bool, float]]:
+    start = time.time()
+    thm = group[0].thm
+    orig_file_loc = coqstoq_loc / thm.project.workspace / thm.path
+    source = load_source(orig_file_loc)
+    assert source.hash == thm.hash, f"Hash mismatch for file {orig_file_loc}"
+    verdicts = check_attempts(source, group)
+    group_time = (time.time() - start) / len(group)
+    return [(i, verdict, group_time) for i, verdict in verdicts.items()]
+
+
+def run_batch(
+    results: list[Result], coqstoq_loc: Path, n_workers: int
+) -> tuple[list[bool], list[float]]:
+    """
+    Checks all attempts at theorems of the same file together (see
+    batch_check.py). The time of a batch is shared evenly by its attempts.
+    """
+    groups = group_attempts(results)
+    projects = {
+        coqstoq_loc / g[0].thm.project.workspace / g[0].thm.path: g[0].thm.project
+        for g in groups
+    }
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        # Originals must compile. They are compiled first so they are not timed.
+        list(executor.map(lambda p: compile_file(projects[p], p, None), projects))
+        group_checks = list(
+            executor.map(lambda g: timed_check_group(g, coqstoq_loc), groups)
+        )
+    verdicts = [False for _ in results]
+    times = [0.0 for _ in results]
+    for checks in group_checks:
+        for i, verdict, check_time in checks:
+            verdicts[i] = verdict
+            times[i] = check_time
+    return verdicts, times
+
+
+BACKENDS = {"batch": run_batch, "single": run_single}
+
+
+def run_bench(
+    split_name: str,
+    idxs: list[int],
+    coqstoq_loc: Path,
+    backend: str,
+    n_workers: int,
+    negatives: bool,
+) -> BenchReport:
+    keys, results = bench_results(split_name, idxs, coqstoq_loc, negatives)
+    calibration = calibrate()
+    start = time.time()
+    verdicts, times = BACKENDS[backend](results, coqstoq_loc, n_workers)
+    total_time = time.time() - start
+    entries = [
+        BenchEntry(idx, kind, valid, t)
+        for (idx, kind), valid, t in zip(keys, verdicts, times)
+    ]
+    return BenchReport(
+        split_name,
+        backend,
+        hardware_description(),
+        calibration,
+        total_time,
+        entries,
+    )
+
+
+def unexpected_entries(report: BenchReport) -> list[BenchEntry]:
+    return [e for e in report.entries if e.valid != e.expected]
+
+
+def compare_reports(
+    report: BenchReport,
+    baseline: BenchReport,
+    max_slowdown: float,
+    min_delta: float,
+) -> list[str]:
+    """
+    Differences between the verdicts of the reports, and slowdowns beyond
+    `max_slowdown`. Times are normalized by the calibration of each machine.
+    Per-theorem slowdowns below `min_delta` seconds are ignored as noise.
+    """
+    problems: list[str] = []
+    baseline_entries = {(e.idx, e.kind): e for e in baseline.entries}
+    scale = baseline.calibration / report.calibration
+    for e in report.entries:
+        baseline_entry = baseline_entries.get((e.idx, e.kind))
+        if baseline_entry is None:
+            continue
+        if e.valid != baseline_entry.valid:
+            problems.append(
+                f"{e.kind} of theorem {e.idx}: valid={e.valid}, "
+                f"baseline valid={baseline_entry.valid}"
+            )
+        scaled_time = e.time * scale
+        if (
+            max_slowdown * baseline_entry.time < scaled_time
+            and min_delta < scaled_time - baseline_entry.time
+        ):
+            problems.append(
+                f"{e.kind} of theorem {e.idx}: {scaled_time:.2f}s, "
+                f"baseline {baseline_entry.time:.2f}s"
+            )
+    total_time = report.total_time * scale
+    if max_slowdown * baseline.total_time < total_time:
+        problems.append(
+            f"Total time {total_time:.2f}s, baseline {baseline.total_time:.2f}s"
+        )
+    return problems
+
+
+def sample_idxs(
+    num_thms: int,
+    start: Optional[int],
+    stop: Optional[int],
+    sample: Optional[int],
+    seed: int,
+) -> list[int]:
+    idxs = list(range(num_thms))[start:stop]
+    if sample is not None and sample < len(idxs):
+        idxs = sorted(random.Random(seed).sample(idxs, sample))
+    return idxs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check every ground truth proof of a split and time the checker."
+    )
+    parser.add_argument("split_name", type=str, help="Name of the split (e.g. test).")
+    parser.add_argument("--start", type=int, default=None)
+    parser.add_argument("--stop", type=int, default=None)
+    parser.add_argument(
+        "--sample", type=int, default=None, help="Number of theorems to sample."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="batch")
+    parser.add_argument("--n_workers", type=int, default=8)
+    parser.add_argument(
+        "--no_negatives", action="store_true", help="Only check ground truth proofs."
+    )
+    parser.add_argument(
+        "--save_loc", type=str, default=None, help="Where to save the report."
+    )
+    parser.add_argument(
+        "--baseline_loc", type=str, default=None, help="Report to compare against."
+    )
+    parser.add_argument("--max_slowdown", type=float, default=1.25)
+    parser.add_argument("--min_delta", type=float, default=1.0)
+    args = parser.parse_args()
+
+    num_thms = len(get_theorem_list(args.split_name, Path.cwd()))
+    idxs = sample_idxs(num_thms, args.start, args.stop, args.sample, args.seed)
+    report = run_bench(
+        args.split_name,
+        idxs,
+        Path.cwd(),
+        args.backend,
+        args.n_workers,
+        not args.no_negatives,
+    )
+    print(
+        f"Checked {len(report.entries)} attempts at {len(idxs)} theorems "
+        f"in {report.total_time:.2f}s "
+        f"({len(report.entries) / report.total_time:.2f} checks/s)."
+    )
+    if args.save_loc is not None:
+        with open(args.save_loc, "w") as fout:
+            fout.write(json.dumps(report.to_json(), indent=2))
+
+    problems = [
+        f"{e.kind} of theorem {e.idx}: valid={e.valid}"
+        for e in unexpected_entries(report)
+    ]
+    if args.baseline_loc is not None:
+        with open(args.baseline_loc, "r") as fin:
+            baseline = BenchReport.from_json(json.load(fin))
+        problems.extend(
+            compare_reports(report, baseline, args.max_slowdown, args.min_delta)
+        )
+    if 0 < len(problems):
+        print(f"Found {len(problems)} problems:")
+        for problem in problems:
+            print(f"\t{problem}")
+        sys.exit(1)
@@ -0,0 +1,58 @@
+"""
+Isolated scratch directories for compiling files without writing into
+a project's workspace.
+"""
+
+from __future__ import annotations
+from typing import Iterator, Optional
+
+import os
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+
+SCRATCH_ENV_VAR = "COQSTOQ_SCRATCH_DIR"
+TMPFS_LOC = Path("/dev/shm")
+
+# Flags whose next argument is a physical directory.
+LOAD_PATH_FLAGS = ["-R", "-Q", "-I"]
+
+
+def scratch_root() -> Path:
+    """Prefers $COQSTOQ_SCRATCH_DIR, then tmpfs, then the system temp directory."""
+    env_root = os.environ.get(SCRATCH_ENV_VAR)
+    if env_root is not None:
+        return Path(env_root)
+    if TMPFS_LOC.is_dir() and os.access(TMPFS_LOC, os.W_OK):
+        return TMPFS_LOC
+    return Path(tempfile.gettempdir())
+
+
+@contextmanager
+def scratch_dir(prefix: str, root: Optional[Path] = None) -> Iterator[Path]:
+    scratch_loc = root if root is not None else scratch_root()
+    os.makedirs(scratch_loc, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix=f"coqstoq-{prefix}-", dir=scratch_loc) as d:
+        yield Path(d)
+
+
+def absolute_compile_args(compile_args: list[str], workspace: Path) -> list[str]:
+    """
+    Rewrites the physical directories of `-R`, `-Q` and `-I` so that the
+    logical paths of the project resolve from any working directory.
+    """
+    abs_workspace = workspace.resolve()
+    new_args: list[str] = []
+    i = 0
+    while i < len(compile_args):
+        arg = compile_args[i]
+        new_args.append(arg)
+        if arg in LOAD_PATH_FLAGS and i + 1 < len(compile_args):
+            new_args.append(str((abs_workspace / compile_args[i + 1]).resolve()))
+            i += 2
+        elif arg == "-arg" and i + 1 < len(compile_args):
+            new_args.append(compile_args[i + 1])
+            i += 2
+        else:
+            i += 1
+    return new_args
@@ -0,0 +1,294 @@
+"""
+A long-running checking server. It keeps the theorem lists of splits, the
+source file cache, and a pool of checking workers warm between requests.
+
+Requests and responses are single-line JSON objects sent over a Unix socket:
+  {"op": "check", "split": "test", "idx": 3, "proof": "..."}
+  {"op": "check", "thm": <EvalTheorem json>, "proof": "..."}
+  {"op": "lookup", "split": "test", "idx": 3}
+  {"op": "stats"}
+Every response has an "ok" field. When the number of queued checks reaches
+the queue depth limit, checks are rejected with {"ok": false, "busy": true}.
+"""
+
+from __future__ import annotations
+from typing import Any, Optional
+
+import os
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from coqstoq import get_theorem_list
+from coqstoq.eval_thms import EvalTheorem
+from coqstoq.check import Result, check_result
+from coqstoq.verdict_cache import VerdictCache
+
+DEFAULT_SOCKET_LOC = Path("/tmp/coqstoq.sock")
+
+
+class ServerBusyError(Exception):
+    pass
+
+
+class ServerError(Exception):
+    pass
+
+
+class CheckServer:
+    def __init__(
+        self,
+        coqstoq_loc: Path,
+        n_workers: int,
+        max_queue_depth: int,
+        cache: Optional[VerdictCache] = None,
+    ):
+        self.coqstoq_loc = coqstoq_loc
+        self.cache = cache
+        self.max_queue_depth = max_queue_depth
+        self.executor = ThreadPoolExecutor(max_workers=n_workers)
+        self.splits: dict[str, list[EvalTheorem]] = {}
+        self.split_loads: dict[str, Future[list[EvalTheorem]]] = {}
+        self.lock = threading.Lock()
+        self.queue_depth = 0
+        self.num_checked = 0
+        self.num_rejected = 0
+
+    def load_split(self, split_name: str) -> list[EvalTheorem]:
+        return get_theorem_list(split_name, self.coqstoq_loc)
+
+    def get_split(self, split_name: str) -> list[EvalTheorem]:
+        """
+        Loads each split once. The first request for a split loads it outside
+        the lock; concurrent requests for it wait for that load.
+        """
+        with self.lock:
+            split_load = self.split_loads.get(split_name)
+            is_loader = split_load is None
+            if split_load is None:
+                split_load = Future()
+                self.split_loads[split_name] = split_load
+        if not is_loader:
+            return split_load.result()
+        try:
+            split_thms = self.load_split(split_name)
+        except BaseException as e:
+            with self.lock:
+                del self.split_loads[split_name]  # Later requests retry
+            split_load.set_exception(e)
+            raise
+        with self.lock:
+            self.splits[split_name] = split_thms
+        split_load.set_result(split_thms)
+        return split_thms
+
+    def get_thm(self, request: Any) -> EvalTheorem:
+        if "thm" in request:
+            return EvalTheorem.from_json(request["thm"])
+        return self.get_split(request["split"])[request["idx"]]
+
+    def check(self, request: Any) -> Any:
+        thm = self.get_thm(request)
+        with self.lock:
+            if self.max_queue_depth <= self.queue_depth:
+                self.num_rejected += 1
+                return {"ok": False, "busy": True, "error": "Check queue is full."}
+            self.queue_depth += 1
+        submitted = time.time()
+        try:
+            result = Result(thm, request["proof"], None)
+            future = self.executor.submit(self.timed_check, result, submitted)
+            valid, queue_time, check_time = future.result()
+        finally:
+            with self.lock:
+                self.queue_depth -= 1
+                self.num_checked += 1
+        return {
+            "ok": True,
+            "valid": valid,
+            "queue_time": queue_time,
+            "check_time": check_time,
+        }
+
+    def timed_check(
+        self, result: Result, submitted: float
+    ) -> tuple[bool, float, float]:
+        start = time.time()
+        valid = self.check_proof(result)
+        return valid, start - submitted, time.time() - start
+
+    def check_proof(self, result: Result) -> bool:
+        return check_result(result, self.coqstoq_loc, self.cache)
+
+    def stats(self) -> Any:
+        with self.lock:
+            return {
+                "ok": True,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "num_checked": self.num_checked,
+                "num_rejected": self.num_rejected,
+                "loaded_splits": sorted(self.splits),
+                "verdict_cache": None if self.cache is None else self.cache.stats(),
+            }
+
+    def handle(self, request: Any) -> Any:
+        try:
+            match request.get("op"):
+                case "check":
+                    return self.check(request)
+                case "lookup":
+                    return {"ok": True, "thm": self.get_thm(request).to_json()}
+                case "stats":
+                    return self.stats()
+                case op:
+                    return {"ok": False, "error": f"Unknown op {op}."}
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    server: CheckSocketServer
+
+    def handle(self):
+        for line in self.rfile:
+            if len(line.strip()) == 0:
+                continue
+            try:
+                request = json.loads(line)
+                response = self.server.check_server.handle(request)
+            except json.JSONDecodeError as e:
+                response = {"ok": False, "error": f"Invalid request: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+
+class CheckSocketServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_loc: Path, check_server: CheckServer):
+        self.check_server = check_server
+        super().__init__(str(socket_loc), RequestHandler)
+
+
+def serve(
+    socket_loc: Path,
+    coqstoq_loc: Path,
+    n_workers: int,
+    max_queue_depth: int,
+    preload_splits: list[str],
+    cache: Optional[VerdictCache] = None,
+):
+    check_server = CheckServer(coqstoq_loc, n_workers, max_queue_depth, cache)
+    for split_name in preload_splits:
+        split_thms = check_server.get_split(split_name)
+        print(f"Loaded {len(split_thms)} theorems from {split_name}.")
+    if socket_loc.exists():
+        os.remove(socket_loc)
+    with CheckSocketServer(socket_loc, check_server) as server:
+        print(f"Serving on {socket_loc}.")
+        try:
+            server.serve_forever()
+        finally:
+            check_server.executor.shutdown(cancel_futures=True)
+            os.remove(socket_loc)
+
+
+class CheckClient:
+    """Client for a running check server. One client per thread."""
+
+    def __init__(self, socket_loc: Path = DEFAULT_SOCKET_LOC, max_retries: int = 8):
+        self.socket_loc = socket_loc
+        self.max_retries = max_retries
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(str(socket_loc))
+        self.fin = self.sock.makefile("rb")
+
+    def request(self, request: Any) -> Any:
+        self.sock.sendall((json.dumps(request) + "\n").encode())
+        line = self.fin.readline()
+        if len(line) == 0:
+            raise ServerError("Server closed the connection.")
+        response = json.loads(line)
+        if response.get("busy", False):
+            raise ServerBusyError(response["error"])
+        if not response["ok"]:
+            raise ServerError(response["error"])
+        return response
+
+    def request_with_retries(self, request: Any) -> Any:
+        """Retries with exponential backoff while the server is busy."""
+        wait = 0.1
+        for _ in range(self.max_retries):
+            try:
+                return self.request(request)
+            except ServerBusyError:
+                time.sleep(wait)
+                wait *= 2
+        return self.request(request)
+
+    def check(self, thm: EvalTheorem, proof: Optional[str]) -> bool:
+        response = self.request_with_retries(
+            {"op": "check", "thm": thm.to_json(), "proof": proof}
+        )
+        return response["valid"]
+
+    def check_idx(self, split_name: str, idx: int, proof: Optional[str]) -> bool:
+        response = self.request_with_retries(
+            {"op": "check", "split": split_name, "idx": idx, "proof": proof}
+        )
+        return response["valid"]
+
+    def lookup(self, split_name: str, idx: int) -> EvalTheorem:
+        response = self.request({"op": "lookup", "split": split_name, "idx": idx})
+        return EvalTheorem.from_json(response["thm"])
+
+    def stats(self) -> Any:
+        return self.request({"op": "stats"})
+
+    def close(self):
+        self.fin.close()
+        self.sock.close()
+
+    def __enter__(self) -> CheckClient:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve proof checks over a Unix socket.")
+    parser.add_argument("--socket_loc", type=str, default=str(DEFAULT_SOCKET_LOC))
+    parser.add_argument("--n_workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--max_queue_depth",
+        type=int,
+        default=None,
+        help="Maximum number of queued and running checks. Defaults to 4 * n_workers.",
+    )
+    parser.add_argument(
+        "--splits",
+        nargs="*",
+        default=[],
+        help="Names of splits to load on startup (e.g. test val).",
+    )
+    parser.add_argument(
+        "--cache_loc", type=str, default=None, help="Path to a verdict cache."
+    )
+    args = parser.parse_args()
+
+    max_queue_depth = args.max_queue_depth or 4 * args.n_workers
+    serve(
+        Path(args.socket_loc),
+        Path.cwd(),
+        args.n_workers,
+        max_queue_depth,
+        args.splits,
+        VerdictCache(Path(args.cache_loc)) if args.cache_loc else None,
+    )
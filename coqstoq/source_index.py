@@ -0,0 +1,63 @@
+"""
+Cached source files with a line-offset index, so that turning a `Position`
+into text is a slice of the file contents rather than a re-split of the file.
+"""
+
+from __future__ import annotations
+
+import io
+import hashlib
+import functools
+from pathlib import Path
+from dataclasses import dataclass
+
+from coqstoq.eval_thms import Position
+
+SOURCE_CACHE_SIZE = 256
+
+
+@dataclass
+class SourceFile:
+    contents: str  # Contents as returned by `Path.read_text`
+    hash: str  # Same as `get_file_hash`
+    line_starts: list[int]
+
+    def line_end(self, line: int) -> int:
+        if line + 1 < len(self.line_starts):
+            return self.line_starts[line + 1] - 1
+        return len(self.contents)
+
+    def offset(self, pos: Position) -> int:
+        """Columns past the end of a line are clamped to the end of the line."""
+        line_start = self.line_starts[pos.line]
+        return min(line_start + pos.column, self.line_end(pos.line))
+
+    def span(self, start: Position, end: Position) -> str:
+        return self.contents[self.offset(start) : self.offset(end)]
+
+    def before(self, pos: Position) -> str:
+        return self.contents[: self.offset(pos)]
+
+    def after(self, pos: Position) -> str:
+        return self.contents[self.offset(pos) :]
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> SourceFile:
+        contents = io.TextIOWrapper(io.BytesIO(data)).read()
+        line_starts = [0]
+        newline_idx = contents.find("\n")
+        while newline_idx != -1:
+            line_starts.append(newline_idx + 1)
+            newline_idx = contents.find("\n", newline_idx + 1)
+        return cls(contents, hashlib.sha256(data).hexdigest(), line_starts)
+
+
+@functools.lru_cache(maxsize=SOURCE_CACHE_SIZE)
+def _load_cached_source(path: str, mtime_ns: int, size: int) -> SourceFile:
+    return SourceFile.from_bytes(Path(path).read_bytes())
+
+
+def load_source(path: Path) -> SourceFile:
+    """Loads a file through the cache. Modified files are reloaded."""
+    stat = path.stat()
+    return _load_cached_source(str(path.resolve()), stat.st_mtime_ns, stat.st_size)
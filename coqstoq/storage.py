@@ -0,0 +1,188 @@
+"""
+Reading and writing theorem data that may be compressed.
+
+Theorem files and reference lists are always referred to by their logical
+`.json` path. On disk they may be stored as `.json`, `.json.gz` or `.json.xz`;
+the compression is detected from the file contents.
+"""
+
+from __future__ import annotations
+from typing import Any, Iterator, Optional
+
+import os
+import gzip
+import lzma
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+from coqstoq.eval_thms import Split
+
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+COMPRESSION_SUFFIXES = {"gz": ".gz", "xz": ".xz"}
+
+
+def logical_data_loc(path: Path) -> Path:
+    """Strips the compression suffix of a data file."""
+    if path.suffix in COMPRESSION_SUFFIXES.values():
+        return path.with_suffix("")
+    return path
+
+
+def resolve_data_loc(path: Path) -> Path:
+    """The file on disk storing the data of the logical path `path`."""
+    if path.exists():
+        return path
+    for suffix in COMPRESSION_SUFFIXES.values():
+        compressed_loc = path.with_name(path.name + suffix)
+        if compressed_loc.exists():
+            return compressed_loc
+    return path
+
+
+def data_loc_exists(path: Path) -> bool:
+    return resolve_data_loc(path).exists()
+
+
+def stored_compression(path: Path) -> Optional[str]:
+    """Compression of the stored version of the logical path `path`, if any."""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if resolve_data_loc(path).name == path.name + suffix:
+            return compression
+    return None
+
+
+def decompress(data: bytes) -> bytes:
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    if data.startswith(XZ_MAGIC):
+        return lzma.decompress(data)
+    return data
+
+
+def load_json(path: Path) -> Any:
+    return json.loads(decompress(resolve_data_loc(path).read_bytes()))
+
+
+def dump_json(data: Any, path: Path, compression: Optional[str]) -> Path:
+    """
+    Writes `data` to the logical path `path`, replacing any other stored
+    version of it. Returns the location written to.
+    """
+    if compression is None:
+        save_loc = path
+        contents = json.dumps(data, indent=2).encode()
+    else:
+        save_loc = path.with_name(path.name + COMPRESSION_SUFFIXES[compression])
+        raw_contents = json.dumps(data, separators=(",", ":")).encode()
+        if compression == "gz":
+            contents = gzip.compress(raw_contents, mtime=0)
+        else:
+            contents = lzma.compress(raw_contents)
+    save_loc.write_bytes(contents)
+    for other_loc in [path] + [
+        path.with_name(path.name + s) for s in COMPRESSION_SUFFIXES.values()
+    ]:
+        if other_loc != save_loc and other_loc.exists():
+            os.remove(other_loc)
+    return save_loc
+
+
+def iter_data_files(dir: Path) -> Iterator[Path]:
+    """
+    Yields the stored location of every (possibly compressed) json file. A
+    logical path stored in several formats is yielded once, as the file
+    `load_json` reads.
+    """
+    seen: set[Path] = set()
+    for path in sorted(dir.glob("**/*.json*")):
+        logical_loc = logical_data_loc(path)
+        if logical_loc.suffix == ".json" and logical_loc not in seen:
+            seen.add(logical_loc)
+            yield resolve_data_loc(logical_loc)
+
+
+def repack_split(split: Split, coqstoq_loc: Path, compression: Optional[str]):
+    for thm_file_loc in list(iter_data_files(coqstoq_loc / split.thm_dir_name)):
+        logical_loc = logical_data_loc(thm_file_loc)
+        dump_json(load_json(thm_file_loc), logical_loc, compression)
+    theorem_list_loc = coqstoq_loc / split.theorem_list_loc
+    dump_json(load_json(theorem_list_loc), theorem_list_loc, compression)
+
+
+def dir_size(dir: Path) -> int:
+    return sum(p.stat().st_size for p in dir.glob("**/*") if p.is_file())
+
+
+def drop_page_cache(dir: Path) -> bool:
+    """Evicts the files in `dir` from the page cache, where supported."""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in dir.glob("**/*"):
+        if path.is_file():
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)  # Dirty pages are not evicted
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def bench_split(split_name: str, coqstoq_loc: Path):
+    """
+    Size and load time of the split in each storage format. Load times are
+    cold-cache where the page cache can be dropped and labeled warm otherwise.
+    """
+    from coqstoq import get_theorem_list
+
+    split = Split.from_name(split_name)
+    print(f"<<<<< Split: {split.thm_dir_name} >>>>>")
+    for compression in [None, "gz", "xz"]:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp_loc = Path(tmp)
+            shutil.copytree(
+                coqstoq_loc / split.thm_dir_name, tmp_loc / split.thm_dir_name
+            )
+            theorem_list_loc = resolve_data_loc(coqstoq_loc / split.theorem_list_loc)
+            shutil.copy(theorem_list_loc, tmp_loc / theorem_list_loc.name)
+            repack_split(split, tmp_loc, compression)
+            size = dir_size(tmp_loc)
+            cache = "cold" if drop_page_cache(tmp_loc) else "warm"
+            start = time.perf_counter()
+            thms = get_theorem_list(split_name, tmp_loc)
+            load_time = time.perf_counter() - start
+        print(
+            f"{compression or 'json'}: {size / 2**20:.2f} MiB; loaded {len(thms)} theorems in {load_time:.2f}s ({cache} cache)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Repack theorem files and reference lists, or benchmark storage formats."
+    )
+    parser.add_argument("command", choices=["repack", "bench"])
+    parser.add_argument("split_names", nargs="+", help="Names of the splits (e.g. test).")
+    parser.add_argument(
+        "--compression",
+        choices=["none", "gz", "xz"],
+        default="xz",
+        help="Storage format to repack to.",
+    )
+    args = parser.parse_args()
+
+    from coqstoq.manifest import write_manifest
+
+    for split_name in args.split_names:
+        split = Split.from_name(split_name)
+        if args.command == "repack":
+            compression = None if args.compression == "none" else args.compression
+            repack_split(split, Path.cwd(), compression)
+            write_manifest(split, Path.cwd())
+            print(f"Repacked {split.thm_dir_name} as {args.compression}.")
+        else:
+            bench_split(split_name, Path.cwd())
@@ -0,0 +1,239 @@
+"""
+Read-only packed table of the theorems of a split, shared between processes.
+
+`get_theorem_list` builds one `EvalTheorem` per theorem, and each process of a
+pool holds its own copy. A theorem table instead stores the positions and the
+ids of the path, project and file hash of each theorem as int32 columns, with
+the (few) distinct paths, projects and hashes in a json blob after them. The
+parent packs the table once into shared memory or a file; workers attach to
+it without copying and build `EvalTheorem`s only when indexed.
+
+Layout: header (magic, version, number of theorems, blob length), then one
+int32 column per entry of COLUMNS, then the blob.
+
+A table passed to a worker (e.g. through `initargs`) is attached again rather
+than copied. Shared memory tables are only valid while their owner is alive
+and should only be attached by processes it started, since other processes
+would unlink the memory on exit. Use a table file to share a table with
+independent processes.
+"""
+
+from __future__ import annotations
+from typing import Any, Iterator, Optional
+
+import mmap
+import json
+import time
+import struct
+import weakref
+import argparse
+from pathlib import Path
+from multiprocessing import shared_memory
+
+from coqstoq import get_theorem_list, get_split_val
+from coqstoq.eval_thms import EvalTheorem, Project, Position
+
+MAGIC = b"CQTT"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")  # magic, version, num_thms, blob_len
+COLUMNS = [
+    "theorem_start_line",
+    "theorem_start_column",
+    "theorem_end_line",
+    "theorem_end_column",
+    "proof_start_line",
+    "proof_start_column",
+    "proof_end_line",
+    "proof_end_column",
+    "path_id",
+    "project_id",
+    "hash_id",
+]
+INT32_SIZE = 4
+POS_FIELDS = ["theorem_start_pos", "theorem_end_pos", "proof_start_pos", "proof_end_pos"]
+
+
+def pack_theorems(thms: list[EvalTheorem]) -> bytes:
+    paths: dict[str, int] = {}
+    projects: dict[str, int] = {}
+    hashes: dict[str, int] = {}
+    project_data: list[Any] = []
+    columns: list[list[int]] = [[] for _ in COLUMNS]
+    for thm in thms:
+        for i, pos_field in enumerate(POS_FIELDS):
+            pos: Position = getattr(thm, pos_field)
+            columns[2 * i].append(pos.line)
+            columns[2 * i + 1].append(pos.column)
+        project_json = thm.project.to_json()
+        project_key = json.dumps(project_json)
+        if project_key not in projects:
+            projects[project_key] = len(projects)
+            project_data.append(project_json)
+        columns[-3].append(paths.setdefault(str(thm.path), len(paths)))
+        columns[-2].append(projects[project_key])
+        columns[-1].append(hashes.setdefault(thm.hash, len(hashes)))
+    blob = json.dumps(
+        {"paths": list(paths), "projects": project_data, "hashes": list(hashes)}
+    ).encode()
+    packed_columns = b"".join(
+        struct.pack(f"<{len(thms)}i", *column) for column in columns
+    )
+    return HEADER.pack(MAGIC, VERSION, len(thms), len(blob)) + packed_columns + blob
+
+
+class TheoremTable:
+    def __init__(
+        self,
+        buf: memoryview,
+        kind: str,
+        loc: Optional[str],
+        owner: Any = None,
+    ):
+        magic, version, num_thms, blob_len = HEADER.unpack_from(buf)
+        assert magic == MAGIC, "Not a theorem table."
+        assert version == VERSION, f"Unsupported theorem table version {version}."
+        self.num_thms = num_thms
+        self.kind = kind  # bytes, shm or file
+        self.loc = loc  # Name of the shared memory or path of the file
+        self.owner = owner  # SharedMemory or mmap backing `buf`, if any
+        self.buf = buf
+        self.columns: list[memoryview] = []
+        offset = HEADER.size
+        for _ in COLUMNS:
+            end = offset + INT32_SIZE * num_thms
+            self.columns.append(buf[offset:end].cast("i"))
+            offset = end
+        blob = json.loads(bytes(buf[offset : offset + blob_len]))
+        # Views must be released before their memory is closed, including
+        # when the table is still open at exit.
+        self.finalizer = weakref.finalize(
+            self, release_table, self.columns, self.buf, self.owner
+        )
+        self.paths = [Path(p) for p in blob["paths"]]
+        self.projects = [Project.from_json(p) for p in blob["projects"]]
+        self.hashes: list[str] = blob["hashes"]
+
+    def __len__(self) -> int:
+        return self.num_thms
+
+    def __getitem__(self, idx: int) -> EvalTheorem:
+        if idx < 0:
+            idx += self.num_thms
+        if not 0 <= idx < self.num_thms:
+            raise IndexError(f"Theorem index {idx} out of range.")
+        c = self.columns
+        return EvalTheorem(
+            self.projects[c[-2][idx]],
+            self.paths[c[-3][idx]],
+            Position(c[0][idx], c[1][idx]),
+            Position(c[2][idx], c[3][idx]),
+            Position(c[4][idx], c[5][idx]),
+            Position(c[6][idx], c[7][idx]),
+            self.hashes[c[-1][idx]],
+        )
+
+    def __iter__(self) -> Iterator[EvalTheorem]:
+        for idx in range(self.num_thms):
+            yield self[idx]
+
+    def __reduce__(self) -> Any:
+        if self.kind == "shm":
+            return attach_shared_table, (self.loc,)
+        if self.kind == "file":
+            return open_table, (Path(self.loc),)
+        return table_from_bytes, (bytes(self.buf),)
+
+    def close(self):
+        """Releases the table. Theorems already built remain valid."""
+        self.finalizer()
+
+    def unlink(self):
+        """Frees the shared memory of a table created by `create_shared_table`."""
+        assert self.kind == "shm"
+        shm = shared_memory.SharedMemory(name=self.loc)
+        shm.close()
+        shm.unlink()
+
+    def __enter__(self) -> TheoremTable:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def release_table(columns: list[memoryview], buf: memoryview, owner: Any):
+    for column in columns:
+        column.release()
+    buf.release()
+    if owner is not None:
+        owner.close()
+
+
+def table_from_bytes(data: bytes) -> TheoremTable:
+    return TheoremTable(memoryview(data), "bytes", None)
+
+
+def create_shared_table(thms: list[EvalTheorem]) -> TheoremTable:
+    """Packs `thms` into new shared memory. The caller must `unlink` it."""
+    data = pack_theorems(thms)
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    shm.buf[: len(data)] = data
+    return TheoremTable(shm.buf, "shm", shm.name, shm)
+
+
+def attach_shared_table(name: str) -> TheoremTable:
+    shm = shared_memory.SharedMemory(name=name)
+    return TheoremTable(shm.buf, "shm", name, shm)
+
+
+def write_table(thms: list[EvalTheorem], path: Path):
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(pack_theorems(thms))
+    tmp_path.replace(path)
+
+
+def open_table(path: Path) -> TheoremTable:
+    """Maps the table file at `path`; pages are shared by all processes."""
+    with path.open("rb") as fin:
+        mapped = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+    return TheoremTable(memoryview(mapped), "file", str(path), mapped)
+
+
+def write_split_table(split_name: str, coqstoq_loc: Path) -> Path:
+    loc = coqstoq_loc / get_split_val(split_name).table_loc
+    write_table(get_theorem_list(split_name, coqstoq_loc), loc)
+    return loc
+
+
+def load_split_table(split_name: str, coqstoq_loc: Path) -> TheoremTable:
+    return open_table(coqstoq_loc / get_split_val(split_name).table_loc)
+
+
+_worker_table: Optional[TheoremTable] = None
+
+
+def set_worker_table(table: TheoremTable):
+    """Pool initializer: `initializer=set_worker_table, initargs=(table,)`."""
+    global _worker_table
+    _worker_table = table
+
+
+def get_worker_table() -> TheoremTable:
+    assert _worker_table is not None, "set_worker_table was not called."
+    return _worker_table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pack the theorems of a split into a shared theorem table."
+    )
+    parser.add_argument("split_name", type=str, help="Name of the split (e.g. test).")
+    args = parser.parse_args()
+
+    start = time.time()
+    loc = write_split_table(args.split_name, Path.cwd())
+    with load_split_table(args.split_name, Path.cwd()) as table:
+        print(
+            f"Packed {len(table)} theorems into {loc} "
+            f"({loc.stat().st_size / 2**20:.2f} MiB) in {time.time() - start:.2f}s."
+        )
@@ -0,0 +1,202 @@
+"""
+Harness for timing a tool on CoqStoq theorems consistently.
+
+The tool is a callback `EvalTheorem -> Optional[str]` returning a proof. The
+harness optionally pins itself (and so the processes the tool spawns) to a
+set of CPUs, times each call with wall clock or CPU time, and fills in the
+`hardware` description of the results. A fixed calibration workload is timed
+on each machine so that times from different machines can be normalized.
+"""
+
+from __future__ import annotations
+from typing import Callable, Optional
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import platform
+import resource
+import importlib
+from pathlib import Path
+
+from coqstoq import get_theorem_list
+from coqstoq.eval_thms import EvalTheorem
+from coqstoq.check import Result, EvalResults
+
+Tool = Callable[[EvalTheorem], Optional[str]]
+
+
+def read_proc_file(path: Path) -> dict[str, str]:
+    """Parses the `key : value` lines of a /proc file. First occurrence wins."""
+    fields: dict[str, str] = {}
+    if not path.exists():
+        return fields
+    for line in path.read_text().splitlines():
+        if ":" not in line:
+            continue
+        key, value = line.split(":", 1)
+        fields.setdefault(key.strip(), value.strip())
+    return fields
+
+
+def cpu_model() -> str:
+    cpuinfo = read_proc_file(Path("/proc/cpuinfo"))
+    return cpuinfo.get("model name") or platform.processor() or platform.machine()
+
+
+def total_memory() -> Optional[int]:
+    """Total memory in bytes."""
+    meminfo = read_proc_file(Path("/proc/meminfo"))
+    if "MemTotal" not in meminfo:
+        return None
+    amount, unit = meminfo["MemTotal"].split()
+    assert unit == "kB"
+    return int(amount) * 1024
+
+
+def get_cpus() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pin_cpus(cpus: list[int]):
+    """Restricts this process and its future children to `cpus`."""
+    os.sched_setaffinity(0, cpus)
+
+
+def hardware_description() -> str:
+    memory = total_memory()
+    memory_str = "unknown memory" if memory is None else f"{memory / 2**30:.1f} GiB"
+    cpus = get_cpus()
+    return (
+        f"{cpu_model()}; {len(cpus)} of {os.cpu_count()} CPUs ({cpus}); "
+        f"{memory_str}; {platform.system()} {platform.release()}; "
+        f"Python {platform.python_version()}"
+    )
+
+
+def calibration_workload():
+    digest = b""
+    for i in range(200_000):
+        digest = hashlib.sha256(digest + i.to_bytes(4, "little")).digest()
+    sorted(range(500_000, 0, -1), key=lambda x: x % 1000)
+
+
+def calibrate(n_rounds: int = 5) -> float:
+    """Fastest time of the calibration workload. Lower is a faster machine."""
+    times: list[float] = []
+    for _ in range(n_rounds):
+        start = time.perf_counter()
+        calibration_workload()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def cpu_seconds() -> float:
+    """CPU time of this process and its finished children."""
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (
+        self_usage.ru_utime
+        + self_usage.ru_stime
+        + children_usage.ru_utime
+        + children_usage.ru_stime
+    )
+
+
+def timed_call(tool: Tool, thm: EvalTheorem, cpu_time: bool) -> Result:
+    clock = cpu_seconds if cpu_time else time.perf_counter
+    start = clock()
+    proof = tool(thm)
+    return Result(thm, proof, clock() - start)
+
+
+def run_tool(
+    tool: Tool,
+    thms: list[EvalTheorem],
+    cpus: Optional[list[int]] = None,
+    cpu_time: bool = False,
+    n_calibration_rounds: int = 5,
+) -> EvalResults:
+    """Times `tool` on `thms`, pinned to `cpus` for the duration of the run."""
+    old_cpus = get_cpus()
+    if cpus is not None:
+        pin_cpus(cpus)
+    try:
+        calibration = calibrate(n_calibration_rounds)
+        results: list[Result] = []
+        for i, thm in enumerate(thms):
+            results.append(timed_call(tool, thm, cpu_time))
+            print(f"{i + 1}/{len(thms)}: {results[-1].time:.2f}s")
+        clock_name = "cpu time" if cpu_time else "wall time"
+        hardware = f"{hardware_description()}; {clock_name}"
+    finally:
+        if cpus is not None:
+            pin_cpus(old_cpus)
+    return EvalResults(hardware, results, calibration)
+
+
+def normalize_results(results: EvalResults, reference: float) -> EvalResults:
+    """Scales times as if they were measured where calibration took `reference`."""
+    assert results.calibration is not None, "Results have no calibration."
+    factor = reference / results.calibration
+    normalized = [
+        Result(r.thm, r.proof, None if r.time is None else r.time * factor)
+        for r in results.results
+    ]
+    return EvalResults(results.hardware, normalized, reference)
+
+
+def load_tool(tool_name: str) -> Tool:
+    """Loads a tool given as `module:function`."""
+    module_name, function_name = tool_name.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time a tool on CoqStoq theorems.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run a tool on a split.")
+    run_parser.add_argument("tool", type=str, help="Tool as `module:function`.")
+    run_parser.add_argument("split_name", type=str, help="Name of the split (e.g. test).")
+    run_parser.add_argument("save_loc", type=str, help="Where to save the EvalResults.")
+    run_parser.add_argument("--start", type=int, default=None)
+    run_parser.add_argument("--stop", type=int, default=None)
+    run_parser.add_argument(
+        "--cpus", type=int, nargs="*", default=None, help="CPUs to pin the tool to."
+    )
+    run_parser.add_argument(
+        "--cpu_time",
+        action="store_true",
+        help="Record CPU time, including child processes, instead of wall time.",
+    )
+
+    subparsers.add_parser("calibrate", help="Describe and calibrate this machine.")
+
+    normalize_parser = subparsers.add_parser(
+        "normalize", help="Rescale the times of results to a reference calibration."
+    )
+    normalize_parser.add_argument("results_loc", type=str)
+    normalize_parser.add_argument("reference", type=float)
+    normalize_parser.add_argument("save_loc", type=str)
+    args = parser.parse_args()
+
+    match args.command:
+        case "run":
+            thms = get_theorem_list(args.split_name, Path.cwd())[args.start : args.stop]
+            results = run_tool(load_tool(args.tool), thms, args.cpus, args.cpu_time)
+            with open(args.save_loc, "w") as fout:
+                fout.write(json.dumps(results.to_json(), indent=2))
+        case "calibrate":
+            print(hardware_description())
+            print(f"Calibration: {calibrate():.3f}s")
+        case "normalize":
+            with open(args.results_loc, "r") as fin:
+                results = EvalResults.from_json(json.load(fin))
+            normalized = normalize_results(results, args.reference)
+            with open(args.save_loc, "w") as fout:
+                fout.write(json.dumps(normalized.to_json(), indent=2))
@@ -0,0 +1,230 @@
+"""
+Opt-in tracing of builds, theorem discovery and checking.
+
+Spans (e.g. project > file > theorem > coqc run) are recorded with their
+process, thread and outcome, and written as Chrome trace events that can be
+opened in chrome://tracing or https://ui.perfetto.dev.
+
+Set COQSTOQ_TRACE=trace.json (or call `enable_tracing`) to record a trace; it
+is written when the process exits, if any span was recorded. Child processes (e.g. of a process pool)
+write theirs to trace-<pid>.json; `{pid}` in the path also expands to the
+process id. Combine the files with
+`python3 coqstoq/tracing.py merge merged.json trace.json trace-*.json`.
+
+When tracing is disabled, `span` returns a shared no-op span, so leaving
+spans in hot paths costs one function call.
+"""
+
+from __future__ import annotations
+from typing import Any, Optional
+
+import os
+import json
+import time
+import atexit
+import argparse
+import threading
+from pathlib import Path
+from multiprocessing import util
+
+TRACE_ENV_VAR = "COQSTOQ_TRACE"
+
+
+class Tracer:
+    def __init__(self, trace_loc: Path):
+        self.trace_loc = trace_loc
+        self.events: list[Any] = []
+        self.thread_names: dict[int, str] = {}
+        self.registered = False
+        self.written = False
+
+    def register(self):
+        self.registered = True
+        atexit.register(self.write)
+        # Process pool workers exit without running atexit handlers. They
+        # also drop finalizers registered before they start, so this is only
+        # done once the first span ends.
+        util.Finalize(None, self.write, exitpriority=0)
+
+    def add(self, event: Any):
+        if not self.registered:
+            self.register()
+        tid = event["tid"]
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        self.events.append(event)  # Atomic, so no lock is needed
+
+    def trace_events(self) -> list[Any]:
+        pid = os.getpid()
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in self.thread_names.items()
+        ]
+        return metadata + self.events
+
+    def write(self):
+        if self.written or 0 == len(self.events):
+            return
+        self.written = True
+        trace_loc = Path(str(self.trace_loc).format(pid=os.getpid()))
+        trace_loc.parent.mkdir(parents=True, exist_ok=True)
+        with trace_loc.open("w") as fout:
+            json.dump({"traceEvents": self.trace_events()}, fout)
+
+
+_tracer: Optional[Tracer] = None
+
+
+class Span:
+    def __init__(self, tracer: Tracer, name: str, cat: str, args: dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0
+
+    def set(self, **args: Any):
+        """Adds to the args of the span (e.g. its outcome)."""
+        self.args.update(args)
+
+    def __enter__(self) -> Span:
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type: Any, *_) -> None:
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["outcome"] = exc_type.__name__
+        self.args.setdefault("outcome", "ok")
+        self.tracer.add(
+            {
+                "name": self.name,
+                "cat": self.cat,
+                "ph": "X",
+                "ts": self.start / 1000,
+                "dur": (end - self.start) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_native_id(),
+                "args": self.args,
+            }
+        )
+
+
+class NullSpan:
+    def set(self, **args: Any):
+        pass
+
+    def __enter__(self) -> NullSpan:
+        return self
+
+    def __exit__(self, *_) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name: str, cat: str, **args: Any) -> Span | NullSpan:
+    """
+    Records the time spent in a `with` block. The outcome is the name of the
+    exception raised, if any, or whatever the block sets with `set`.
+    """
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(_tracer, name, cat, args)
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def child_trace_loc(trace_loc: Path) -> Path:
+    if "{pid}" in str(trace_loc):
+        return trace_loc
+    return trace_loc.with_name(f"{trace_loc.stem}-{{pid}}{trace_loc.suffix}")
+
+
+def enable_tracing(trace_loc: Path):
+    """Records spans from now on; they are written to `trace_loc` at exit."""
+    global _tracer
+    if _tracer is not None:
+        _tracer.write()
+    _tracer = Tracer(trace_loc)
+    # Child processes write their own files instead of overwriting this one.
+    os.environ[TRACE_ENV_VAR] = str(child_trace_loc(trace_loc))
+
+
+def disable_tracing() -> Optional[Path]:
+    """Writes the spans recorded so far and stops recording."""
+    global _tracer
+    if _tracer is None:
+        return None
+    tracer = _tracer
+    _tracer = None
+    os.environ.pop(TRACE_ENV_VAR, None)
+    tracer.write()
+    return Path(str(tracer.trace_loc).format(pid=os.getpid()))
+
+
+def reset_in_child():
+    """A forked child records its own spans, not those of its parent."""
+    global _tracer
+    if _tracer is None:
+        return
+    _tracer.written = True  # The parent writes them
+    trace_loc = _tracer.trace_loc
+    _tracer = None
+    enable_tracing(child_trace_loc(trace_loc))
+
+
+def merge_traces(trace_locs: list[Path], merged_loc: Path):
+    events: list[Any] = []
+    for trace_loc in trace_locs:
+        with trace_loc.open() as fin:
+            events.extend(json.load(fin)["traceEvents"])
+    with merged_loc.open("w") as fout:
+        json.dump({"traceEvents": events}, fout)
+
+
+def summarize(trace_loc: Path) -> dict[tuple[str, str], tuple[int, float]]:
+    """(category, name) -> (number of spans, total seconds)."""
+    with trace_loc.open() as fin:
+        events = json.load(fin)["traceEvents"]
+    totals: dict[tuple[str, str], tuple[int, float]] = {}
+    for e in events:
+        if e["ph"] != "X":
+            continue
+        num, total = totals.get((e["cat"], e["name"]), (0, 0.0))
+        totals[(e["cat"], e["name"])] = (num + 1, total + e["dur"] / 1e6)
+    return totals
+
+
+os.register_at_fork(after_in_child=reset_in_child)
+if os.environ.get(TRACE_ENV_VAR):
+    enable_tracing(Path(os.environ[TRACE_ENV_VAR]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Combine and summarize traces.")
+    parser.add_argument("command", choices=["merge", "summary"])
+    parser.add_argument(
+        "trace_loc", type=str, help="Merged trace, or trace to summarize."
+    )
+    parser.add_argument("trace_locs", nargs="*", help="Traces to merge.")
+    args = parser.parse_args()
+
+    match args.command:
+        case "merge":
+            merge_traces([Path(p) for p in args.trace_locs], Path(args.trace_loc))
+        case "summary":
+            totals = summarize(Path(args.trace_loc))
+            for (cat, name), (num, total) in sorted(
+                totals.items(), key=lambda item: -item[1][1]
+            ):
+                print(f"{cat}/{name}: {num} spans; {total:.2f}s")
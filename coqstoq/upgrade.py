@@ -0,0 +1,398 @@
+"""
+Upgrades the theorems of a project to a new commit without rediscovering
+every file. The old and new commits are diffed with git:
+- Theorems of unchanged (or purely renamed) files are carried over with the
+  new commit hash.
+- Added and modified files, and by default the files that depend on them,
+  are rediscovered.
+- Theorems of deleted files are dropped.
+
+A mapping from old to new theorems is saved to upgrade-mappings/ so that
+results recorded against the old commit can be joined with the new
+theorems. Theorems of modified files are matched by statement text.
+
+The workspace must already be checked out (and built) at the new commit.
+Regenerate the theorem list of the split afterwards if needed.
+"""
+
+from __future__ import annotations
+from typing import Any, Optional
+
+import os
+import json
+import argparse
+import subprocess
+import dataclasses
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from coqstoq.eval_thms import (
+    EvalTheorem,
+    Project,
+    Split,
+    find_eval_theorems,
+    CoqComplieError,
+    CoqCompileTimeoutError,
+)
+from coqstoq.find_eval_thms import (
+    TheoremReport,
+    EvalReport,
+    TIMEOUT,
+    find_project,
+    read_yaml_compile_args,
+    validate_report,
+)
+from coqstoq.deps import DepGraph
+from coqstoq.manifest import REPORTS_LOC, write_manifest
+from coqstoq.source_index import SourceFile, load_source
+from coqstoq.storage import (
+    load_json,
+    dump_json,
+    iter_data_files,
+    logical_data_loc,
+    resolve_data_loc,
+)
+
+MAPPINGS_LOC = Path("upgrade-mappings")
+
+
+class GitError(Exception):
+    pass
+
+
+def run_git(args: list[str], workspace: Path) -> bytes:
+    out = subprocess.run(["git", *args], cwd=workspace, capture_output=True)
+    if out.returncode != 0:
+        raise GitError(out.stderr.decode())
+    return out.stdout
+
+
+@dataclass
+class FileDiff:
+    added: list[Path]
+    modified: list[Path]
+    deleted: list[Path]
+    renamed: dict[Path, Path]  # Old path to new path; contents unchanged
+
+    @property
+    def changed(self) -> list[Path]:
+        """Files of the new commit that must be rediscovered."""
+        return self.added + self.modified
+
+
+def diff_commits(workspace: Path, old_commit: str, new_commit: str) -> FileDiff:
+    """Changes to `.v` files. Paths are relative to the workspace."""
+    out = run_git(
+        ["diff", "--name-status", "-M", old_commit, new_commit, "--", "*.v"],
+        workspace,
+    )
+    diff = FileDiff([], [], [], {})
+    for line in out.decode().splitlines():
+        status, *paths = line.split("\t")
+        match status[0]:
+            case "A" | "C":
+                diff.added.append(Path(paths[-1]))
+            case "D":
+                diff.deleted.append(Path(paths[0]))
+            case "R" if status == "R100":
+                diff.renamed[Path(paths[0])] = Path(paths[1])
+            case "R":
+                diff.deleted.append(Path(paths[0]))
+                diff.added.append(Path(paths[1]))
+            case _:
+                diff.modified.append(Path(paths[-1]))
+    return diff
+
+
+def dependents(
+    project: Project, files: list[Path], changed: list[Path], n_workers: int
+) -> set[Path]:
+    """Files of `files` that transitively depend on a changed file."""
+    graph = DepGraph(project)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        file_deps = dict(zip(files, executor.map(graph.get_deps, files)))
+    rev_deps: dict[Path, list[Path]] = {}
+    for file, deps in file_deps.items():
+        for dep in deps:
+            rev_deps.setdefault(dep, []).append(file)
+    found: set[Path] = set()
+    frontier = list(changed)
+    while 0 < len(frontier):
+        next_frontier: list[Path] = []
+        for file in frontier:
+            for rev_dep in rev_deps.get(file, []):
+                if rev_dep not in found:
+                    found.add(rev_dep)
+                    next_frontier.append(rev_dep)
+        frontier = next_frontier
+    return found - set(changed)
+
+
+def load_project_thms(project: Project) -> dict[Path, list[EvalTheorem]]:
+    """Saved theorems of the project by source file relative to the workspace."""
+    project_thms: dict[Path, list[EvalTheorem]] = {}
+    if not project.thm_path.exists():
+        return project_thms
+    for thm_file_loc in iter_data_files(project.thm_path):
+        rel_loc = logical_data_loc(thm_file_loc).relative_to(project.thm_path)
+        thms = [EvalTheorem.from_json(t) for t in load_json(thm_file_loc)]
+        project_thms[rel_loc.with_suffix(".v")] = thms
+    return project_thms
+
+
+def statement(source: SourceFile, thm: EvalTheorem) -> str:
+    return source.span(thm.theorem_start_pos, thm.theorem_end_pos)
+
+
+def match_by_statement(
+    old_source: SourceFile,
+    old_thms: list[EvalTheorem],
+    new_source: SourceFile,
+    new_thms: list[EvalTheorem],
+) -> list[Optional[EvalTheorem]]:
+    """
+    New theorem with the same statement as each old theorem. Repeated
+    statements are matched in order.
+    """
+    new_by_statement: dict[str, list[EvalTheorem]] = {}
+    for thm in new_thms:
+        new_by_statement.setdefault(statement(new_source, thm), []).append(thm)
+    matches: list[Optional[EvalTheorem]] = []
+    for thm in old_thms:
+        candidates = new_by_statement.get(statement(old_source, thm), [])
+        matches.append(candidates.pop(0) if 0 < len(candidates) else None)
+    return matches
+
+
+def carry_over(thm: EvalTheorem, project: Project, path: Path) -> EvalTheorem:
+    return dataclasses.replace(thm, project=project, path=path)
+
+
+def save_project_thms(
+    project: Project, path: Path, thms: list[EvalTheorem], compression: Optional[str]
+):
+    save_loc = (project.thm_path / path).with_suffix(".json")
+    save_loc.parent.mkdir(parents=True, exist_ok=True)
+    dump_json([t.to_json() for t in thms], save_loc, compression)
+
+
+def remove_project_thms(project: Project, path: Path):
+    save_loc = resolve_data_loc((project.thm_path / path).with_suffix(".json"))
+    if save_loc.exists():
+        os.remove(save_loc)
+
+
+def load_report(project: Project) -> Optional[TheoremReport]:
+    report_loc = REPORTS_LOC / f"{project.dir_name}.json"
+    if not report_loc.exists():
+        return None
+    with report_loc.open("r") as fin:
+        return EvalReport.from_json(json.load(fin)).report
+
+
+@dataclass
+class UpgradeReport:
+    project: Project
+    old_commit: str
+    new_commit: str
+    report: TheoremReport
+    mapping: list[tuple[EvalTheorem, Optional[EvalTheorem]]]
+
+    def print_summary(self):
+        num_mapped = sum(1 for _, new in self.mapping if new is not None)
+        print(f"<<<<< Project: {self.project.dir_name} >>>>>")
+        print(f"{self.old_commit} -> {self.new_commit}")
+        print(f"Mapped {num_mapped} of {len(self.mapping)} old theorems.")
+        self.report.print_summary()
+
+    def mapping_to_json(self) -> Any:
+        return {
+            "project": self.project.dir_name,
+            "old_commit": self.old_commit,
+            "new_commit": self.new_commit,
+            "mapping": [
+                {
+                    "old_id": old.id,
+                    "new_id": None if new is None else new.id,
+                    "old": old.to_json(),
+                    "new": None if new is None else new.to_json(),
+                }
+                for old, new in self.mapping
+            ],
+        }
+
+
+def upgrade_project(
+    project: Project,
+    old_commit: Optional[str],
+    new_commit: str,
+    timeout: int,
+    include_dependents: bool,
+    n_workers: int,
+    compression: Optional[str],
+) -> UpgradeReport:
+    from coqpyt.lsp.structs import ResponseError
+
+    workspace = project.workspace
+    new_commit = run_git(["rev-parse", new_commit], workspace).decode().strip()
+    old_thms = load_project_thms(project)
+    if old_commit is None:
+        old_hashes = {t.project.commit_hash for ts in old_thms.values() for t in ts}
+        assert len(old_hashes) == 1, f"Could not infer the old commit: {old_hashes}"
+        old_commit = old_hashes.pop()
+        assert old_commit is not None
+    new_project = dataclasses.replace(project, commit_hash=new_commit)
+    diff = diff_commits(workspace, old_commit, new_commit)
+
+    files = sorted(f.relative_to(workspace) for f in workspace.glob("**/*.v"))
+    to_discover = set(diff.changed)
+    if include_dependents:
+        to_discover |= dependents(project, files, diff.changed, n_workers)
+    old_report = load_report(project)
+    old_unsuccessful: dict[Path, str] = {}
+    if old_report is not None:
+        for kind, kind_files in [
+            ("errored", old_report.errored_files),
+            ("timed_out", old_report.timed_out_files),
+            ("lsp_error", old_report.lsp_error_files),
+        ]:
+            for f in kind_files:
+                old_unsuccessful[f.relative_to(workspace)] = kind
+    renamed_to = {new: old for old, new in diff.renamed.items()}
+
+    report = TheoremReport([], [], [], [], 0)
+    mapping: list[tuple[EvalTheorem, Optional[EvalTheorem]]] = []
+    for path in diff.deleted:
+        mapping.extend((t, None) for t in old_thms.get(path, []))
+        remove_project_thms(project, path)
+    for path in diff.renamed:
+        remove_project_thms(project, path)
+
+    for path in files:
+        old_path = renamed_to.get(path, path)
+        if path not in to_discover and old_path in old_thms:
+            print(f"Carrying over {path}")
+            new_thms = [carry_over(t, new_project, path) for t in old_thms[old_path]]
+            save_project_thms(new_project, path, new_thms, compression)
+            mapping.extend(zip(old_thms[old_path], new_thms))
+            report.successful_files.append(workspace / path)
+            report.num_theorems += len(new_thms)
+            continue
+        if path not in to_discover and old_path in old_unsuccessful:
+            match old_unsuccessful[old_path]:
+                case "errored":
+                    report.errored_files.append(workspace / path)
+                case "timed_out":
+                    report.timed_out_files.append(workspace / path)
+                case _:
+                    report.lsp_error_files.append(workspace / path)
+            continue
+
+        print(f"Rediscovering {path}")
+        remove_project_thms(project, path)
+        try:
+            new_thms = find_eval_theorems(new_project, workspace / path, timeout)
+        except CoqComplieError as e:
+            print(f"Could not compile {path}; Error: {e}")
+            report.errored_files.append(workspace / path)
+            new_thms = []
+        except CoqCompileTimeoutError as e:
+            print(f"Compilation timed out for {path}; Error; {e}")
+            report.timed_out_files.append(workspace / path)
+            new_thms = []
+        except ResponseError:
+            print(f"Got Coq-LSP response error for {path}.")
+            report.lsp_error_files.append(workspace / path)
+            new_thms = []
+        else:
+            save_project_thms(new_project, path, new_thms, compression)
+            report.successful_files.append(workspace / path)
+            report.num_theorems += len(new_thms)
+        if old_path not in old_thms:
+            continue
+        if 0 == len(new_thms):
+            mapping.extend((t, None) for t in old_thms[old_path])
+            continue
+        old_source = SourceFile.from_bytes(
+            run_git(["show", f"{old_commit}:{old_path}"], workspace)
+        )
+        new_source = load_source(workspace / path)
+        matches = match_by_statement(
+            old_source, old_thms[old_path], new_source, new_thms
+        )
+        mapping.extend(zip(old_thms[old_path], matches))
+
+    return UpgradeReport(new_project, old_commit, new_commit, report, mapping)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Upgrade the theorems of a project to a new commit."
+    )
+    parser.add_argument("project_name", type=str)
+    parser.add_argument(
+        "--old_commit",
+        type=str,
+        default=None,
+        help="Commit the saved theorems come from. Inferred from the theorems by default.",
+    )
+    parser.add_argument(
+        "--new_commit",
+        type=str,
+        default="HEAD",
+        help="Commit the workspace is checked out at.",
+    )
+    parser.add_argument(
+        "--custom-split-name",
+        type=str,
+        default=None,
+        help="Name of the custom split of the project, if it is not predefined.",
+    )
+    parser.add_argument(
+        "--no_dependents",
+        action="store_true",
+        help="Do not rediscover unchanged files that depend on changed files.",
+    )
+    parser.add_argument("--n_workers", type=int, default=8)
+    parser.add_argument("--compression", choices=["gz", "xz"], default=None)
+    args = parser.parse_args()
+
+    if args.custom_split_name is not None:
+        split = Split.from_name(args.custom_split_name)
+        project = Project(
+            args.project_name,
+            split,
+            None,
+            read_yaml_compile_args(
+                args.project_name, Path.cwd() / f"{args.custom_split_name}.yaml"
+            ),
+        )
+    else:
+        project = find_project(args.project_name)
+
+    upgrade_report = upgrade_project(
+        project,
+        args.old_commit,
+        args.new_commit,
+        TIMEOUT,
+        not args.no_dependents,
+        args.n_workers,
+        args.compression,
+    )
+    validate_report(upgrade_report.project, upgrade_report.report)
+    os.makedirs(REPORTS_LOC, exist_ok=True)
+    eval_report = EvalReport(upgrade_report.project, upgrade_report.report)
+    with open(REPORTS_LOC / f"{project.dir_name}.json", "w") as f:
+        json.dump(eval_report.to_json(), f, indent=2)
+    os.makedirs(MAPPINGS_LOC, exist_ok=True)
+    mapping_loc = MAPPINGS_LOC / (
+        f"{project.dir_name}-{upgrade_report.old_commit[:8]}"
+        f"-{upgrade_report.new_commit[:8]}.json"
+    )
+    with open(mapping_loc, "w") as f:
+        json.dump(upgrade_report.mapping_to_json(), f, indent=2)
+    write_manifest(project.split, Path.cwd())
+    print()
+    upgrade_report.print_summary()
+    print(f"Saved the theorem mapping to {mapping_loc}.")
@@ -0,0 +1,264 @@
+"""
+Persistent cache of check verdicts, so that resubmitting the same proof for
+the same theorem does not compile the file again.
+
+Verdicts are keyed by the theorem (project, path, positions, file hash), the
+normalized proof text, and a fingerprint of the coqc environment. Set
+COQSTOQ_NO_VERDICT_CACHE=1 (or pass `enabled=False`) to bypass the cache,
+e.g. for audited runs. The environment (coqc version, Coq library location
+and installed user-contrib files) is read once per process, as are the
+dependencies of each file; the built `.vo` files of those dependencies are
+checked on every lookup.
+"""
+
+from __future__ import annotations
+from typing import Any, Optional
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import functools
+import threading
+import subprocess
+from pathlib import Path
+
+from coqstoq.eval_thms import EvalTheorem, Project
+from coqstoq.deps import DepGraph, CoqDepError
+from coqstoq.prescreen import strip_qed
+
+NO_CACHE_ENV_VAR = "COQSTOQ_NO_VERDICT_CACHE"
+DEFAULT_CACHE_LOC = Path("coqstoq-verdicts.sqlite")
+DEFAULT_MAX_ENTRIES = 1_000_000
+FALSE_ENV_VALUES = {"", "0", "false", "no", "off"}
+
+
+def normalize_proof(proof: str) -> str:
+    """Ignores a trailing `Qed.`, line endings and trailing whitespace."""
+    lines = strip_qed(proof).replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+@functools.cache
+def coqc_version() -> str:
+    try:
+        out = subprocess.run(["coqc", "--version"], capture_output=True, text=True)
+        return out.stdout.strip()
+    except FileNotFoundError:
+        return ""
+
+
+@functools.cache
+def coqc_where() -> str:
+    try:
+        out = subprocess.run(["coqc", "-where"], capture_output=True, text=True)
+        return out.stdout.strip()
+    except FileNotFoundError:
+        return ""
+
+
+@functools.cache
+def user_contrib_state() -> str:
+    """Hash of the path, size and mtime of every installed `.vo` file."""
+    if coqc_where() == "":
+        return ""
+    user_contrib_loc = Path(coqc_where()) / "user-contrib"
+    state = hashlib.sha256()
+    for root, dirs, files in os.walk(user_contrib_loc):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".vo"):
+                vo_loc = os.path.join(root, name)
+                stat = os.stat(vo_loc)
+                state.update(f"{vo_loc}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return state.hexdigest()
+
+
+_dep_graphs: dict[tuple[str, str], DepGraph] = {}
+_closures: dict[tuple[str, str, Path], list[Path]] = {}
+_deps_lock = threading.Lock()
+
+
+def required_files(project: Project, path: Path) -> list[Path]:
+    """Files of the project that `path` requires. Computed once per process."""
+    key = (project.split.dir_name, project.dir_name, path)
+    with _deps_lock:
+        if key in _closures:
+            return _closures[key]
+        graph = _dep_graphs.setdefault(key[:2], DepGraph(project))
+    required = sorted(graph.closure([path], 1))
+    with _deps_lock:
+        _closures[key] = required
+    return required
+
+
+def deps_state(thm: EvalTheorem) -> str:
+    """
+    Hash of the size and mtime of the built `.vo` files that the file of the
+    theorem requires, so that rebuilding a dependency invalidates verdicts.
+    """
+    try:
+        required = required_files(thm.project, thm.path)
+    except (CoqDepError, FileNotFoundError):
+        return ""  # coqdep is unavailable or failed
+    state = hashlib.sha256()
+    for dep in required:
+        vo_loc = thm.project.workspace / dep.with_suffix(".vo")
+        try:
+            stat = vo_loc.stat()
+            state.update(f"{dep}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+        except FileNotFoundError:
+            state.update(f"{dep}:missing\n".encode())
+    return state.hexdigest()
+
+
+def env_fingerprint(thm: EvalTheorem) -> str:
+    env_data = [
+        coqc_version(),
+        coqc_where(),
+        user_contrib_state(),
+        thm.project.compile_args,
+        os.environ.get("COQPATH"),
+        deps_state(thm),
+    ]
+    return hashlib.sha256(json.dumps(env_data).encode()).hexdigest()
+
+
+def cache_disabled_by_env() -> bool:
+    value = os.environ.get(NO_CACHE_ENV_VAR, "")
+    return value.strip().lower() not in FALSE_ENV_VALUES
+
+
+def verdict_key(thm: EvalTheorem, proof: str) -> str:
+    key_data = [
+        thm.project.split.dir_name,
+        thm.project.dir_name,
+        str(thm.path),
+        thm.theorem_start_pos.to_json(),
+        thm.theorem_end_pos.to_json(),
+        thm.proof_start_pos.to_json(),
+        thm.proof_end_pos.to_json(),
+        thm.hash,
+        normalize_proof(proof),
+        env_fingerprint(thm),
+    ]
+    return hashlib.sha256(json.dumps(key_data).encode()).hexdigest()
+
+
+class VerdictCache:
+    def __init__(
+        self,
+        db_loc: Path = DEFAULT_CACHE_LOC,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        enabled: bool = True,
+    ):
+        self.db_loc = db_loc
+        self.max_entries = max_entries
+        self.enabled = enabled and not cache_disabled_by_env()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_loc, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts "
+            "(key TEXT PRIMARY KEY, verdict INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)"
+        )
+        self.conn.commit()
+        # Running count, so that puts do not count the table. Other processes
+        # may share the database, so it is recounted before evicting.
+        (self.num_entries,) = self.conn.execute(
+            "SELECT COUNT(*) FROM verdicts"
+        ).fetchone()
+
+    def get(self, thm: EvalTheorem, proof: str) -> Optional[bool]:
+        if not self.enabled:
+            return None
+        key = verdict_key(thm, proof)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT verdict FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE verdicts SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+            return bool(row[0])
+
+    def put(self, thm: EvalTheorem, proof: str, verdict: bool):
+        if not self.enabled:
+            return
+        key = verdict_key(thm, proof)
+        with self.lock:
+            now = time.time()
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO verdicts VALUES (?, ?, ?)",
+                (key, int(verdict), now),
+            ).rowcount
+            if inserted:
+                self.num_entries += 1
+            else:
+                self.conn.execute(
+                    "UPDATE verdicts SET verdict = ?, last_used = ? WHERE key = ?",
+                    (int(verdict), now, key),
+                )
+            if self.max_entries < self.num_entries:
+                self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        """Removes the least recently used tenth of the entries when over the cap."""
+        (self.num_entries,) = self.conn.execute(
+            "SELECT COUNT(*) FROM verdicts"
+        ).fetchone()
+        if self.num_entries <= self.max_entries:
+            return
+        num_evicted = self.num_entries - self.max_entries + self.max_entries // 10
+        self.num_entries -= self.conn.execute(
+            "DELETE FROM verdicts WHERE key IN "
+            "(SELECT key FROM verdicts ORDER BY last_used LIMIT ?)",
+            (num_evicted,),
+        ).rowcount
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+    def stats(self) -> Any:
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+        }
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM verdicts")
+            self.conn.commit()
+            self.num_entries = 0
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear a verdict cache.")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--cache_loc", type=str, default=str(DEFAULT_CACHE_LOC))
+    args = parser.parse_args()
+
+    cache = VerdictCache(Path(args.cache_loc))
+    if args.command == "clear":
+        cache.clear()
+    print(json.dumps(cache.stats(), indent=2))
+    cache.close()
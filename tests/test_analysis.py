@@ -0,0 +1,60 @@
+import json
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from coqstoq import Split, get_theorem_list
+from coqstoq.check import Result, EvalResults
+from coqstoq.analysis import (
+    ResultsTable,
+    solve_rates,
+    solve_rates_by_project,
+    time_to_solve_cdf,
+    pairwise_overlap,
+    unique_solves,
+    bootstrap_ci,
+)
+
+
+def test_results_table(tmp_path: Path):
+    thms = get_theorem_list(Split.TEST, Path.cwd())[:100]
+    solved_a = [i for i in range(100) if i % 2 == 0]
+    solved_b = [i for i in range(100) if i % 5 == 0]
+    results_a = [Result(thms[i], "auto.", float(i)) for i in solved_a]
+    results_b = [Result(thm, None, None) for thm in thms]
+    for i in solved_b:
+        results_b[i] = Result(thms[i], "auto.", 1.0)
+    results_locs = [tmp_path / "a.json", tmp_path / "b.json"]
+    for results, loc in zip([results_a, results_b], results_locs):
+        loc.write_text(json.dumps(EvalResults("test", results).to_json()))
+
+    table = ResultsTable.load(thms, results_locs, n_workers=2)
+    assert table.names == ["a", "b"]
+    assert list(solve_rates(table)) == [0.5, 0.2]
+    assert list(unique_solves(table)) == [40, 10]
+    assert pairwise_overlap(table).tolist() == [[50, 10], [10, 20]]
+    by_project = solve_rates_by_project(table)
+    assert by_project.shape == (2, len(table.project_names))
+    assert np.all((0 <= by_project) & (by_project <= 1))
+    cdf = time_to_solve_cdf(table, np.array([0.0, 1.0, 100.0]))
+    assert cdf.tolist() == [[0.01, 0.01, 0.5], [0.0, 0.2, 0.2]]
+    cis = bootstrap_ci(table, n_samples=200)
+    assert np.all(cis[:, 0] <= solve_rates(table))
+    assert np.all(solve_rates(table) <= cis[:, 1])
+
+
+def test_results_table_verdicts(tmp_path: Path):
+    thms = get_theorem_list(Split.TEST, Path.cwd())[:10]
+    results = [Result(thm, "auto.", 1.0) for thm in thms]
+    results_loc = tmp_path / "a.json"
+    results_loc.write_text(json.dumps(EvalResults("test", results).to_json()))
+    verdicts_loc = tmp_path / "a-verdicts.json"
+    verdicts_loc.write_text(json.dumps([i < 3 for i in range(10)]))
+
+    table = ResultsTable.load(
+        thms, [results_loc, results_loc], 2, [None, verdicts_loc]
+    )
+    assert list(solve_rates(table)) == [1.0, 0.3]
+    assert table.checked.tolist() == [False, True]
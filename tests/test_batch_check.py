@@ -0,0 +1,102 @@
+from pathlib import Path
+
+from coqstoq.eval_thms import (
+    EvalTheorem,
+    Project,
+    Split,
+    Position,
+    CoqComplieError,
+)
+from coqstoq.check import Result
+from coqstoq.source_index import SourceFile
+from coqstoq.batch_check import (
+    Attempt,
+    splice_attempts,
+    locate_failure,
+    batch_safe,
+    group_attempts,
+)
+
+SOURCE = SourceFile.from_bytes(
+    b"Lemma a : True.\n"
+    b"Proof. auto. Qed.\n"
+    b"Lemma b : True.\n"
+    b"Proof.\n"
+    b"  auto.\n"
+    b"Qed.\n"
+    b"Lemma c : True.\n"
+    b"Proof. auto. Qed.\n"
+)
+PROJECT = Project("proj", Split("test-repos", "test-theorems"), None, [])
+
+
+def make_thm(start_line: int, proof_end: Position) -> EvalTheorem:
+    return EvalTheorem(
+        PROJECT,
+        Path("A.v"),
+        Position(start_line, 0),
+        Position(start_line, 15),
+        Position(start_line + 1, 0),
+        proof_end,
+        SOURCE.hash,
+    )
+
+
+THMS = [
+    make_thm(0, Position(1, 17)),
+    make_thm(2, Position(5, 4)),
+    make_thm(6, Position(7, 17)),
+]
+
+
+def test_splice_attempts():
+    proofs = ["auto.", "split.\n  auto.\n  auto.", "exact I."]
+    attempts = [Attempt(i, thm, p) for i, (thm, p) in enumerate(zip(THMS, proofs))]
+    spliced = splice_attempts(SOURCE, attempts)
+    lines = spliced.contents.split("\n")
+    assert len(spliced.attempt_lines) == 3
+    for proof, (start, end) in zip(proofs, spliced.attempt_lines):
+        assert lines[start - 1 : end] == (proof + "\nQed.").split("\n")
+    for thm_line in ["Lemma a : True.", "Lemma b : True.", "Lemma c : True."]:
+        assert thm_line in lines
+
+
+def coqc_error(file: str, line: int) -> CoqComplieError:
+    return CoqComplieError(
+        f'File "{file}", line {line}, characters 2-7:\nError: failed.\n'.encode()
+    )
+
+
+def test_locate_failure():
+    proofs = ["auto.", "split.\n  auto.\n  auto.", "exact I."]
+    attempts = [Attempt(i, thm, p) for i, (thm, p) in enumerate(zip(THMS, proofs))]
+    spliced = splice_attempts(SOURCE, attempts)
+    check_loc = "/tmp/scratch/coqstoq_check_temp.v"
+    for i, (start, end) in enumerate(spliced.attempt_lines):
+        assert locate_failure(coqc_error(check_loc, start), spliced) == i
+        assert locate_failure(coqc_error(check_loc, end), spliced) == i
+    assert locate_failure(coqc_error(check_loc, 1), spliced) is None
+    # Errors in dependencies are not attributed to an attempt.
+    start, _ = spliced.attempt_lines[1]
+    assert locate_failure(coqc_error("/proj/Other.v", start), spliced) is None
+
+
+def test_batch_safe():
+    assert batch_safe("Proof. auto.")
+    assert batch_safe("Proof with auto.\n- { split. }\n- exact I.")
+    assert batch_safe('idtac "Qed. Ltac". (* Qed. Axiom *) auto.')
+    assert not batch_safe("auto. Qed. Ltac t := idtac. Lemma d : True. t.")
+    assert not batch_safe("auto. Defined.")
+    assert not batch_safe("{ auto. } Hint Resolve I.")
+
+
+def test_group_attempts_isolates_unsafe():
+    results = [
+        Result(THMS[0], "auto. Qed. Ltac t := idtac. Lemma d : True. t.", None),
+        Result(THMS[1], "auto.", None),
+        Result(THMS[2], "auto.", None),
+        Result(THMS[2], "exact I.", None),
+        Result(THMS[1], "admit.", None),
+    ]
+    groups = group_attempts(results)
+    assert [[a.result_idx for a in g] for g in groups] == [[1, 2], [3], [0]]
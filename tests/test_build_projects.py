@@ -0,0 +1,69 @@
+from pathlib import Path
+
+from coqstoq import build_projects
+from coqstoq.build_projects import compcert_build, pnv_build, routine_build
+from coqstoq.deps import DepGraph
+from coqstoq.predefined_projects import HOARETUT
+
+DEPS = {
+    "lib/A.v": [],
+    "lib/B.v": ["lib/A.v"],
+    "common/C.v": ["lib/A.v"],
+    "backend/D.v": ["lib/B.v", "common/C.v"],
+}
+
+
+def run_targeted(monkeypatch, instructions, method: str):
+    instrs: list[list[str]] = []
+    waves: list[list[Path]] = []
+
+    def make_graph(project):
+        graph = DepGraph(project)
+        graph.deps = {Path(p): [Path(d) for d in ds] for p, ds in DEPS.items()}
+        return graph
+
+    def run_instrs(project, project_instrs):
+        instrs.extend(project_instrs)
+        return True
+
+    def build_wave(graph, wave, n_jobs):
+        waves.append(wave)
+        return True
+
+    monkeypatch.setattr(build_projects, "DepGraph", make_graph)
+    monkeypatch.setattr(build_projects, "run_instrs", run_instrs)
+    monkeypatch.setattr(build_projects, "build_wave", build_wave)
+    paths = [Path("backend/D.v")]
+    assert build_projects.run_targeted_build(instructions, paths, method, 2)
+    return instrs, waves
+
+
+def test_compcert_targets(monkeypatch):
+    instrs, waves = run_targeted(monkeypatch, compcert_build(4), "make")
+    assert instrs == [
+        ["./configure", "x86_64-linux"],
+        ["make", "depend", "-j", "4"],
+        ["make", "-j", "4", "common/C.vo", "lib/A.vo", "lib/B.vo"],
+    ]
+    assert waves == []
+
+
+def test_coq_makefile_targets(monkeypatch):
+    instrs, _ = run_targeted(monkeypatch, pnv_build(4), "make")
+    assert instrs[-1] == [
+        "make", "-f", "Makefile.coq", "-j", "4", "common/C.vo", "lib/A.vo", "lib/B.vo"
+    ]
+
+
+def test_targets_without_make_rule(monkeypatch):
+    instructions = routine_build(HOARETUT, 4)
+    assert instructions.target_instr is None  # No Makefile.coq
+    instrs, waves = run_targeted(monkeypatch, instructions, "make")
+    assert instrs == []
+    assert waves == [[Path("lib/A.v")], [Path("common/C.v"), Path("lib/B.v")]]
+
+
+def test_coqc_method(monkeypatch):
+    instrs, waves = run_targeted(monkeypatch, compcert_build(4), "coqc")
+    assert instrs == [["./configure", "x86_64-linux"], ["make", "depend", "-j", "4"]]
+    assert len(waves) == 2
@@ -6,6 +6,14 @@ from pathlib import Path
 
 from coqstoq.check import Result, check_result, get_ground_truth
 from coqstoq import get_theorem_list, Split, get_theorem
+from coqstoq.replay_bench import (
+    BenchEntry,
+    BenchReport,
+    run_bench,
+    sample_idxs,
+    unexpected_entries,
+    compare_reports,
+)
 
 import logging
 
@@ -36,3 +44,43 @@ def test_check_result_single():
     bad_result = Result(test_thm, bad_proof, 1)
     assert check_result(good_result, COQSTOQ_LOC)
     assert not check_result(bad_result, COQSTOQ_LOC)
+
+
+def test_replay_bench_sample():
+    COQSTOQ_LOC = Path.cwd()
+    num_thms = len(get_theorem_list(Split.TEST, COQSTOQ_LOC))
+    idxs = sample_idxs(num_thms, None, None, 2, 0)
+    report = run_bench("test", idxs, COQSTOQ_LOC, "batch", 2, True)
+    assert len(report.entries) == 4
+    assert unexpected_entries(report) == []
+    assert compare_reports(report, report, 1.25, 1.0) == []
+
+
+def test_compare_reports():
+    baseline = BenchReport(
+        "test",
+        "batch",
+        "hw",
+        1.0,
+        10.0,
+        [BenchEntry(0, "ground_truth", True, 2.0), BenchEntry(0, "negative", False, 1.0)],
+    )
+    faster_machine = BenchReport(
+        "test",
+        "batch",
+        "hw",
+        0.5,
+        5.0,
+        [BenchEntry(0, "ground_truth", True, 1.0), BenchEntry(0, "negative", False, 0.5)],
+    )
+    assert compare_reports(faster_machine, baseline, 1.25, 0.5) == []
+    regressed = BenchReport(
+        "test",
+        "batch",
+        "hw",
+        1.0,
+        20.0,
+        [BenchEntry(0, "ground_truth", False, 5.0), BenchEntry(0, "negative", False, 1.0)],
+    )
+    problems = compare_reports(regressed, baseline, 1.25, 0.5)
+    assert len(problems) == 3
@@ -1,5 +1,5 @@
 from pathlib import Path
-from coqstoq import Split, num_theorems, get_theorem, get_theorem_list
+from coqstoq import Split, num_theorems, get_theorem, get_theorem_list, iter_theorems
 import logging
 
 
@@ -14,3 +14,14 @@ def test_coqstoq():
         assert 0 < split_n_theorems
         assert split_thm_0 == split_theorem_list[0]
         assert split_thm_last == split_theorem_list[-1]
+
+
+def test_iter_theorems():
+    COQSTOQ_LOC = Path.cwd()
+    for split in Split:
+        split_theorem_list = get_theorem_list(split, COQSTOQ_LOC)
+        assert list(iter_theorems(split, coqstoq_loc=COQSTOQ_LOC)) == split_theorem_list
+        assert (
+            list(iter_theorems(split, 3, 200, 7, COQSTOQ_LOC))
+            == split_theorem_list[3:200:7]
+        )
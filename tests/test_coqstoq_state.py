@@ -11,6 +11,7 @@ from coqstoq.find_eval_thms import (
     get_all_eval_thms,
 )
 from coqstoq.create_theorem_lists import TheoremReference, load_reference_list
+from coqstoq.manifest import load_manifest, verify_manifest
 from coqstoq.predefined_projects import (
     PREDEFINED_PROJECTS,
     COMPCERT,
@@ -135,3 +136,16 @@ def test_report_list():
         for idx, _ in enumerate(thms):
             thm_ref = TheoremReference(p, idx)
             assert thm_ref in thm_ref_set
+
+
+def test_manifests():
+    """
+    The theorem files, reference lists, reports, and project sources match the
+    manifest written when they were generated.
+    """
+    COQSTOQ_LOC = Path.cwd()
+    for split in [VAL_SPLIT, TEST_SPLIT, CUTOFF_SPLIT]:
+        manifest = load_manifest(split, COQSTOQ_LOC)
+        assert manifest.num_theorems == manifest.num_references
+        drifts = verify_manifest(manifest, COQSTOQ_LOC, True, 8)
+        assert 0 == len(drifts), "\n".join(str(d) for d in drifts)
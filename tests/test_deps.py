@@ -0,0 +1,34 @@
+from pathlib import Path
+
+import pytest
+
+from coqstoq.deps import DepGraph, CoqDepError
+from coqstoq.predefined_projects import COMPCERT
+
+
+def make_graph(deps: dict[str, list[str]]) -> DepGraph:
+    graph = DepGraph(COMPCERT)
+    graph.deps = {Path(p): [Path(d) for d in ds] for p, ds in deps.items()}
+    return graph
+
+
+def test_order():
+    graph = make_graph(
+        {
+            "Lib.v": [],
+            "A.v": [],
+            "B.v": ["A.v"],
+            "C.v": ["A.v", "Lib.v"],
+            "D.v": ["B.v", "C.v"],
+        }
+    )
+    required = graph.closure([Path("D.v")], 2)
+    assert required == {Path(p) for p in ["Lib.v", "A.v", "B.v", "C.v"]}
+    waves = graph.order({Path(p) for p in ["A.v", "B.v", "C.v", "D.v"]})
+    assert waves == [[Path("A.v")], [Path("B.v"), Path("C.v")], [Path("D.v")]]
+
+
+def test_order_cycle():
+    graph = make_graph({"A.v": ["B.v"], "B.v": ["A.v"]})
+    with pytest.raises(CoqDepError):
+        graph.order({Path("A.v"), Path("B.v")})
@@ -1,5 +1,15 @@
 from pathlib import Path
-from coqstoq.eval_thms import Project, Split, find_eval_theorems, EvalTheorem, Position
+from coqstoq import eval_thms
+from coqstoq.eval_thms import (
+    Project,
+    Split,
+    find_eval_theorems,
+    EvalTheorem,
+    Position,
+    FileProfile,
+    LspSession,
+)
+from coqstoq.find_eval_thms import TheoremReport, get_eval_thms
 from coqstoq.predefined_projects import MATHCLASSES
 
 """
@@ -40,3 +50,76 @@ def test_regression():
     target_file = MATHCLASSES.workspace / "quote/classquote.v"
     eval_thms = find_eval_theorems(MATHCLASSES, target_file, None)
     assert eval_thms == GROUND_TRUTH
+
+
+def test_shared_server():
+    integers_file = MATHCLASSES.workspace / "orders/integers.v"
+    classquote_file = MATHCLASSES.workspace / "quote/classquote.v"
+    session = LspSession(MATHCLASSES, None)
+    try:
+        integers_thms = find_eval_theorems(
+            MATHCLASSES, integers_file, None, session=session
+        )
+        client = session.client
+        classquote_thms = find_eval_theorems(
+            MATHCLASSES, classquote_file, None, session=session
+        )
+        assert session.client is client
+        assert (session.num_files, session.num_restarts) == (2, 0)
+    finally:
+        session.close()
+    saved_loc = MATHCLASSES.thm_path / "orders/integers.json"
+    assert integers_thms == get_eval_thms(saved_loc)
+    assert classquote_thms == GROUND_TRUTH
+
+
+def test_session_healthy(monkeypatch):
+    rss = 0
+    monkeypatch.setattr(eval_thms, "coq_lsp_rss", lambda: rss)
+    session = LspSession(MATHCLASSES, None, memory_limit=1024, max_files=2)
+    assert session.max_rss == 768 * 1024
+    assert session.healthy()  # No server yet
+    session.client = object()
+    session.num_files = 1
+    assert session.healthy()
+    rss = 800 * 1024
+    assert not session.healthy()
+    rss = 0
+    session.num_files = 2
+    assert not session.healthy()
+    assert LspSession(MATHCLASSES, None, max_rss=10).max_rss == 10
+
+
+def make_proc(proc_loc: Path, pid: int, comm: str, ppid: int, rss_kb: int):
+    (proc_loc / str(pid)).mkdir()
+    (proc_loc / str(pid) / "stat").write_text(f"{pid} ({comm}) S {ppid} {pid} 0\n")
+    (proc_loc / str(pid) / "status").write_text(f"Name:\t{comm}\nVmRSS:\t{rss_kb} kB\n")
+
+
+def test_coq_lsp_rss_counts_grandchildren(tmp_path: Path):
+    make_proc(tmp_path, 100, "python", 1, 1)
+    # coqpyt runs `ulimit -v ...; coq-lsp` through a shell.
+    make_proc(tmp_path, 101, "sh", 100, 2)
+    make_proc(tmp_path, 102, "coq-lsp", 101, 10)
+    make_proc(tmp_path, 103, "coq-lsp", 100, 20)
+    make_proc(tmp_path, 104, "coq-lsp", 1, 40)  # Another process's server
+    make_proc(tmp_path, 105, "odd) name", 100, 80)
+    assert eval_thms.coq_lsp_rss(100, tmp_path) == 30 * 1024
+    assert eval_thms.coq_lsp_rss(101, tmp_path) == 10 * 1024
+    assert eval_thms.coq_lsp_rss(104, tmp_path) == 0
+
+
+def test_report_profiles():
+    profile = FileProfile(Path("foo/bar.v"), num_steps=3)
+    with profile.phase("compile"):
+        pass
+    with profile.phase("exec"):
+        pass
+    with profile.phase("exec"):
+        pass
+    assert list(profile.phases) == ["compile", "exec"]
+    report = TheoremReport([Path("foo/bar.v")], [], [], [], 1, [profile])
+    assert TheoremReport.from_json(report.to_json()) == report
+    old_report_data = report.to_json()
+    del old_report_data["profiles"]
+    assert TheoremReport.from_json(old_report_data).profiles == []
@@ -0,0 +1,42 @@
+"""
+Loading theorems and results must not import coqpyt or yaml, which are only
+needed to discover theorems.
+"""
+
+import sys
+import json
+import subprocess
+
+HEAVY_PACKAGES = ["coqpyt", "yaml", "numpy"]
+LIGHT_MODULES = [
+    "coqstoq",
+    "coqstoq.check",
+    "coqstoq.batch_check",
+    "coqstoq.extract",
+    "coqstoq.manifest",
+    "coqstoq.storage",
+]
+
+
+def heavy_imports(modules: list[str]) -> list[str]:
+    """Heavy modules loaded by importing `modules` in a fresh interpreter."""
+    code = "\n".join(
+        [f"import {m}" for m in modules]
+        + [
+            "import sys, json",
+            "print(json.dumps(sorted(sys.modules)))",
+        ]
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    )
+    loaded = json.loads(out.stdout)
+    return [m for m in loaded if m.split(".")[0] in HEAVY_PACKAGES]
+
+
+def test_import_coqstoq():
+    assert heavy_imports(["coqstoq"]) == []
+
+
+def test_no_heavy_imports():
+    assert heavy_imports(LIGHT_MODULES) == []
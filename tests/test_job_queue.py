@@ -0,0 +1,67 @@
+import time
+import threading
+from pathlib import Path
+
+from coqstoq.job_queue import JobQueue, run_worker
+
+
+def test_lease_complete(tmp_path: Path):
+    job_queue = JobQueue(tmp_path / "jobs.sqlite")
+    assert job_queue.enqueue("check", "a", {"x": 1})
+    assert not job_queue.enqueue("check", "a", {"x": 1})
+    assert job_queue.enqueue("check", "b", {"x": 2})
+    leased = job_queue.lease("check", "w1", 60)
+    assert leased is not None
+    job_id, payload = leased
+    assert payload == {"x": 1}
+    assert not job_queue.complete(job_id, "w2", "other")
+    assert job_queue.complete(job_id, "w1", "done")
+    assert not job_queue.complete(job_id, "w1", "again")
+    assert job_queue.status()["counts"]["check"] == {"done": 1, "pending": 1}
+    assert job_queue.results("check")[0] == ("a", "done", "done")
+
+
+def test_expired_lease(tmp_path: Path):
+    job_queue = JobQueue(tmp_path / "jobs.sqlite")
+    job_queue.enqueue("check", "a", {}, max_attempts=2)
+    first = job_queue.lease("check", "w1", 0.01)
+    assert first is not None
+    time.sleep(0.02)
+    second = job_queue.lease("check", "w2", 0.01)
+    assert second is not None and second[0] == first[0]
+    assert not job_queue.complete(first[0], "w1", "stale")
+    time.sleep(0.02)
+    assert job_queue.lease("check", "w3", 60) is None
+    assert job_queue.status()["counts"]["check"] == {"failed": 1}
+
+
+def test_retries(tmp_path: Path):
+    job_queue = JobQueue(tmp_path / "jobs.sqlite")
+    job_queue.enqueue("check", "a", {}, max_attempts=2)
+    for expected_status in ["pending", "failed"]:
+        leased = job_queue.lease("check", "w1", 60)
+        assert leased is not None
+        assert job_queue.fail(leased[0], "w1", "boom")
+        assert job_queue.results("check")[0][1] == expected_status
+
+
+def test_workers(tmp_path: Path):
+    db_loc = tmp_path / "jobs.sqlite"
+    job_queue = JobQueue(db_loc)
+    job_queue.enqueue_many("check", [(str(i), {"x": i}) for i in range(40)])
+    completed: list[int] = []
+
+    def work(worker: str):
+        worker_queue = JobQueue(db_loc)
+        completed.append(
+            run_worker(worker_queue, "check", lambda p: p["x"] * 2, worker, 60)
+        )
+        worker_queue.close()
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(completed) == 40
+    assert [r for _, _, r in job_queue.results("check")] == [2 * i for i in range(40)]
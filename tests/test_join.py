@@ -0,0 +1,70 @@
+import json
+import dataclasses
+from pathlib import Path
+
+from coqstoq.eval_thms import EvalTheorem, Project, Split, Position, theorem_id_from_json
+from coqstoq.check import Result, EvalResults
+from coqstoq.join import split_index, join_results, merge_results, hash_join
+
+
+def make_thms(num_thms: int) -> list[EvalTheorem]:
+    project = Project("proj", Split("test-repos", "test-theorems"), None, ["-R", ".", "P"])
+    return [
+        EvalTheorem(
+            project,
+            Path(f"theories/F{i % 3}.v"),
+            Position(i, 0),
+            Position(i, 10),
+            Position(i + 1, 0),
+            Position(i + 2, 4),
+            f"hash{i % 3}",
+        )
+        for i in range(num_thms)
+    ]
+
+
+def test_theorem_id():
+    thm = make_thms(1)[0]
+    assert thm.id == theorem_id_from_json(json.loads(json.dumps(thm.to_json())))
+    assert thm.id == EvalTheorem.from_json(thm.to_json()).id
+    # Compile args do not identify the theorem.
+    other_args = dataclasses.replace(
+        thm, project=dataclasses.replace(thm.project, compile_args=[])
+    )
+    assert thm.id == other_args.id
+    assert thm.id != dataclasses.replace(thm, hash="other").id
+    assert thm.id != dataclasses.replace(thm, proof_end_pos=Position(2, 5)).id
+
+
+def test_join_results():
+    thms = make_thms(100)
+    index = split_index(thms)
+    assert len(index) == 100
+    stranger = dataclasses.replace(thms[0], hash="other")
+    results = [Result(thms[i], None, None) for i in range(0, 100, 2)]
+    results += [Result(thms[i], "auto.", 1.0) for i in range(0, 100, 4)]
+    results.append(Result(stranger, "auto.", 1.0))
+    joined = join_results(reversed(results), index, len(thms))
+    assert joined.num_unmatched == 1
+    assert joined.num_duplicates == 25
+    assert joined.num_missing == 50
+    assert joined.num_solved == 25
+    for i, r in enumerate(joined.results):
+        assert (r is None) == (i % 2 == 1)
+        assert r is None or (r.proof is not None) == (i % 4 == 0)
+
+
+def test_merge_results():
+    thms = make_thms(10)
+    shard_a = EvalResults("cpu", [Result(thms[i], "auto.", 1.0) for i in [7, 3]], 2.0)
+    shard_b = EvalResults("cpu", [Result(thms[i], None, None) for i in [8, 0]], 2.0)
+    merged, joined = merge_results([shard_a, shard_b], thms)
+    assert [r.thm for r in merged.results] == [thms[i] for i in [0, 3, 7, 8]]
+    assert merged.hardware == "cpu"
+    assert merged.calibration == 2.0
+    assert joined.num_missing == 6
+
+
+def test_hash_join():
+    pairs = hash_join([1, 2, 3], ["a", "bb", "cc"], lambda n: n, len)
+    assert pairs == [(1, "a"), (2, "bb"), (2, "cc")]
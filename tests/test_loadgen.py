@@ -0,0 +1,38 @@
+from coqstoq.loadgen import split_sentences, mutate, run_load, summarize
+from coqstoq.prescreen import prescreen, RejectReason
+
+
+def test_mutations():
+    proof = "Proof.\n  intros x. (* x. *)\n  - auto.\nQed."
+    assert split_sentences(proof) == ["Proof.", "intros x.", "(* x. *)\n  - auto.", "Qed."]
+    assert mutate(proof, "drop_last") == "Proof.\nintros x."
+    assert mutate(proof, "truncate") == "Proof."
+    assert mutate(proof, "replace_last") == "Proof.\nintros x.\nauto."
+    assert prescreen(mutate(proof, "admit_last")) == RejectReason.ADMITTED
+
+
+def test_run_load():
+    def handle(request):
+        if request["proof"] == "busy":
+            return {"ok": False, "busy": True, "error": "busy"}
+        if request["proof"] == "error":
+            raise ValueError("bad request")
+        return {"ok": True, "valid": True, "queue_time": 0.0, "check_time": 0.01}
+
+    requests = [{"proof": p} for p in ["auto.", "busy", "error", "auto."]]
+    samples, duration = run_load(handle, requests, 8, concurrency=2, rate=100)
+    summary = summarize(samples, duration)
+    assert summary["outcomes"] == {"valid": 4, "invalid": 0, "busy": 2, "error": 2}
+    assert summary["error_rate"] == 0.25
+    assert 0.06 <= duration
+    assert summary["latency"]["p50"] is not None
+
+
+def test_run_load_empty():
+    samples, duration = run_load(lambda _: {"ok": True}, [{"proof": "auto."}], 0, 2, None)
+    assert (samples, duration) == ([], 0.0)
+    assert run_load(lambda _: {"ok": True}, [], 4, 2, None) == ([], 0.0)
+    summary = summarize(samples, duration)
+    assert summary["num_requests"] == 0
+    assert summary["throughput"] == summary["error_rate"] == 0.0
+    assert summary["latency"]["p50"] is None
@@ -0,0 +1,64 @@
+import dataclasses
+from pathlib import Path
+
+from coqstoq import Split, get_theorem_list
+from coqstoq.eval_thms import Position
+from coqstoq.source_index import SourceFile
+from coqstoq.names import NameIndex, statement_name, library_path, file_names
+
+SOURCE = """(* Lemma fake : True. *)
+Module Outer.
+Section Sec.
+#[local] Lemma a : True.
+Proof. auto. Qed.
+End Sec.
+Module Inner := Outer.
+Module Type Sig.
+End Sig.
+Module Import Inner2 (X : Sig).
+Theorem b' : True.
+Proof. auto. Qed.
+End Inner2.
+End Outer.
+(* End *) Corollary c: True.
+Proof. auto. Qed.
+"""
+
+
+def test_statement_name():
+    assert statement_name("Lemma foo : True.") == "foo"
+    assert statement_name("(* x *) Local Theorem foo' (n : nat) : n = n.") == "foo'"
+    assert statement_name("#[global] Program Lemma foo_1 : True.") == "foo_1"
+    assert statement_name("Definition foo := 0.") is None
+
+
+def test_file_names():
+    thm = get_theorem_list(Split.TEST, Path.cwd())[0]
+    project = dataclasses.replace(thm.project, compile_args=["-R", "theories", "Proj"])
+    thms = [
+        dataclasses.replace(
+            thm,
+            project=project,
+            path=Path("theories/sub/File.v"),
+            theorem_start_pos=Position(line, col),
+            theorem_end_pos=Position(line, 100),
+        )
+        for line, col in [(3, 0), (10, 0), (14, 10)]
+    ]
+    names = file_names(SourceFile.from_bytes(SOURCE.encode()), thms)
+    assert names == [
+        "Proj.sub.File.Outer.a",
+        "Proj.sub.File.Outer.Inner2.b'",
+        "Proj.sub.File.c",
+    ]
+    assert library_path(project, Path("other/X.v")) == ["other", "X"]
+
+
+def test_name_index():
+    index = NameIndex(["A.B.foo", None, "A.C.foo", "A.B.bar", "A.B.foo"])
+    assert index.lookup("A.B.foo") == [0, 4]
+    assert index.lookup("A.B") == []
+    assert index.prefix("A.B.") == ["A.B.bar", "A.B.foo"]
+    assert index.query("A.*.foo") == ["A.B.foo", "A.C.foo"]
+    assert index.query("A.?.ba[rz]") == ["A.B.bar"]
+    assert NameIndex.from_json(index.to_json()).names == index.names
@@ -0,0 +1,61 @@
+import os
+from pathlib import Path
+
+from coqstoq import preflight
+from coqstoq.deps import DepGraph
+from coqstoq.eval_thms import EvalTheorem, Project, Split, Position
+from coqstoq.preflight import check_vo, preflight_project
+
+PROJECT = Project("proj", Split("test-repos", "test-theorems"), None, [])
+
+
+def make_thm(path: str) -> EvalTheorem:
+    pos = Position(0, 0)
+    return EvalTheorem(PROJECT, Path(path), pos, pos, pos, pos, "hash")
+
+
+def write_file(path: Path, mtime: float):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("")
+    os.utime(path, (mtime, mtime))
+
+
+def test_preflight_no_theorems():
+    assert preflight.preflight([], 1) == []
+
+
+def test_preflight_missing_tools(monkeypatch):
+    monkeypatch.setattr(preflight.shutil, "which", lambda _: None)
+    issues = preflight.preflight([make_thm("A.v"), make_thm("B.v")], 1)
+    assert [i.project for i in issues] == [PROJECT, PROJECT]
+    assert "`coqc` not found" in issues[0].message
+
+
+def test_preflight_missing_workspace(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    issues = preflight_project(PROJECT, [Path("A.v")], 1)
+    assert [i.message for i in issues] == ["workspace does not exist"]
+
+
+def test_check_vo(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    workspace = PROJECT.workspace
+    write_file(workspace / "A.v", 100)
+    write_file(workspace / "A.vo", 200)
+    write_file(workspace / "B.v", 100)
+    write_file(workspace / "B.vo", 150)  # Built before A.vo
+    write_file(workspace / "C.v", 300)
+    write_file(workspace / "C.vo", 200)  # Built before C.v changed
+    write_file(workspace / "D.v", 100)
+    graph = DepGraph(PROJECT)
+    graph.deps = {Path("A.v"): [], Path("B.v"): [Path("A.v")], Path("C.v"): []}
+
+    assert check_vo(graph, Path("A.v")) is None
+    messages = {
+        p: check_vo(graph, Path(p)).message for p in ["B.v", "C.v", "D.v"]  # type: ignore
+    }
+    assert messages == {
+        "B.v": "built before its dependency A.v",
+        "C.v": "built before its source changed",
+        "D.v": "not built",
+    }
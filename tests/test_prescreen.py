@@ -0,0 +1,49 @@
+from pathlib import Path
+
+from coqstoq import Split, get_theorem_list
+from coqstoq.check import get_ground_truth
+from coqstoq.prescreen import prescreen, RejectReason
+
+
+def test_rejects():
+    cases: list[tuple[str | None, RejectReason]] = [
+        (None, RejectReason.NO_PROOF),
+        ("", RejectReason.EMPTY),
+        ("  (* auto. *)\n", RejectReason.EMPTY),
+        ("Proof. Admitted.", RejectReason.ADMITTED),
+        ("Proof. split; [admit | auto]. Qed.", RejectReason.ADMITTED),
+        ("Proof. give_up. Qed.", RejectReason.ADMITTED),
+        ("Proof. Abort.", RejectReason.ABORTED),
+        ("Axiom cheat : False. destruct cheat.", RejectReason.NEW_AXIOM),
+        ("Proof. auto. Parameter p : False.", RejectReason.NEW_AXIOM),
+        ("Proof. { auto.", RejectReason.UNBALANCED_BRACES),
+        ("Proof. auto. } }", RejectReason.UNBALANCED_BRACES),
+        ("Proof. auto", RejectReason.NO_TERMINATOR),
+        ("Proof. auto. (* done", RejectReason.NO_TERMINATOR),
+    ]
+    for proof, reason in cases:
+        assert prescreen(proof) == reason, proof
+
+
+def test_accepts():
+    proofs = [
+        "Proof. auto. Qed.",
+        "auto.",
+        "Proof.\n  split.\n  - { auto. }\n  - exact (fun x => x).\nQed.",
+        "Proof. (* admit. Admitted. *) auto. Qed.",
+        'Proof. idtac "Abort admit {". auto. Qed.',
+        "Proof. apply admit_lemma. exact Axiom.foo. Qed.",
+        "Proof. move=> {H} x. by case: x => [|n] //=. Qed.",
+        "Proof. exists {| fst := 0; snd := 1 |}. reflexivity. Qed.",
+        "Proof. induction n... Qed.",
+    ]
+    for proof in proofs:
+        assert prescreen(proof) is None, proof
+
+
+def test_ground_truth_accepted():
+    COQSTOQ_LOC = Path.cwd()
+    for split in Split:
+        for thm in get_theorem_list(split, COQSTOQ_LOC):
+            ground_truth = get_ground_truth(thm, COQSTOQ_LOC)
+            assert prescreen(ground_truth) is None, f"{thm.project.dir_name}/{thm.path}"
@@ -0,0 +1,24 @@
+from pathlib import Path
+
+from coqstoq.scratch import absolute_compile_args, scratch_dir
+from coqstoq.predefined_projects import COMPCERT, ZORNSLEMMA
+
+
+def test_absolute_compile_args():
+    compcert_args = absolute_compile_args(COMPCERT.compile_args, COMPCERT.workspace)
+    assert len(compcert_args) == len(COMPCERT.compile_args)
+    for i, (orig, new) in enumerate(zip(COMPCERT.compile_args, compcert_args)):
+        if 0 < i and COMPCERT.compile_args[i - 1] in ["-R", "-Q"]:
+            assert Path(new) == (COMPCERT.workspace / orig).resolve()
+        else:
+            assert orig == new
+
+    zorn_args = absolute_compile_args(ZORNSLEMMA.compile_args, ZORNSLEMMA.workspace)
+    assert zorn_args == ["-R", str(ZORNSLEMMA.workspace.resolve()), "ZornsLemma"]
+
+
+def test_scratch_dir_cleanup(tmp_path: Path):
+    with scratch_dir("test", tmp_path) as d:
+        assert d.is_relative_to(tmp_path)
+        (d / "coqstoq_check_temp.v").write_text("")
+    assert list(tmp_path.iterdir()) == []
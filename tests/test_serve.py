@@ -0,0 +1,110 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from coqstoq.eval_thms import EvalTheorem, Project, Split, Position
+from coqstoq.check import Result
+from coqstoq.serve import CheckServer, CheckSocketServer, CheckClient, ServerError
+
+PROJECT = Project("proj", Split("test-repos", "test-theorems"), None, [])
+
+
+def make_thm(line: int) -> EvalTheorem:
+    return EvalTheorem(
+        PROJECT,
+        Path("A.v"),
+        Position(line, 0),
+        Position(line, 15),
+        Position(line + 1, 0),
+        Position(line + 1, 17),
+        "hash",
+    )
+
+
+class StubServer(CheckServer):
+    """
+    Accepts `auto.` without running Coq. Loading a split waits until
+    `release` is set.
+    """
+
+    def __init__(self):
+        super().__init__(Path.cwd(), 2, 8)
+        self.num_loads = 0
+        self.loading = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def load_split(self, split_name: str) -> list[EvalTheorem]:
+        self.num_loads += 1
+        self.loading.set()
+        if not self.release.wait(timeout=10):
+            raise TimeoutError("Split load was not released.")
+        if split_name == "missing":
+            raise ValueError("No such split.")
+        return [make_thm(2 * i) for i in range(3)]
+
+    def check_proof(self, result: Result) -> bool:
+        return result.proof == "auto."
+
+
+@pytest.fixture
+def served(tmp_path: Path):
+    check_server = StubServer()
+    socket_loc = tmp_path / "coqstoq.sock"
+    with CheckSocketServer(socket_loc, check_server) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        yield check_server, socket_loc
+        server.shutdown()
+        thread.join()
+    check_server.executor.shutdown()
+
+
+def test_round_trip(served):
+    check_server, socket_loc = served
+    with CheckClient(socket_loc) as client:
+        assert client.check(make_thm(10), "auto.")
+        assert not client.check(make_thm(10), "admit.")
+        assert client.check_idx("test", 1, "auto.")
+        assert client.lookup("test", 2) == make_thm(4)
+        with pytest.raises(ServerError):
+            client.lookup("test", 3)
+        stats = client.stats()
+    assert stats["num_checked"] == 3
+    assert stats["loaded_splits"] == ["test"]
+    assert check_server.num_loads == 1
+
+
+def test_split_loads_outside_lock(served):
+    check_server, socket_loc = served
+    lookups: list[EvalTheorem] = []
+
+    def lookup():
+        with CheckClient(socket_loc) as client:
+            lookups.append(client.lookup("test", 0))
+
+    check_server.release.clear()
+    threads = [threading.Thread(target=lookup) for _ in range(4)]
+    for t in threads:
+        t.start()
+    assert check_server.loading.wait(timeout=10)
+    # Other requests are served while the split load is blocked. If the load
+    # held the lock, they would wait for it and it would time out.
+    with CheckClient(socket_loc) as client:
+        assert client.check(make_thm(10), "auto.")
+        assert client.stats()["loaded_splits"] == []
+    check_server.release.set()
+    for t in threads:
+        t.join()
+    assert lookups == [make_thm(0)] * 4
+    assert check_server.num_loads == 1
+
+
+def test_failed_split_load_is_retried(served):
+    check_server, socket_loc = served
+    with CheckClient(socket_loc) as client:
+        for _ in range(2):
+            with pytest.raises(ServerError):
+                client.lookup("missing", 0)
+    assert check_server.num_loads == 2
@@ -0,0 +1,61 @@
+"""
+The line-offset index must give byte-for-byte the same text as splitting
+the file into lines.
+"""
+
+from pathlib import Path
+
+from coqstoq import Split, get_theorem_list
+from coqstoq.eval_thms import EvalTheorem, Position
+from coqstoq.check import get_check_contents, get_ground_truth
+from coqstoq.source_index import SourceFile, load_source
+
+
+def split_check_contents(orig_contents: str, thm: EvalTheorem, proof: str) -> str:
+    orig_lines = orig_contents.split("\n")
+    prefix_lines = orig_lines[: (thm.theorem_end_pos.line + 1)].copy()
+    prefix_lines[-1] = prefix_lines[-1][: thm.theorem_end_pos.column]
+    suffix_lines = orig_lines[thm.proof_end_pos.line :]
+    suffix_lines[0] = suffix_lines[0][thm.proof_end_pos.column :]
+    return "\n".join(prefix_lines + [proof, "Qed."] + suffix_lines)
+
+
+def split_ground_truth(orig_contents: str, thm: EvalTheorem) -> str:
+    orig_lines = orig_contents.split("\n")
+    proof_lines = orig_lines[
+        thm.proof_start_pos.line : thm.proof_end_pos.line + 1
+    ].copy()
+    proof_lines[-1] = proof_lines[-1][: thm.proof_end_pos.column]
+    proof_lines[0] = proof_lines[0][thm.proof_start_pos.column :]
+    return "\n".join(proof_lines)
+
+
+def test_span_clamps_columns():
+    source = SourceFile.from_bytes(b"ab\r\ncd\n\nef")
+    assert source.contents == "ab\ncd\n\nef"
+    assert source.span(Position(0, 1), Position(1, 1)) == "b\nc"
+    assert source.span(Position(0, 10), Position(2, 5)) == "\ncd\n"
+    assert source.after(Position(3, 1)) == "f"
+
+
+def test_load_source_reloads(tmp_path: Path):
+    file_loc = tmp_path / "A.v"
+    file_loc.write_text("Lemma a : True.\n")
+    assert load_source(file_loc).contents == "Lemma a : True.\n"
+    file_loc.write_text("Lemma ab : True.\n")
+    assert load_source(file_loc).contents == "Lemma ab : True.\n"
+
+
+def test_identical_to_split_lines():
+    COQSTOQ_LOC = Path.cwd()
+    proof = "Proof.\n  auto."
+    for split in Split:
+        for thm in get_theorem_list(split, COQSTOQ_LOC):
+            file_loc = COQSTOQ_LOC / thm.project.workspace / thm.path
+            orig_contents = file_loc.read_text()
+            assert get_ground_truth(thm, COQSTOQ_LOC) == split_ground_truth(
+                orig_contents, thm
+            )
+            assert get_check_contents(thm, proof, COQSTOQ_LOC) == split_check_contents(
+                orig_contents, thm, proof
+            )
@@ -0,0 +1,47 @@
+import gzip
+from pathlib import Path
+
+from coqstoq.storage import (
+    load_json,
+    dump_json,
+    iter_data_files,
+    logical_data_loc,
+    resolve_data_loc,
+    stored_compression,
+)
+
+DATA = [{"thm_path": "a/b.json", "thm_idx": i} for i in range(10)]
+
+
+def test_round_trip(tmp_path: Path):
+    loc = tmp_path / "thms.json"
+    for compression in [None, "gz", "xz"]:
+        save_loc = dump_json(DATA, loc, compression)
+        assert resolve_data_loc(loc) == save_loc
+        assert stored_compression(loc) == compression
+        assert load_json(loc) == DATA
+
+
+def test_dump_removes_other_variants(tmp_path: Path):
+    loc = tmp_path / "thms.json"
+    dump_json(DATA, loc, None)
+    dump_json(DATA, loc, "gz")
+    assert [p.name for p in tmp_path.iterdir()] == ["thms.json.gz"]
+    dump_json(DATA[:1], loc, "xz")
+    assert [p.name for p in tmp_path.iterdir()] == ["thms.json.xz"]
+    dump_json(DATA[:2], loc, None)
+    assert [p.name for p in tmp_path.iterdir()] == ["thms.json"]
+    assert load_json(loc) == DATA[:2]
+
+
+def test_iter_data_files_dedupes(tmp_path: Path):
+    (tmp_path / "proj").mkdir()
+    dump_json(DATA, tmp_path / "proj" / "A.json", None)
+    # A stale compressed copy left next to the plain file.
+    (tmp_path / "proj" / "A.json.gz").write_bytes(gzip.compress(b"[]"))
+    dump_json(DATA, tmp_path / "proj" / "B.json", "xz")
+    (tmp_path / "proj" / "notes.txt").write_text("not data")
+    locs = list(iter_data_files(tmp_path))
+    assert [p.name for p in locs] == ["A.json", "B.json.xz"]
+    assert [logical_data_loc(p).name for p in locs] == ["A.json", "B.json"]
+    assert all(load_json(p) == DATA for p in locs)
@@ -0,0 +1,56 @@
+import pickle
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from coqstoq.theorem_table import (
+    pack_theorems,
+    table_from_bytes,
+    create_shared_table,
+    write_table,
+    open_table,
+    set_worker_table,
+    get_worker_table,
+)
+from tests.test_join import make_thms
+
+
+def worker_thm_id(idx: int) -> str:
+    return get_worker_table()[idx].id
+
+
+def test_table_from_bytes():
+    thms = make_thms(50)
+    table = table_from_bytes(pack_theorems(thms))
+    assert len(table) == 50
+    assert list(table) == thms
+    assert table[-1] == thms[-1]
+    assert len(table.paths) == 3
+    with pytest.raises(IndexError):
+        table[50]
+
+
+def test_shared_table():
+    thms = make_thms(50)
+    table = create_shared_table(thms)
+    try:
+        attached = pickle.loads(pickle.dumps(table))
+        assert attached.kind == "shm"
+        assert list(attached) == thms
+        attached.close()
+        with ProcessPoolExecutor(
+            max_workers=2, initializer=set_worker_table, initargs=(table,)
+        ) as executor:
+            ids = list(executor.map(worker_thm_id, range(50)))
+        assert ids == [thm.id for thm in thms]
+    finally:
+        table.close()
+        table.unlink()
+
+
+def test_table_file(tmp_path: Path):
+    thms = make_thms(50)
+    write_table(thms, tmp_path / "table.bin")
+    with open_table(tmp_path / "table.bin") as table:
+        assert list(pickle.loads(pickle.dumps(table))) == thms
@@ -0,0 +1,48 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from coqstoq import Split, get_theorem_list
+from coqstoq.check import Result, EvalResults
+from coqstoq.timing import (
+    get_cpus,
+    run_tool,
+    normalize_results,
+)
+
+
+def test_run_tool():
+    thms = get_theorem_list(Split.TEST, Path.cwd())[:3]
+    all_cpus = get_cpus()
+    cpus = all_cpus[:1]
+    results = run_tool(lambda thm: "auto.", thms, cpus, n_calibration_rounds=1)
+    assert get_cpus() == all_cpus
+    assert [r.thm for r in results.results] == thms
+    assert all(r.time is not None and 0 <= r.time for r in results.results)
+    assert results.calibration is not None and 0 < results.calibration
+    assert f"{len(cpus)} of {os.cpu_count()} CPUs ({cpus})" in results.hardware
+    assert EvalResults.from_json(results.to_json()) == results
+
+
+def test_run_tool_restores_cpus_on_error():
+    thm = get_theorem_list(Split.TEST, Path.cwd())[0]
+    all_cpus = get_cpus()
+
+    def tool(thm) -> str:
+        raise RuntimeError("tool failed")
+
+    with pytest.raises(RuntimeError):
+        run_tool(tool, [thm], all_cpus[:1], n_calibration_rounds=1)
+    assert get_cpus() == all_cpus
+
+
+def test_normalize_results():
+    thm = get_theorem_list(Split.TEST, Path.cwd())[0]
+    results = EvalResults("hw", [Result(thm, "auto.", 2.0), Result(thm, None, None)], 0.5)
+    normalized = normalize_results(results, 1.0)
+    assert [r.time for r in normalized.results] == [4.0, None]
+    assert normalized.calibration == 1.0
+    old_data = results.to_json()
+    del old_data["calibration"]
+    assert EvalResults.from_json(old_data).calibration is None
@@ -0,0 +1,71 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from coqstoq.tracing import (
+    NULL_SPAN,
+    span,
+    enable_tracing,
+    disable_tracing,
+    merge_traces,
+    summarize,
+)
+
+
+def test_disabled():
+    assert disable_tracing() is None
+    assert span("check_result", "check") is NULL_SPAN
+
+
+def test_trace(tmp_path: Path):
+    enable_tracing(tmp_path / "trace-{pid}.json")
+    try:
+        with span("project", "discovery", project="proj"):
+            with span("file", "discovery", path="A.v") as file_span:
+                file_span.set(num_thms=2)
+            with pytest.raises(ValueError):
+                with span("file", "discovery", path="B.v"):
+                    raise ValueError()
+    finally:
+        trace_loc = disable_tracing()
+    assert trace_loc is not None and trace_loc.exists()
+    events = json.loads(trace_loc.read_text())["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    assert [e["args"].get("path") for e in spans] == ["A.v", "B.v", None]
+    assert [e["args"]["outcome"] for e in spans] == ["ok", "ValueError", "ok"]
+    assert spans[0]["args"]["num_thms"] == 2
+    project_span = spans[2]
+    for e in spans[:2]:
+        assert project_span["ts"] <= e["ts"]
+        assert e["ts"] + e["dur"] <= project_span["ts"] + project_span["dur"]
+
+    merge_traces([trace_loc, trace_loc], tmp_path / "merged.json")
+    totals = summarize(tmp_path / "merged.json")
+    assert totals[("discovery", "file")][0] == 4
+    assert totals[("discovery", "project")][0] == 2
+
+
+def test_check_result_cache_miss_span(tmp_path: Path, monkeypatch):
+    from coqstoq import check
+    from coqstoq.verdict_cache import VerdictCache
+    from coqstoq.eval_thms import EvalTheorem, Project, Split, Position
+
+    project = Project("proj", Split("test-repos", "test-theorems"), None, [])
+    pos = Position(0, 0)
+    thm = EvalTheorem(project, Path("A.v"), pos, pos, pos, pos, "hash")
+    num_checks: list[str] = []
+    monkeypatch.setattr(
+        check, "_check_proof", lambda _, proof, __: num_checks.append(proof) or True
+    )
+    cache = VerdictCache(tmp_path / "verdicts.sqlite")
+    enable_tracing(tmp_path / "trace.json")
+    try:
+        result = check.Result(thm, "auto.", None)
+        assert check.check_result(result, tmp_path, cache)
+        assert check.check_result(result, tmp_path, cache)  # Cached
+    finally:
+        trace_loc = disable_tracing()
+    assert trace_loc is not None
+    assert num_checks == ["auto."]
+    assert summarize(trace_loc)[("check", "check_result")][0] == 2
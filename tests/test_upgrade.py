@@ -0,0 +1,50 @@
+import subprocess
+import dataclasses
+from pathlib import Path
+
+from coqstoq import Split, get_theorem_list
+from coqstoq.eval_thms import Position
+from coqstoq.source_index import SourceFile
+from coqstoq.upgrade import diff_commits, match_by_statement
+
+
+def git(args: list[str], repo: Path) -> str:
+    out = subprocess.run(["git", *args], cwd=repo, capture_output=True, check=True)
+    return out.stdout.decode().strip()
+
+
+def test_diff_commits(tmp_path: Path):
+    git(["init", "-q"], tmp_path)
+    git(["config", "user.email", "coqstoq@example.com"], tmp_path)
+    git(["config", "user.name", "coqstoq"], tmp_path)
+    for name in ["A", "B", "C", "D"]:
+        (tmp_path / f"{name}.v").write_text(f"Lemma {name.lower()} : True.\n" * 4)
+    git(["add", "."], tmp_path)
+    git(["commit", "-qm", "old"], tmp_path)
+    old_commit = git(["rev-parse", "HEAD"], tmp_path)
+    (tmp_path / "A.v").write_text("Lemma a' : True.\n")
+    git(["mv", "B.v", "B2.v"], tmp_path)
+    git(["rm", "-q", "C.v"], tmp_path)
+    (tmp_path / "E.v").write_text("Lemma e : True.\n")
+    git(["add", "."], tmp_path)
+    git(["commit", "-qm", "new"], tmp_path)
+
+    diff = diff_commits(tmp_path, old_commit, "HEAD")
+    assert diff.added == [Path("E.v")]
+    assert diff.modified == [Path("A.v")]
+    assert diff.deleted == [Path("C.v")]
+    assert diff.renamed == {Path("B.v"): Path("B2.v")}
+
+
+def test_match_by_statement():
+    thm = get_theorem_list(Split.TEST, Path.cwd())[0]
+    line_thms = [
+        dataclasses.replace(
+            thm, theorem_start_pos=Position(i, 0), theorem_end_pos=Position(i, 5)
+        )
+        for i in range(2)
+    ]
+    old_source = SourceFile.from_bytes(b"foo 1\nfoo 2\n")
+    new_source = SourceFile.from_bytes(b"foo 2\n")
+    matches = match_by_statement(old_source, line_thms, new_source, line_thms[:1])
+    assert matches == [None, line_thms[0]]
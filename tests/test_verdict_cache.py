@@ -0,0 +1,84 @@
+from pathlib import Path
+
+from coqstoq import Split, get_theorem
+from coqstoq import verdict_cache
+from coqstoq.verdict_cache import VerdictCache, verdict_key
+
+COQSTOQ_LOC = Path.cwd()
+
+
+def test_verdict_cache(tmp_path: Path):
+    COQSTOQ_LOC = Path.cwd()
+    thm = get_theorem(Split.TEST, 0, COQSTOQ_LOC)
+    other_thm = get_theorem(Split.TEST, 1, COQSTOQ_LOC)
+    cache = VerdictCache(tmp_path / "verdicts.sqlite")
+    assert cache.get(thm, "auto.") is None
+    cache.put(thm, "auto.", True)
+    assert cache.get(thm, "  auto.  \r\nQed.") is True
+    assert cache.get(thm, "eauto.") is None
+    assert cache.get(other_thm, "auto.") is None
+    assert (cache.hits, cache.misses) == (1, 3)
+    cache.close()
+
+    reopened_cache = VerdictCache(tmp_path / "verdicts.sqlite")
+    assert reopened_cache.get(thm, "auto.") is True
+    bypassed_cache = VerdictCache(tmp_path / "verdicts.sqlite", enabled=False)
+    assert bypassed_cache.get(thm, "auto.") is None
+
+
+def test_verdict_cache_eviction(tmp_path: Path):
+    thm = get_theorem(Split.TEST, 0, Path.cwd())
+    cache = VerdictCache(tmp_path / "verdicts.sqlite", max_entries=10)
+    for i in range(11):
+        cache.put(thm, f"auto {i}.", False)
+    assert len(cache) <= 10
+    assert cache.get(thm, "auto 10.") is False
+    assert cache.get(thm, "auto 0.") is None
+
+
+def test_put_keeps_running_count(tmp_path: Path):
+    thm = get_theorem(Split.TEST, 0, Path.cwd())
+    cache = VerdictCache(tmp_path / "verdicts.sqlite", max_entries=100)
+    statements: list[str] = []
+    cache.conn.set_trace_callback(statements.append)
+    for i in range(20):
+        cache.put(thm, f"auto {i % 10}.", i < 10)
+    assert not any("COUNT" in s for s in statements)
+    assert cache.num_entries == len(cache) == 10
+    assert cache.get(thm, "auto 0.") is False
+
+
+def test_no_cache_env_var(tmp_path: Path, monkeypatch):
+    for value, enabled in [("0", True), ("false", True), ("1", False), ("yes", False)]:
+        monkeypatch.setenv(verdict_cache.NO_CACHE_ENV_VAR, value)
+        assert VerdictCache(tmp_path / "verdicts.sqlite").enabled == enabled
+
+
+def test_user_contrib_state(tmp_path: Path, monkeypatch):
+    vo_loc = tmp_path / "user-contrib" / "Lib" / "A.vo"
+    vo_loc.parent.mkdir(parents=True)
+    vo_loc.write_bytes(b"old")
+    monkeypatch.setattr(verdict_cache, "coqc_where", lambda: str(tmp_path))
+    verdict_cache.user_contrib_state.cache_clear()
+    old_state = verdict_cache.user_contrib_state()
+    vo_loc.write_bytes(b"newer")
+    verdict_cache.user_contrib_state.cache_clear()
+    assert verdict_cache.user_contrib_state() != old_state
+    verdict_cache.user_contrib_state.cache_clear()
+
+
+def test_key_covers_dependency_vo_files(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    thm = get_theorem(Split.TEST, 0, COQSTOQ_LOC)
+    dep_vo_loc = thm.project.workspace / "Dep.vo"
+    dep_vo_loc.parent.mkdir(parents=True)
+    dep_vo_loc.write_bytes(b"old")
+    monkeypatch.setitem(
+        verdict_cache._closures,
+        (thm.project.split.dir_name, thm.project.dir_name, thm.path),
+        [Path("Dep.v")],
+    )
+    old_key = verdict_key(thm, "auto.")
+    assert verdict_key(thm, "auto.") == old_key
+    dep_vo_loc.write_bytes(b"rebuilt")
+    assert verdict_key(thm, "auto.") != old_key